@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+benchmailbox
+
+Microbenchmark of the frame handoff between one producer and 1..N consumers
+
+Compares the FrameMailbox used by BucketCapture/BucketProcessor against the
+original Condition + Lock handoff. The producer posts a timestamp as the
+"frame" at a fixed rate (or as fast as possible with --rate 0) and each
+consumer records how long after the post it received the frame, how many
+frames it received per second and how many it missed.
+
+Usage:
+    python benchmailbox.py [--consumers N] [--rate FPS] [--seconds S] [--work MS]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+import time
+
+from threading import Condition
+from threading import Lock
+from threading import Thread
+
+from framemailbox import FrameMailbox
+
+class LegacyHandoff:
+    # The Condition + Lock handoff originally used by BucketCapture.read()
+    def __init__(self):
+        self._lock = Lock()
+        self._condition = Condition()
+        self.frame = None
+        self.count = 0
+
+    def put(self, frame):
+        self._condition.acquire()
+        self._lock.acquire()
+        self.count = self.count + 1
+        self.frame = frame
+        self._lock.release()
+        self._condition.notifyAll()
+        self._condition.release()
+        return self.count
+
+    def read(self, afterSeq=0, timeout=None):
+        # The legacy read ignores afterSeq; it always waits for the next notify
+        self._condition.acquire()
+        self._condition.wait(timeout)
+        self._condition.release()
+        self._lock.acquire()
+        frame = self.frame
+        count = self.count
+        self._lock.release()
+        return (frame, count, count > afterSeq)
+
+    def wake(self):
+        self._condition.acquire()
+        self._condition.notifyAll()
+        self._condition.release()
+
+class Consumer:
+    def __init__(self, box, work):
+        self.box = box
+        self.work = work
+        self.latencies = []
+        self.received = 0
+        self.missed = 0
+        self._stop = False
+
+    def run(self):
+        lastSeq = 0
+        while (self._stop == False):
+            (stamp, seq, isNew) = self.box.read(lastSeq)
+            now = time.time()
+            if ((isNew == False) or (stamp is None)):
+                continue
+            if (lastSeq != 0):
+                self.missed += seq - lastSeq - 1
+            lastSeq = seq
+            self.received += 1
+            self.latencies.append(now - stamp)
+            if (self.work > 0.0):
+                time.sleep(self.work)
+
+def percentile(values, p):
+    if (values == []):
+        return float('NaN')
+    ordered = sorted(values)
+    index = int(round((p / 100.0) * (len(ordered) - 1)))
+    return ordered[index]
+
+def run(boxClass, numConsumers, rate, seconds, work):
+    box = boxClass()
+    consumers = [Consumer(box, work) for i in range(numConsumers)]
+    threads = [Thread(target=c.run, args=()) for c in consumers]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    # Let the consumers reach their first wait
+    time.sleep(0.1)
+
+    period = (1.0 / rate) if (rate > 0) else 0.0
+    posted = 0
+    start = time.time()
+    nextTime = start
+    while (time.time() - start < seconds):
+        box.put(time.time())
+        posted += 1
+        if (period > 0.0):
+            nextTime += period
+            delay = nextTime - time.time()
+            if (delay > 0.0):
+                time.sleep(delay)
+    elapsed = time.time() - start
+
+    for c in consumers:
+        c._stop = True
+    box.wake()
+    for t in threads:
+        t.join(1.0)
+
+    latencies = []
+    received = 0
+    missed = 0
+    for c in consumers:
+        latencies.extend(c.latencies)
+        received += c.received
+        missed += c.missed
+
+    return (posted / elapsed,
+            received / elapsed / numConsumers,
+            missed,
+            1000.0 * percentile(latencies, 50),
+            1000.0 * percentile(latencies, 95),
+            1000.0 * percentile(latencies, 99))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Frame handoff microbenchmark')
+    parser.add_argument('--consumers', type=int, default=4, help='maximum number of consumers')
+    parser.add_argument('--rate', type=float, default=30.0, help='producer rate in fps (0 = as fast as possible)')
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of each run')
+    parser.add_argument('--work', type=float, default=0.0, help='per-frame consumer work in ms')
+    args = parser.parse_args()
+
+    print("{:>8} {:>3} {:>9} {:>9} {:>7} {:>8} {:>8} {:>8}".format(
+          "handoff", "N", "post fps", "recv fps", "missed", "p50 ms", "p95 ms", "p99 ms"))
+    for n in range(1, args.consumers + 1):
+        for (label, boxClass) in (("legacy", LegacyHandoff), ("mailbox", FrameMailbox)):
+            result = run(boxClass, n, args.rate, args.seconds, args.work / 1000.0)
+            print("{:>8} {:>3} {:>9.1f} {:>9.1f} {:>7} {:>8.3f} {:>8.3f} {:>8.3f}".format(label, n, *result))
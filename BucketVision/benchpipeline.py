@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+benchpipeline
+
+Measure the throughput of the vision pipelines on a dev box with no camera
+
+Frames come from a replay FrameSource (a directory or glob of stills, or a
+video file) that is decoded into memory once, so the numbers reflect the
+pipeline and not JPEG decoding. Each pipeline is run on the same frames
+with PACE_FAST pacing and the per-frame processing time is reported.
+GearLift and BoilerStack track a target they find with a search window
+(see roitracker.py) unless --fullFrame is given.
+
+Usage:
+    python benchpipeline.py [--source 'redBoiler*ft*.jpg'] [--frames N] [--pipelines gearLift boilerStack] [--fullFrame]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+import time
+
+import cv2
+
+from framesource import openSource
+from framesource import PACE_FAST
+
+from boilerstack import BoilerStack
+from gearlift import GearLift
+from nada import Nada
+from redboiler import RedBoiler
+from smokestack import SmokeStack
+
+class NullTable:
+    # Stands in for the NetworkTables table the pipelines publish to
+    def __init__(self):
+        self.values = {}
+
+    def putNumber(self, key, value):
+        self.values[key] = value
+
+    def putString(self, key, value):
+        self.values[key] = value
+
+PIPELINES = {'gearLift' : lambda table, tracking: GearLift(table, tracking),
+             'boilerStack' : lambda table, tracking: BoilerStack(table, tracking),
+             'redBoiler' : lambda table, tracking: RedBoiler(),
+             'smokeStack' : lambda table, tracking: SmokeStack(),
+             'nada' : lambda table, tracking: Nada()}
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = int(round((p / 100.0) * (len(ordered) - 1)))
+    return ordered[index]
+
+def bench(name, source, frames, tracking):
+    table = NullTable()
+    pipeline = PIPELINES[name](table, tracking)
+    source.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    durations = []
+    for i in range(frames):
+        (grabbed, frame) = source.read()
+        if (grabbed == False):
+            break
+        start = time.time()
+        pipeline.process(frame)
+        durations.append(time.time() - start)
+
+    total = sum(durations)
+    return (len(durations),
+            len(durations) / total if total > 0.0 else float('NaN'),
+            1000.0 * total / len(durations),
+            1000.0 * percentile(durations, 95),
+            1000.0 * max(durations))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vision pipeline throughput')
+    parser.add_argument('--source', default='redBoiler*ft*.jpg', help='directory, glob of stills or video file')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--frames', type=int, default=300, help='frames per pipeline (the source loops)')
+    parser.add_argument('--pipelines', nargs='+', default=['gearLift', 'boilerStack'], choices=sorted(PIPELINES.keys()))
+    parser.add_argument('--fullFrame', action='store_true', help='search every frame whole (no target tracking window)')
+    args = parser.parse_args()
+
+    source = openSource(args.source)
+    source.pacing = PACE_FAST
+    source.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+    source.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+    print("Source " + args.source + ": " + str(int(source.get(cv2.CAP_PROP_FRAME_COUNT))) + " frames")
+
+    print("{:>12} {:>7} {:>9} {:>9} {:>9} {:>9}".format("pipeline", "frames", "fps", "mean ms", "p95 ms", "max ms"))
+    for name in args.pipelines:
+        result = bench(name, source, args.frames, args.fullFrame == False)
+        print("{:>12} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(name, *result))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+benchpyramid
+
+Accuracy against speed of the coarse to fine (pyramid) mode of the
+pipelines, frame by frame over the distance series of stills
+
+Each pipeline is built twice, plain and with pyramid=True (see pyramid.py),
+and both run every frame (resized to the camera resolution) --repeat
+times. Per frame the report shows the time of each, how many of the
+contours the plain pipeline kept the pyramid reproduced exactly (same
+bounding box), how many it lost altogether (no overlapping contour) and
+how much of the frame the pyramid thresholded at full resolution.
+GearLift and BoilerStack run without their tracking window so that only
+the pyramid differs.
+
+Usage:
+    python benchpyramid.py [--source 'redBoiler*ft*.jpg'] [--pipelines redBoiler] [--repeat 50]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+import time
+
+import cv2
+
+from benchpipeline import NullTable
+from blueboiler import BlueBoiler
+from boilerstack import BoilerStack
+from framesource import openSource
+from framesource import PACE_FAST
+from gearlift import GearLift
+from redboiler import RedBoiler
+
+PIPELINES = {'gearLift' : lambda pyramid: GearLift(NullTable(), False, pyramid),
+             'boilerStack' : lambda pyramid: BoilerStack(NullTable(), False, pyramid),
+             'redBoiler' : lambda pyramid: RedBoiler(pyramid),
+             'blueBoiler' : lambda pyramid: BlueBoiler(pyramid)}
+
+def timePerFrame(pipeline, frame, repeat):
+    start = time.time()
+    for i in range(repeat):
+        pipeline.process(frame)
+    return 1000.0 * (time.time() - start) / repeat
+
+def overlaps(a, b):
+    return ((a[0] < b[0] + b[2]) and (b[0] < a[0] + a[2]) and
+            (a[1] < b[1] + b[3]) and (b[1] < a[1] + a[3]))
+
+def compare(expected, found):
+    # Contours kept by the plain pipeline that the pyramid kept with the
+    # same bounding box, and that it has nothing at all for
+    expected = [cv2.boundingRect(c) for c in expected]
+    found = [cv2.boundingRect(c) for c in found]
+    same = len([r for r in expected if r in found])
+    lost = len([r for r in expected if not any([overlaps(r, f) for f in found])])
+    return (same, lost)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pyramid mode accuracy and speed')
+    parser.add_argument('--source', default='redBoiler*ft*.jpg', help='directory, glob of stills or video file')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--pipelines', nargs='+', default=['redBoiler'], choices=sorted(PIPELINES.keys()))
+    parser.add_argument('--repeat', type=int, default=50, help='runs of each frame')
+    args = parser.parse_args()
+
+    source = openSource(args.source)
+    source.pacing = PACE_FAST
+    source.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+    source.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+    frames = []
+    for i in range(int(source.get(cv2.CAP_PROP_FRAME_COUNT))):
+        (grabbed, frame) = source.read()
+        if (grabbed == False):
+            break
+        frames.append(frame.copy())
+    names = getattr(source, 'paths', ["frame " + str(i) for i in range(len(frames))])
+    print("Source " + args.source + ": " + str(len(frames)) + " frames")
+
+    for name in args.pipelines:
+        plain = PIPELINES[name](False)
+        pyramid = PIPELINES[name](True)
+        print("")
+        print("{:>24} {:>9} {:>9} {:>7} {:>6} {:>6} {:>9}".format(name, "plain ms", "pyr ms", "kept", "same", "lost", "refined %"))
+        totals = [0.0, 0.0, 0, 0, 0]
+        for (frameName, frame) in zip(names, frames):
+            plainMs = timePerFrame(plain, frame, args.repeat)
+            pyramidMs = timePerFrame(pyramid, frame, args.repeat)
+            (same, lost) = compare(plain.filter_contours_output, pyramid.filter_contours_output)
+            kept = len(plain.filter_contours_output)
+            refined = sum([(x1 - x0) * (y1 - y0) for (x0, y0, x1, y1) in pyramid.pyramid.regions])
+            print("{:>24} {:>9.3f} {:>9.3f} {:>7} {:>6} {:>6} {:>9.1f}".format(frameName, plainMs, pyramidMs, kept, same, lost,
+                                                                          100.0 * refined / (frame.shape[0] * frame.shape[1])))
+            totals = [totals[0] + plainMs, totals[1] + pyramidMs, totals[2] + kept, totals[3] + same, totals[4] + lost]
+        print("{:>24} {:>9.3f} {:>9.3f} {:>7} {:>6} {:>6}".format("mean / total", totals[0] / len(frames), totals[1] / len(frames),
+                                                                totals[2], totals[3], totals[4]))
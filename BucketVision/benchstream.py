@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+benchstream
+
+Load test for the camera stream server: many concurrent MJPEG viewers
+against a replay source, no camera or robot needed
+
+Frames from a replay FrameSource (stills or a video, played at camera rate)
+go through BucketCapture and one MjpegBroadcaster to a StreamServer running
+in a BucketServer, exactly as bucketvision.py wires them. Then --clients
+viewers connect and read the stream, --slow of them deliberately reading
+far slower than the frame rate (a struggling driver station laptop), while
+/metrics is scraped every second. The report shows what each viewer got and
+how long the scrapes took; the fast viewers should see the full frame rate
+no matter how the slow ones are doing, and there is one encode per frame.
+
+With --kbps the stream runs under a RateController with that target and
+the settings it settled on are reported with the achieved bitrate.
+
+Usage:
+    python benchstream.py [--source 'redBoiler*ft*.jpg'] [--clients 12] [--slow 2] [--seconds 10] [--kbps 3000]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+import socket
+import time
+
+from threading import Thread
+
+from bucketcapture import BucketCapture
+from bucketserver import BucketServer
+from framesource import openSource
+from metrics import registry
+from mjpegbroadcaster import MjpegBroadcaster
+from ratecontrol import RateController
+from streamserver import StreamServer
+
+class Viewer:
+    """
+    Reads an MJPEG stream the way a browser would, counting whole frames
+    """
+    def __init__(self, name, address, path, delay=0.0):
+        self.name = name
+        self.address = address
+        self.path = path
+        self.delay = delay      # seconds to sleep after each frame
+        self.frames = 0
+        self.bytes = 0
+        self.maxGap = 0.0
+        self.error = None
+        self._stop = False
+
+    def start(self):
+        t = Thread(target=self.update, args=(), name=self.name)
+        t.daemon = True
+        t.start()
+        self.thread = t
+        return self
+
+    def update(self):
+        try:
+            sock = socket.create_connection(self.address)
+            sock.sendall(('GET ' + self.path + ' HTTP/1.0\r\n\r\n').encode('ascii'))
+            self._buffer = b''
+            self._sock = sock
+            self._readHeaders()
+            last = time.time()
+            while (self._stop == False):
+                headers = self._readHeaders()
+                length = int(headers[b'content-length'])
+                self._readBytes(length + 2)     # JPEG and its trailing CRLF
+                now = time.time()
+                self.maxGap = max(self.maxGap, now - last)
+                last = now
+                self.frames += 1
+                self.bytes += length
+                if (self.delay > 0.0):
+                    time.sleep(self.delay)
+            sock.close()
+        except Exception as e:
+            self.error = str(e)
+
+    def _readHeaders(self):
+        while (b'\r\n\r\n' not in self._buffer):
+            self._fill()
+        (head, self._buffer) = self._buffer.split(b'\r\n\r\n', 1)
+        headers = {}
+        for line in head.split(b'\r\n')[1:]:
+            if (b':' in line):
+                (key, value) = line.split(b':', 1)
+                headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def _readBytes(self, count):
+        while (len(self._buffer) < count):
+            self._fill()
+        self._buffer = self._buffer[count:]
+
+    def _fill(self):
+        # Small reads for slow viewers so the server sees a slow drain
+        data = self._sock.recv(4096 if self.delay > 0.0 else 65536)
+        if (data == b''):
+            raise IOError("stream closed")
+        self._buffer += data
+
+    def stop(self):
+        self._stop = True
+
+def fetch(address, path):
+    start = time.time()
+    sock = socket.create_connection(address)
+    sock.sendall(('GET ' + path + ' HTTP/1.0\r\n\r\n').encode('ascii'))
+    data = b''
+    while True:
+        chunk = sock.recv(65536)
+        if (chunk == b''):
+            break
+        data += chunk
+    sock.close()
+    return (time.time() - start, data)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent MJPEG stream load test')
+    parser.add_argument('--source', default='redBoiler*ft*.jpg', help='directory, glob of stills or video file')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--fps', type=float, default=30.0, help='replay rate')
+    parser.add_argument('--clients', type=int, default=12)
+    parser.add_argument('--slow', type=int, default=2, help='how many of the clients read slowly')
+    parser.add_argument('--slowDelay', type=float, default=0.25, help='seconds a slow client waits per frame')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--kbps', type=float, default=0.0, help='bitrate target for all viewers (0 for no rate control)')
+    args = parser.parse_args()
+
+    source = openSource(args.source)
+    source.fps = args.fps
+    cam = BucketCapture(name="Replay", src=source, width=args.width, height=args.height, exposure=0).start()
+
+    rateControl = None
+    if (args.kbps > 0.0):
+        rateControl = RateController("ReplayStream", args.kbps)
+    stream = MjpegBroadcaster("ReplayStream", lambda: ('Replay', cam.read), rateControl=rateControl).start()
+
+    server = StreamServer(('127.0.0.1', args.port))
+    server.addStream('.mjpg', stream)
+    server.addPage('/metrics', 'text/plain; version=0.0.4', registry.toPrometheus)
+    address = server.server_address
+    bucketServer = BucketServer("BenchServer", server).start()
+    while (bucketServer.isStopped() == True):
+        time.sleep(0.001)
+
+    viewers = []
+    for i in range(args.clients):
+        delay = args.slowDelay if (i < args.slow) else 0.0
+        viewers.append(Viewer("viewer" + str(i), address, '/cam.mjpg', delay).start())
+
+    # Scrape while the viewers are connected
+    scrapes = []
+    end = time.time() + args.seconds
+    while (time.time() < end):
+        time.sleep(1.0)
+        (elapsed, page) = fetch(address, '/metrics')
+        scrapes.append(elapsed)
+
+    for v in viewers:
+        v.stop()
+    encoded = stream.fps.count()
+
+    print("{:>10} {:>6} {:>8} {:>9} {:>10} {}".format("viewer", "slow", "frames", "fps", "max gap s", "error"))
+    for v in viewers:
+        print("{:>10} {:>6} {:>8} {:>9.1f} {:>10.3f} {}".format(v.name, str(v.delay > 0.0), v.frames,
+                                                              v.frames / args.seconds, v.maxGap,
+                                                              v.error if v.error is not None else ""))
+
+    fast = [v.frames / args.seconds for v in viewers if v.delay == 0.0]
+    if (len(fast) > 0):
+        print("fast viewers: min {:.1f} fps, max {:.1f} fps".format(min(fast), max(fast)))
+    print("frames captured {}, encoded {} (one encode per frame for all {} viewers)".format(cam.fps.count(), encoded, args.clients))
+    if (rateControl is not None):
+        print("rate control: target {:.0f} kbit/s, achieved {:.0f} kbit/s at quality {}, scale {}, {} fps".format(
+              rateControl.targetKbps, rateControl.kbps, rateControl.quality(), rateControl.scale(), rateControl.fps()))
+    scrapes.sort()
+    print("/metrics scrapes: {} median {:.1f} ms, max {:.1f} ms".format(len(scrapes), 1000.0 * scrapes[len(scrapes) // 2], 1000.0 * scrapes[-1]))
+
+    stream.stop()
+    bucketServer.stop()
+    cam.stop()
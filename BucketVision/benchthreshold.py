@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+benchthreshold
+
+Compare the GRIP threshold steps (cvtColor then inRange) with the lookup
+table thresholds of threshold.py on the checked-in images
+
+Each threshold of our pipelines is run both ways on every image (resized to
+the camera resolution) and the report shows the time per frame, how many
+pixels of the mask came out differently and, for the HLS lookup tables at
+each --bits, the table size and the time to build it. 'buffered' is the
+GRIP steps into reused buffers, what HslThreshold does without the table.
+
+Usage:
+    python benchthreshold.py [--source '*Boiler*.jpg'] [--bits 8 6] [--repeat 50]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from framesource import openSource
+from framesource import PACE_FAST
+
+import threshold
+from threshold import HslThreshold
+from threshold import RgbThreshold
+
+# Bounds of our pipelines' threshold steps
+HSL = {'gearLift' : ([51.798561151079134, 93.99317406143345], [71.08812949640287, 255.0], [36.690647482014384, 255.0]),
+       'redBoiler' : ([168.34532374100723, 180.0], [82.55395683453237, 255.0], [73.38129496402877, 174.4965870307167])}
+RGB = {'smokeStack' : ([0.0, 39.59897610921503], [96.31294964028777, 255.0], [89.4334532374101, 170.14505119453926]),
+       'blueBoiler' : ([0.0, 39.59897610921503], [82.55395683453237, 223.39410813723725], [162.81474820143887, 255.0])}
+
+def gripHsl(input, hue, sat, lum):
+    out = cv2.cvtColor(input, cv2.COLOR_BGR2HLS)
+    return cv2.inRange(out, (hue[0], lum[0], sat[0]),  (hue[1], lum[1], sat[1]))
+
+def gripRgb(input, red, green, blue):
+    out = cv2.cvtColor(input, cv2.COLOR_BGR2RGB)
+    return cv2.inRange(out, (red[0], green[0], blue[0]),  (red[1], green[1], blue[1]))
+
+def timePerFrame(function, frames, bounds, repeat):
+    start = time.time()
+    for i in range(repeat):
+        for frame in frames:
+            function(frame, *bounds)
+    return 1000.0 * (time.time() - start) / (repeat * len(frames))
+
+def mismatch(function, reference, frames, bounds):
+    # Fraction of all pixels, and of the reference mask's pixels, that differ
+    different = 0
+    total = 0
+    selected = 0
+    for frame in frames:
+        expected = reference(frame, *bounds)
+        different += np.count_nonzero(function(frame, *bounds) != expected)
+        total += expected.size
+        selected += np.count_nonzero(expected)
+    return (float(different) / total, float(different) / max(selected, 1))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Threshold step timing, GRIP vs lookup table')
+    parser.add_argument('--source', default='*Boiler*.jpg', help='directory, glob of stills or video file')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--bits', type=int, nargs='+', default=[8, 6], help='bits per channel of the HLS tables')
+    parser.add_argument('--repeat', type=int, default=50, help='passes over the images')
+    args = parser.parse_args()
+
+    source = openSource(args.source)
+    source.pacing = PACE_FAST
+    source.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+    source.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+    frames = []
+    for i in range(int(source.get(cv2.CAP_PROP_FRAME_COUNT))):
+        (grabbed, frame) = source.read()
+        if (grabbed == False):
+            break
+        frames.append(frame.copy())
+    print("Source " + args.source + ": " + str(len(frames)) + " frames")
+
+    print("{:>12} {:>10} {:>9} {:>10} {:>10} {:>9} {:>9}".format("threshold", "method", "ms/frame", "differ %", "of mask %", "table KB", "build ms"))
+    for name in sorted(HSL.keys()):
+        bounds = HSL[name]
+        print("{:>12} {:>10} {:>9.3f}".format(name, "grip", timePerFrame(gripHsl, frames, bounds, args.repeat)))
+        buffered = HslThreshold(lut=False, *bounds)
+        print("{:>12} {:>10} {:>9.3f}".format(name, "buffered", timePerFrame(buffered.apply, frames, bounds, args.repeat)))
+        for bits in args.bits:
+            start = time.time()
+            lut = HslThreshold(bits=bits, lut=True, *bounds)
+            build = 1000.0 * (time.time() - start)
+            (differ, ofMask) = mismatch(lut.apply, gripHsl, frames, bounds)
+            print("{:>12} {:>10} {:>9.3f} {:>10.3f} {:>10.3f} {:>9.0f} {:>9.1f}".format(
+                  name, "lut" + str(bits), timePerFrame(lut.apply, frames, bounds, args.repeat),
+                  100.0 * differ, 100.0 * ofMask, lut.table.nbytes / 1024.0, build))
+    for name in sorted(RGB.keys()):
+        bounds = RGB[name]
+        direct = RgbThreshold()
+        (differ, ofMask) = mismatch(direct.apply, gripRgb, frames, bounds)
+        print("{:>12} {:>10} {:>9.3f}".format(name, "grip", timePerFrame(gripRgb, frames, bounds, args.repeat)))
+        print("{:>12} {:>10} {:>9.3f} {:>10.3f} {:>10.3f}".format(name, "direct", timePerFrame(direct.apply, frames, bounds, args.repeat),
+                                                                  100.0 * differ, 100.0 * ofMask))
@@ -2,6 +2,8 @@ import cv2
 import numpy as np
 import math
 
+from overlay import Overlay
+
 class Boiler:
     """
     An OpenCV pipeline generated by GRIP.
@@ -11,6 +13,7 @@ class Boiler:
         """initializes all values to presets or None if need to be set
         """
         self.MIN_MATCH_COUNT = 10
+        self.overlay = None
 
         # load the image, convert it to grayscale, and detect edges
         self.trainingImage = cv2.imread("redBoilerTrainWhole.jpg",cv2.IMREAD_GRAYSCALE)
@@ -33,6 +36,7 @@ class Boiler:
         Runs the pipeline and sets all outputs to new values.
         """
         
+        overlay = Overlay(source0.shape)
         img2 = cv2.cvtColor(source0, cv2.COLOR_BGR2GRAY)
         kp2, des2 = self.detector.detectAndCompute(img2,None)
 
@@ -74,7 +78,7 @@ class Boiler:
                     r = int(math.cos(angle)*255)
                     g = int(math.sin(angle)*255)
                     
-                    cv2.polylines(source0,[np.int32(dst)],True,(0,g,r),2, cv2.LINE_AA)
+                    overlay.polylines(dst,True,(0,g,r),2, cv2.LINE_AA)
                 
                 # The above polygon should be a quadralateral and should
                 # represent the extent of the boiler (even beyond the image)
@@ -97,4 +101,6 @@ class Boiler:
                 
 #        else:
 #            ## Draw first 10 matches.
-#            img3 = cv2.drawMatches(self.trainingImage,self.kp1,img2,kp2,matches[:10], None, flags=2)        
\ No newline at end of file
+#            img3 = cv2.drawMatches(self.trainingImage,self.kp1,img2,kp2,matches[:10], None, flags=2)        
+
+        self.overlay = overlay
@@ -1,17 +1,35 @@
 import cv2
 import numpy as np
 from targetdata import TargetData
+from frametrace import captureTime
+from frametrace import mark
+from frametrace import now
+from camerageometry import CameraGeometry
+from contourfilter import filterContours
+from targetpairs import boilerPairs
+from overlay import Overlay
+from pyramid import CoarseToFine
+from roitracker import RoiTracker
+from targettracker import TargetTracker
+from threshold import HslThreshold
 
 class BoilerStack:
     """
     An OpenCV pipeline generated by GRIP.
     """
     
-    def __init__(self, networkTable):
+    def __init__(self, networkTable, tracking=True, pyramid=False, geometry=None):
         """initializes all values to presets or None if need to be set
         """
         self.targetData = TargetData()
         self.networkTable = networkTable
+
+        # Field of view of the camera; the resolution is taken from each
+        # frame and the pixel constants below (tuned at 320x240) are scaled
+        # to it (see camerageometry.py)
+        if (geometry is None):
+            geometry = CameraGeometry()
+        self.geometry = geometry
         
         self.__resize_image_width = 320.0
         self.__resize_image_height = 240.0
@@ -25,6 +43,9 @@ class BoilerStack:
         self.__hsl_threshold_luminance = [36.690647482014384, 255.0]
 
         self.hsl_threshold_output = None
+        # Same threshold as __hsl_threshold(), through a precomputed lookup
+        # table where that is faster (see threshold.py)
+        self.__hsl_threshold_lut = HslThreshold(self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
 
         self.__find_contours_input = self.hsl_threshold_output
         self.__find_contours_external_only = True
@@ -45,36 +66,80 @@ class BoilerStack:
         self.__filter_contours_max_ratio = 1000.0
 
         self.filter_contours_output = None
+        self.filter_contours_stats = None
+
+        self.targetPairs = None
         
         self.lastCenterX = float('NaN')
         self.lastCenterY = float('NaN')
         self.lastDistance_inches = float('NaN')
         self.lastCenter_deg = float('NaN')
 
+        # Search window around the target once it is found, back to the
+        # whole frame after a few misses (see roitracker.py)
+        self.tracker = None
+        if (tracking == True):
+            self.tracker = RoiTracker()
+
+        # Angle and distance of the target filtered over time and published
+        # predicted to the time of publishing (see targettracker.py)
+        self.targetTracker = TargetTracker()
+
+        # Threshold only around the blobs found on a half size frame
+        # (see pyramid.py)
+        self.pyramid = None
+        if (pyramid == True):
+            self.pyramid = CoarseToFine()
+
+        self.overlay = None
+
 
     def process(self, source0):
         """
         Runs the pipeline and sets all outputs to new values.
         """
+        # What to draw for this frame; published when processing is done
+        overlay = Overlay(source0.shape)
+        geometry = self.geometry.fit(source0.shape)
+
+        # While tracking, threshold and contour only the window around
+        # where the target should be; the contours come back in frame
+        # coordinates so nothing after them changes
+        window = None
+        if (self.tracker is not None):
+            window = self.tracker.window(source0.shape)
+        source = source0
+        offset = (0, 0)
+        if (window is not None):
+            (left, top, right, bottom) = window
+            source = source0[top:bottom, left:right]
+            offset = (left, top)
+
+            # Show the search window in cyan
+            overlay.rectangle((left, top), (right - 1, bottom - 1), (255,255,0), 1)
 
         # Step HSL_Threshold0:
-        self.__hsl_threshold_input = source0
-        (self.hsl_threshold_output) = self.__hsl_threshold(self.__hsl_threshold_input, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
+        self.__hsl_threshold_input = source
+        if (self.pyramid is None):
+            (self.hsl_threshold_output) = self.__hsl_threshold_lut.apply(self.__hsl_threshold_input, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
+        else:
+            (self.hsl_threshold_output) = self.pyramid.mask(self.__hsl_threshold_input, lambda image: self.__hsl_threshold_lut.apply(image, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance))
+        mark('hsl_threshold')
 
         # Step Find_Contours0:
         self.__find_contours_input = self.hsl_threshold_output
-        (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
+        (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only, offset)
+        mark('find_contours')
 
         # Step Filter_Contours0:
         self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+        (self.filter_contours_output, self.filter_contours_stats) = filterContours(self.__filter_contours_contours, geometry.fromReferenceArea(self.__filter_contours_min_area), geometry.fromReference(self.__filter_contours_min_perimeter), geometry.fromReference(self.__filter_contours_min_width), geometry.fromReference(self.__filter_contours_max_width), geometry.fromReference(self.__filter_contours_min_height), geometry.fromReference(self.__filter_contours_max_height), self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+        mark('filter_contours')
 
         # Optionally draw the contours for debug
         # For now, just uncomment as needed
         #cv2.drawContours(source0, self.find_contours_output, -1, (0,255,0), 3)
 
-        FOV_deg = 63.2 # Field of View in degrees Approximately and empirically determined
-
         # Find the bounding rectangles
         # Two types of rectangles, straight and rotated
         # Staight is always oriented to the image view
@@ -117,7 +182,7 @@ class BoilerStack:
             # NOTE: Limits are based on empircal data of approx 9 inches
             # from the camera plane, computed as follows
             #   d ~ 1441.452/h --> h ~ 1441.452/d
-            if (h >= 160): # Which also happens to be 1/2 of current resolution
+            if (h >= geometry.fromReference(160)): # Which also happens to be 1/2 of the tuned resolution
                 continue
             
             ratio = w / h
@@ -154,24 +219,16 @@ class BoilerStack:
                     detections.append(rect)
                     detectionType.append('Strong')
                     
-                    # Identify angled bounding box and display
-                    box = cv2.boxPoints(rect)
-                    box = np.int0(box)
-                    
                     # Draw strong candidate in green
-                    cv2.drawContours(source0,[box],0,(0,255,0),2)
+                    overlay.box(rect,(0,255,0),2)
                     
                 else:
                     # Save this off just in case we need to build a
                     # faux detection from the pieces of smaller objects
                     other.append(rect)
                     
-                    # Identify angled bounding box and display
-                    box = cv2.boxPoints(rect)
-                    box = np.int0(box)
-                    
                     # Draw these pieces in red
-                    cv2.drawContours(source0,[box],0,(0,0,255),2)
+                    overlay.box(rect,(0,0,255),2)
  
         # Insert reconstructed target logic here if needed
 
@@ -180,102 +237,46 @@ class BoilerStack:
         numDetections = len(detections)
         
 
-        # If there are more than 2 candidates we need to remove items that don't
-        # correspond to each other.
+        # If there are 2 or more candidates we need to find the pair that
+        # corresponds to each other.
         #
         # In particular, candidates need to be within the correct ratios
         # to each other and on the same horizon (again within our 5 degree tolerance)
         #
+        # We care about top/bottom: the top target should appear
+        # twice as high as the bottom target and be centered
+        # within 5 degrees and be spaced approximately the same
+        # as the height of the top target.
+        #
+        # All pairs are scored at once and the one closest to the target
+        # geometry wins (see targetpairs.py); the rest stay ranked behind it
+        self.targetPairs = boilerPairs(detections, geometry.width, geometry.hfov_deg)
         observations = []
         observationsVerified = False
-        if (numDetections > 2):
-            i = 0
-            for di in detections:
-                i = i + 1
-                xi = di[0][0]
-                yi = di[0][1]
-                wi = di[1][0]
-                hi = di[1][1]
-                
-                for dj in detections[i:]:
-                    xj = dj[0][0]
-                    yj = dj[0][1]
-                    wj = dj[1][0]
-                    hj = dj[1][1]
-
-                    # We care about top/bottom: the top target should appear
-                    # twice as high as the bottom target and be centered
-                    # within 5 degrees and be spaced approximately the same
-                    # as the height of the top target.
-                    
-                    # determine which is on top
-                    if (yi < yj):
-                        top = di
-                        topx = xi
-                        topy = yi
-                        topw = wi
-                        toph = hi
-                        
-                        bot = dj
-                        botx = xj
-                        boty = yj
-                        botw = wj
-                        both = hj
-                    else:
-                        top = dj
-                        topx = xj
-                        topy = yj
-                        topw = wj
-                        toph = hj
-                        
-                        bot = di
-                        botx = xi
-                        boty = yi
-                        botw = wi
-                        both = hi
-                    
-                    
-                    # First top must be approximately 2x taller than bottom
-                    # We will allow a 10% error (0.2 to 0.4 inches total) on 
-                    # either side
-                    if (1.8 <= toph/both <= 2.2):
-                        # To be the correct target, the centers must be spaced 7"
-                        # apart and within 5 degrees of vertical.
-                        # Sum of top (4") and bottom (2") heights is  assumed 6"
-                        inchh = (toph + both) / 6.0
-                        deltay = abs(topy - boty)
-                        if (6.5 <= (deltay/inchh) <= 7.5):  # 0.5 inch tolerance seems reasonable
-                           # We cannot reliably define the width since we are never sure how much
-                           # of the curved tape will reflect... all we can do is use pixel
-                           # estimates based on known width of image and sassuming that
-                           # the local area of the image is flat enough
-                           deltax = abs(topx - botx)
-                           errorx_deg = (deltax / 320.0) * FOV_deg
-                           if (errorx_deg <= 5.0):
-                               # This looks like the real thing
-                               observations.append(top)
-                               observations.append(bot)
-                               observationsVerified = True
-                               break;
-                
-                if (observations != []):
-                    break
-        else:
+        if (len(self.targetPairs) > 0):
+            # This looks like the real thing; top first, then bottom
+            best = self.targetPairs[0]
+            observations = [detections[best['first']], detections[best['second']]]
+            observationsVerified = True
+        elif (numDetections <= 2):
             observations = detections
                     
         
         numObservations = len(observations)
+        mark('verify_targets')
         
         # Draw thin line down center of screen
-        cv2.line(source0,(320/2,0),(320/2,240),(255,0,0),1)
+        overlay.line((geometry.centerX,0),(geometry.centerX,geometry.height),(255,0,0),1)
         
         nan = float('NaN')
+        tracked = None
+        measured = None
         
         if (numObservations == 2):
             # Having exactly two (2) observations is the easy case
         
-            # NOTE: If the observations were already verified there is no
-            # need to recheck the ratios
+            # NOTE: Either this is the best verified pair or the only two
+            # candidates, which the pair scoring already rejected
 
             x1 = observations[0][0][0]
             y1 = observations[0][0][1]
@@ -288,52 +289,8 @@ class BoilerStack:
             w2 = observations[1][1][0]
             h2 = observations[1][1][1]
             
-            if (observationsVerified == False):
-                    # determine which is on top
-                    if (y1 < y2):
-                        topx = x1
-                        topy = y1
-                        topw = w1
-                        toph = h1
-                        
-                        botx = x2
-                        boty = y2
-                        botw = w2
-                        both = h2
-                    else:
-                        topx = x2
-                        topy = y2
-                        topw = w2
-                        toph = h2
-                        
-                        botx = x1
-                        boty = y1
-                        botw = w1
-                        both = h1
-                    
-                    
-                    # First top must be approximately 2x taller than bottom
-                    # We will allow a 10% error (0.2 to 0.4 inches total) on 
-                    # either side
-                    if (1.8 <= toph/both <= 2.2):
-                        # To be the correct target, the centers must be spaced 7"
-                        # apart and within 5 degrees of vertical.
-                        # Sum of top (4") and bottom (2") heights is  assumed 6"
-                        inchh = (toph + both) / 6.0
-                        deltay = abs(topy - boty)
-                        if (6.5 <= (deltay/inchh) <= 7.5):  # 0.5 inch tolerance seems reasonable
-                           # We cannot reliably define the width since we are never sure how much
-                           # of the curved tape will reflect... all we can do is use pixel
-                           # estimates based on known width of image and sassuming that
-                           # the local area of the image is flat enough
-                           deltax = abs(topx - botx)
-                           errorx_deg = (deltax / 320.0) * FOV_deg
-                           if (errorx_deg <= 5.0):
-                               # This looks like the real thing
-                               observationsVerified = True
-            
-            # If either the original check or the check above verified
-            # the observation pair, then we can indicate high confidence
+            # If the pair scoring verified the observation pair, then we
+            # can indicate high confidence
             # and provide data
             # Otherwise, there is probably something wrong with one or more
             # of the observations can we can't be certain which one to use
@@ -342,6 +299,9 @@ class BoilerStack:
             # guess...albeit probably a good guess because initial positioning
             # should have gotten it close)
             if (observationsVerified == True):
+                # Keep tracking the extent of the pair, one above the other
+                tracked = (max(w1, w2), abs(y1 - y2) + (h1 + h2)/2)
+
                 # Target confidence is high
                 self.networkTable.putNumber("StackConfidence",1.0)
                 
@@ -351,26 +311,27 @@ class BoilerStack:
                 sumh = (h1 + h2) # approx 6 inches                          
                 radius = sumh / 12      # about 0.5"
                 
-                centerFraction = ((2.0*centerX)/320.0) - 1.0 # cam res is 320, avg & scale cancel
-                center_deg = FOV_deg/2 * centerFraction
+                centerFraction = geometry.centerFraction(centerX)
+                center_deg = geometry.bearing_deg(centerX, centerY)
                 self.networkTable.putNumber("StackCenterX",centerFraction)
                 self.networkTable.putNumber("StackCenter_deg",center_deg)
     
                 # Target center within radius if screen center will be green
                 # otherwise yellow until center is beyond middle 1/3rd of FOV
-                if (abs(320/2 - centerX) <= radius):
+                if (abs(geometry.centerX - centerX) <= radius):
                     color = (0,255,0)
                 elif (center_deg <= 20.0):
                     color = (0,255,255)
                 else:
                     color = (0,0,255)
     
-                cv2.circle(source0, (int(centerX), int(centerY)), int(radius), color, 2)
+                overlay.circle((int(centerX), int(centerY)), int(radius), color, 2)
                 
                 self.lastCenterX = centerX
                 self.lastCenterY = centerY
                 self.lastDistance_inches = nan #distance_inches
                 self.lastCenter_deg = center_deg
+                measured = (center_deg, nan)
         
             else:
                 # We simply don't have any good information to go on
@@ -404,6 +365,22 @@ class BoilerStack:
             self.lastDistance_inches = nan
             self.lastCenter_deg = nan
             
+        if (self.tracker is not None):
+            if (tracked is None):
+                self.tracker.missed()
+            else:
+                self.tracker.found(self.lastCenterX, self.lastCenterY, tracked[0], tracked[1])
+
+        # Verified measurements are taken as of when the frame was grabbed,
+        # so the published prediction makes up for the processing latency
+        if (measured is not None):
+            self.targetTracker.update(captureTime(), measured[0], measured[1])
+        self.targetTracker.publish(self.networkTable, "Stack", now())
+
+        mark('nt_publish')
+
+        # Publish what to draw; source0 itself is left as it came
+        self.overlay = overlay
         return (self.find_contours_output, self.filter_contours_output)
 
     @staticmethod
@@ -434,11 +411,12 @@ class BoilerStack:
         return cv2.inRange(out, (hue[0], lum[0], sat[0]),  (hue[1], lum[1], sat[1]))
 
     @staticmethod
-    def __find_contours(input, external_only):
+    def __find_contours(input, external_only, offset=(0, 0)):
         """Sets the values of pixels in a binary image to their distance to the nearest black pixel.
         Args:
             input: A numpy.ndarray.
             external_only: A boolean. If true only external contours are found.
+            offset: Added to every contour point, e.g., the origin of an image region.
         Return:
             A list of numpy.ndarray where each one represents a contour.
         """
@@ -447,53 +425,9 @@ class BoilerStack:
         else:
             mode = cv2.RETR_LIST
         method = cv2.CHAIN_APPROX_SIMPLE
-        im2, contours, hierarchy =cv2.findContours(input, mode=mode, method=method)
+        # OpenCV 3 returns (image, contours, hierarchy), 2 and 4+ (contours, hierarchy)
+        contours = cv2.findContours(input, mode=mode, method=method, offset=offset)[-2]
         return contours
 
-    @staticmethod
-    def __filter_contours(input_contours, min_area, min_perimeter, min_width, max_width,
-                        min_height, max_height, solidity, max_vertex_count, min_vertex_count,
-                        min_ratio, max_ratio):
-        """Filters out contours that do not meet certain criteria.
-        Args:
-            input_contours: Contours as a list of numpy.ndarray.
-            min_area: The minimum area of a contour that will be kept.
-            min_perimeter: The minimum perimeter of a contour that will be kept.
-            min_width: Minimum width of a contour.
-            max_width: MaxWidth maximum width.
-            min_height: Minimum height.
-            max_height: Maximimum height.
-            solidity: The minimum and maximum solidity of a contour.
-            min_vertex_count: Minimum vertex Count of the contours.
-            max_vertex_count: Maximum vertex Count.
-            min_ratio: Minimum ratio of width to height.
-            max_ratio: Maximum ratio of width to height.
-        Returns:
-            Contours as a list of numpy.ndarray.
-        """
-        output = []
-        for contour in input_contours:
-            x,y,w,h = cv2.boundingRect(contour)
-            if (w < min_width or w > max_width):
-                continue
-            if (h < min_height or h > max_height):
-                continue
-            area = cv2.contourArea(contour)
-            if (area < min_area):
-                continue
-            if (cv2.arcLength(contour, True) < min_perimeter):
-                continue
-            hull = cv2.convexHull(contour)
-            solid = 100 * area / cv2.contourArea(hull)
-            if (solid < solidity[0] or solid > solidity[1]):
-                continue
-            if (len(contour) < min_vertex_count or len(contour) > max_vertex_count):
-                continue
-            ratio = (float)(w) / h
-            if (ratio < min_ratio or ratio > max_ratio):
-                continue
-            output.append(contour)
-        return output
-
 
 
@@ -5,45 +5,87 @@ Created on Tue Jan 24 20:46:25 2017
 @author: mtkes
 """
 ## NOTE: OpenCV interface to camera controls is sketchy
-## use v4l2-ctl directly for explicit control
-## example for dark picture: v4l2-ctl -c exposure_auto=1 -c exposure_absolute=10
+## use V4L2 controls directly for explicit control (see v4l2control.py)
+## equivalent for dark picture: v4l2-ctl -c exposure_auto=1 -c exposure_absolute=10
 
 # import the necessary packages
 
 import cv2
+import numpy as np
 
-from subprocess import call
-from threading import Lock
+from collections import deque
 from threading import Thread
-from threading import Condition
 
 import platform
 
 # import our classes
 
-from framerate import FrameRate
-from frameduration import FrameDuration
+from framemailbox import FrameMailbox
+from framepool import FramePool
+from framepool import readRetained
+from framesource import openSource
+import frametrace
+from frametrace import FrameTrace
+from metrics import registry
+from v4l2control import CameraProfile
+from v4l2control import V4L2Control
 
 class BucketCapture:
-    def __init__(self, name,src,width,height,exposure):
+    def __init__(self, name,src,width,height,exposure,poolSize=8,settleFrames=2,profile=None):
 
         print("Creating BucketCapture for " + name)
         
-        self._lock = Lock()
-        self._condition = Condition()
-        self.fps = FrameRate()
-        self.duration = FrameDuration()
+        self._mailbox = FrameMailbox()
         self.name = name
+        labels = {'camera' : name}
+        self.fps = registry.meter('bucketvision_capture_frames', 'Frames captured', labels)
+        self.duration = registry.histogram('bucketvision_capture_publish_seconds', 'Time to publish a captured frame', labels)
         self.src = src
         
         # initialize the video camera stream and read the first frame
-        # from the stream
-        self.stream = cv2.VideoCapture(src)
+        # from the stream; src may be a device, a video file, a directory
+        # or glob of stills, or any FrameSource (see framesource.py)
+        self.stream = openSource(src)
         self.stream.set(cv2.CAP_PROP_FRAME_WIDTH,width)
         self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT,height)
         self.exposure = exposure
 
-        self.setExposure()
+        # Camera settings are applied in-process with V4L2 ioctls when we
+        # can open the device, otherwise through the OpenCV properties
+        self.control = None
+        isDevice = isinstance(src, int) or str(src).startswith('/dev/')
+        if ((platform.system() != 'Windows') and (isDevice == True)):
+            try:
+                self.control = V4L2Control(src)
+            except (IOError, OSError) as e:
+                print("V4L2 controls unavailable for " + name + ": " + str(e))
+
+        # Every frame is stamped with the generation of the camera profile
+        # it was captured under. After a profile change the frames already
+        # queued in the driver were exposed with the old settings, so the
+        # first settleFrames are drained and discarded (count in stale)
+        #
+        # NOTE: the queue depth is camera/driver dependent (OpenCV's V4L2
+        # backend normally queues a few buffers) so tune settleFrames
+        if (profile is None):
+            profile = CameraProfile(name, exposure=self.exposure)
+        elif (profile.exposure is not None):
+            self.exposure = profile.exposure
+        self.profile = profile
+        self.applyProfile(self.profile)
+        self.activeProfile = self.profile
+        self.generation = 1
+        self.settleFrames = settleFrames
+        self.stale = registry.counter('bucketvision_capture_stale_frames', 'Frames drained after a profile change', labels)
+
+        # Interleaved mode alternates a list of profiles frame by frame
+        # (e.g., dark for targeting, normal for the driver); each profile
+        # also gets its own mailbox and rate so consumers can read just
+        # the frames taken under the profile they want
+        self.interleave = None
+        self._profileMailboxes = {}
+        self._profilePublished = {}
+        self.profileFps = {}
 
         self.rate = self.stream.get(cv2.CAP_PROP_FPS)
         print("RATE = " + str(self.rate))
@@ -57,20 +99,27 @@ class BucketCapture:
 ##        self.iso = self.stream.get(cv2.CAP_PROP_ISO_SPEED)
 ##        print("ISO = " + str(self.iso))
 
+        # The first frame tells us the geometry for the buffer pool;
+        # every frame after this is decoded into a preallocated buffer
+        # that is shared (by reference count) with all readers
+        #
+        # NOTE: the pool must have enough buffers for the mailbox slot,
+        # the frame being captured and one for each concurrent reader
+        # (processor, stream server, recorder...); when all are busy
+        # frames are grabbed and discarded rather than allocated
         (self._grabbed, self._frame) = self.stream.read()
         
+        self.grabbed = self._grabbed
+        self.dropped = registry.counter('bucketvision_capture_dropped_frames', 'Frames discarded with every buffer in use', labels)
+        self._published = None
         if (self._grabbed == True):
-            self.grabbed = self._grabbed
-            self.frame = self._frame
-            self.outFrame = self.frame
-            self.count = 1
-            self.outCount = self.count
+            self.pool = FramePool(poolSize, self._frame.shape, self._frame.dtype, frametrace.ring)
+            buf = self.pool.acquire()
+            np.copyto(buf.image, self._frame)
+            self._publish(buf)
         else:
-            self.grabbed = False
-            self.frame = None
-            self.outFrame = None
-            self.count = 0
-            self.outCount = self.count
+            self.pool = FramePool(poolSize, (height, width, 3), ring=frametrace.ring)
+        registry.gauge('bucketvision_capture_free_buffers', 'Frame buffers not held by any reader', labels).setFunction(self.pool.available)
 
         # initialize the variable used to indicate if the thread should
         # be stopped
@@ -82,7 +131,7 @@ class BucketCapture:
     def start(self):
         # start the thread to read frames from the video stream
         print("STARTING BucketCapture for " + self.name)
-        t = Thread(target=self.update, args=())
+        t = Thread(target=self.update, args=(), name=self.name + "Capture")
         t.daemon = True
         t.start()
         return self
@@ -91,9 +140,12 @@ class BucketCapture:
         print("BucketCapture for " + self.name + " RUNNING")
         # keep looping infinitely until the thread is stopped
         self.stopped = False
-        self.fps.start()
 
-        lastExposure = self.exposure
+        lastProfile = self.profile
+        lastInterleave = None
+        history = None
+        phase = 0
+        settle = 0
         
         while True:
             # if the thread indicator variable is set, stop the thread
@@ -102,48 +154,132 @@ class BucketCapture:
                 self.stopped = True
                 return
 
-            if (lastExposure != self.exposure):
-                self.setExposure()
-                lastExposure = self.exposure
+            if (lastInterleave is not self.interleave):
+                # A new interleave (or the end of one) is a new generation;
+                # frames in flight are accounted for by the history below
+                # or by the settle count when returning to one profile
+                lastInterleave = self.interleave
+                history = deque(maxlen=self.settleFrames + 1)
+                phase = 0
+                lastProfile = None
+                self.generation += 1
+
+            if (lastInterleave is not None):
+                # Set up the exposure for the frame that will come out of
+                # the driver queue settleFrames reads from now; the frame we
+                # read next was exposed with the profile set that many reads
+                # ago (the oldest entry in the history)
+                profile = lastInterleave[phase]
+                phase = (phase + 1) % len(lastInterleave)
+                self.applyProfile(profile)
+                history.append(profile)
+                if (len(history) < history.maxlen):
+                    self.stream.grab()
+                    self.stale.inc()
+                    continue
+                self.activeProfile = history[0]
+
+            elif (lastProfile is not self.profile):
+                lastProfile = self.profile
+                self.applyProfile(lastProfile)
+                self.activeProfile = lastProfile
+                self.generation += 1
+                settle = self.settleFrames
+
+            if (settle > 0):
+                self.stream.grab()
+                self.stale.inc()
+                settle -= 1
+                continue
 
-            # otherwise, read the next frame from the stream
-            (self._grabbed, self._frame) = self.stream.read()
-            self.duration.start()
-            self.fps.update()
+            # otherwise, decode the next frame from the stream directly
+            # into a free buffer; if every buffer is still held by a reader
+            # just drain the camera so the driver queue does not go stale
+            buf = self.pool.acquire()
+            if (buf is None):
+                self.stream.grab()
+                self.dropped.inc()
+                continue
+
+            # Stamp the frame when it is grabbed, before it is decoded;
+            # frametrace.captureTime() takes this as when it was measured
+            self._grabbed = self.stream.grab()
+            trace = FrameTrace(self._mailbox.seq() + 1)
+            trace.mark('grab')
+            start = frametrace.now()
+            self._frame = None
+            if (self._grabbed == True):
+                (self._grabbed, self._frame) = self.stream.retrieve(image=buf.image)
+                trace.mark('retrieve')
+            self.fps.mark()
             
             
-            # if something was grabbed and retreived then lock
-            # the outboundw buffer for the update
-            # This limits the blocking to just the copy operations
-            # later we may consider a queue or double buffer to
-            # minimize blocking
+            # if something was grabbed and retreived then post it to
+            # the mailbox; readers waiting on a newer count wake up
+            # immediately and the capture thread never blocks
             if (self._grabbed == True):
-                self._condition.acquire()
-                self._lock.acquire()
-                self.count = self.count + 1
                 self.grabbed = self._grabbed
-                self.frame = self._frame
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
+                if (self._frame is not buf.image):
+                    # OpenCV reallocated (e.g., camera changed geometry)
+                    # so adopt the new array as this buffer's storage
+                    buf.image = self._frame
+                buf.trace = trace
+                self._publish(buf)
+            else:
+                buf.release()
 
-            self.duration.update()
+            self.duration.observeSince(start)
                 
         print("BucketCapture for " + self.name + " STOPPING")
 
-    def read(self):
-        # return the frame most recently read if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def _publish(self, buf):
+        # The buffer's single reference moves to the mailbox slot and the
+        # reference held by the previous slot occupant is dropped
+        buf.count = self._mailbox.seq() + 1
+        buf.generation = self.generation
+        buf.profile = self.activeProfile.name
+
+        # The slot of the per-profile mailbox holds its own reference
+        name = buf.profile
+        mailbox = self._profileMailbox(name)
+        buf.retain()
+        mailbox.put(buf)
+        previous = self._profilePublished.get(name)
+        if (previous is not None):
+            previous.release()
+        self._profilePublished[name] = buf
+        self.profileFps[name].mark()
+
+        self._mailbox.put(buf)
+        if (self._published is not None):
+            self._published.release()
+        self._published = buf
+
+    def _profileMailbox(self, name):
+        # Mailboxes are created on first use by either side; setdefault
+        # keeps the first one if both race to create it
+        mailbox = self._profileMailboxes.get(name)
+        if (mailbox is None):
+            self.profileFps.setdefault(name, registry.meter('bucketvision_capture_profile_frames',
+                                                            'Frames captured per camera profile',
+                                                            {'camera' : self.name, 'profile' : name}))
+            mailbox = self._profileMailboxes.setdefault(name, FrameMailbox())
+        return mailbox
+
+    def read(self, afterCount=0, timeout=None, profile=None):
+        # return the most recent frame buffer if its count is newer than
+        # afterCount, otherwise wait for the next one (or the timeout)
+        # Callers pass back the count they were last given; any gap in the
+        # returned count is the number of frames they did not keep up with
+        #
+        # When isNew is True the caller owns a reference to the returned
+        # FrameBuffer (use .image for the pixels) and MUST release() it
+        #
+        # With a profile name only frames captured under that profile are
+        # returned; the count is then specific to that profile's mailbox
+        if (profile is not None):
+            return readRetained(self._profileMailbox(profile), afterCount, timeout)
+        return readRetained(self._mailbox, afterCount, timeout)
 
     def processUserCommand(self, key):
         if key == ord('x'):
@@ -173,12 +309,10 @@ class BucketCapture:
             self.stream.set(cv2.CAP_PROP_SATURATION,self.saturation)
             print("SATURATION = " + str(self.saturation))
         elif key == ord('z'):
-            self.exposure+=1
-            setExposure(self.exposure)
+            self.updateExposure(self.exposure + 1)
             print("EXPOSURE = " + str(self.exposure))
         elif key == ord('c'):
-            self.exposure-=1
-            setExposure(self.exposure)
+            self.updateExposure(self.exposure - 1)
             print("EXPOSURE = " + str(self.exposure))
 ##        elif key == ord('p'):
 ##            self.iso +=1
@@ -190,24 +324,59 @@ class BucketCapture:
         return False
 
     def updateExposure(self, exposure):
-        self.exposure = exposure
-        
+        # Request the current profile with a new exposure; applied by the
+        # capture thread. The profile keeps its name so the processors
+        # waiting on it (see bucketprocessor.py) still take its frames
+        if (exposure != self.exposure):
+            self.updateProfile(self.profile.withExposure(exposure))
+
+    def updateInterleave(self, profiles):
+        # Alternate the given profiles frame by frame (None to stop and
+        # return to the single profile from updateProfile)
+        #
+        # NOTE: automatic exposure does not settle when it is switched on
+        # and off every frame, so interleaved profiles should use manual
+        # (non-negative) exposures
+        if (profiles is not None):
+            profiles = list(profiles)
+        self.interleave = profiles
+
+    def updateProfile(self, profile):
+        # Request a new camera profile; applied by the capture thread
+        # before the next frame is read
+        if (profile.exposure is not None):
+            self.exposure = profile.exposure
+        self.profile = profile
+
     def setExposure(self):
+        self.applyProfile(CameraProfile(self.name, exposure=self.exposure))
+
+    def applyProfile(self, profile):
         # cv2 exposure control DOES NOT WORK ON PI self.stream.set(cv2.CAP_PROP_EXPOSURE,self.exposure)
-        # cv2 exposure control DOES NOT WORK ON PI self.stream.set(cv2.CAP_PROP_EXPOSURE,self.exposure)
-        if (platform.system() == 'Windows'):
-            self.stream.set(cv2.CAP_PROP_EXPOSURE,self.exposure)
+        # so use the V4L2 controls when we have them; settings that are
+        # already in effect are skipped without touching the device
+        if (self.control is not None):
+            try:
+                self.control.apply(profile)
+            except (IOError, OSError) as e:
+                print("Unable to apply " + str(profile) + " to " + self.name + ": " + str(e))
         else:
-            cmd = ['v4l2-ctl --device=' + str(self.src) + ' -c exposure_auto=1 -c exposure_absolute=' + str(self.exposure)]
-            call(cmd,shell=True)
+            if (profile.exposure is not None):
+                self.stream.set(cv2.CAP_PROP_EXPOSURE,profile.exposure)
+            if (profile.brightness is not None):
+                self.stream.set(cv2.CAP_PROP_BRIGHTNESS,profile.brightness)
+            if (profile.contrast is not None):
+                self.stream.set(cv2.CAP_PROP_CONTRAST,profile.contrast)
+            if (profile.saturation is not None):
+                self.stream.set(cv2.CAP_PROP_SATURATION,profile.saturation)
         
     
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self._mailbox.wake()
+        for mailbox in list(self._profileMailboxes.values()):
+            mailbox.wake()
 
     def isStopped(self):
         return self.stopped
@@ -1,28 +1,41 @@
 
-from threading import Lock
 from threading import Thread
-from threading import Condition
 
-from framerate import FrameRate
-from frameduration import FrameDuration
+from framemailbox import FrameMailbox
+from framepool import readRetained
+from metrics import registry
+import frametrace
 
 class BucketProcessor:
-    def __init__(self,stream,ipdictionary, ipselection):
+    def __init__(self,stream,ipdictionary, ipselection, ipprofiles=None):
         print("Creating BucketProcessor for " + stream.name)
-        self._lock = Lock()
-        self._condition = Condition()
-        self.fps = FrameRate()
-        self.duration = FrameDuration()
+        self._mailbox = FrameMailbox()
         self.stream = stream
         self.name = self.stream.name
+        labels = {'camera' : self.name}
+        self.fps = registry.meter('bucketvision_processor_frames', 'Frames processed', labels)
+        self.duration = registry.histogram('bucketvision_processor_seconds', 'Time to process a frame', labels)
+        # Seconds spent processing per second, i.e., the duty cycle
+        self.busy = registry.meter('bucketvision_processor_busy_seconds', 'Time spent processing frames', labels)
         self.ipdictionary = ipdictionary
         self.ipselection = ipselection
         self.ip = self.ipdictionary[ipselection]
 
+        # Optional map from selection to the name of the camera profile its
+        # pipeline requires; frames captured under any other profile (e.g.,
+        # still in flight from before a mode switch) are dropped unprocessed
+        if (ipprofiles is None):
+            ipprofiles = {}
+        self.ipprofiles = ipprofiles
+        self.mismatched = registry.counter('bucketvision_processor_mismatched_frames', 'Frames dropped for the wrong camera profile', labels)
+
         self._frame = None
-        self.frame = None
-        self.count = 0
-        self.isNew = False
+        self._published = None
+
+        # Overlay (see overlay.py) of the most recently processed frame, if
+        # the pipeline makes one, for drawing on newer camera frames
+        self.overlay = None
+        self.skipped = registry.counter('bucketvision_processor_skipped_frames', 'Frames superseded before they were read', labels)
         
         # initialize the variable used to indicate if the thread should
         # be stopped
@@ -33,7 +46,7 @@ class BucketProcessor:
         
     def start(self):
         print("STARTING BucketProcessor for " + self.name)
-        t = Thread(target=self.update, args=())
+        t = Thread(target=self.update, args=(), name=self.name + "Processor")
         t.daemon = True
         t.start()
         return self
@@ -42,7 +55,9 @@ class BucketProcessor:
         print("BucketProcessor for " + self.name + " RUNNING")
         # keep looping infinitely until the thread is stopped
         self.stopped = False
-        self.fps.start()
+
+        lastCount = 0
+        lastSource = None
 
         lastIpSelection = self.ipselection
         
@@ -53,59 +68,91 @@ class BucketProcessor:
                 self.stopped = True
                 return
 
-            # otherwise, read the next frame from the stream
-            # grab the frame from the threaded video stream
-            (self._frame, count, isNew) = self.stream.read()
-            self.duration.start()
-            self.fps.update()
-
             if (lastIpSelection != self.ipselection):
                 self.ip = self.ipdictionary[self.ipselection]
                 lastIpSelection = self.ipselection
 
+            requiredProfile = self.ipprofiles.get(lastIpSelection)
+
+            # When the camera is interleaving profiles read only the frames
+            # taken with the profile our pipeline needs; counts are kept per
+            # profile mailbox so start over whenever the source changes
+            source = None
+            if (getattr(self.stream, 'interleave', None) is not None):
+                source = requiredProfile
+            if (source != lastSource):
+                lastSource = source
+                lastCount = 0
+
+            # otherwise, read the next frame from the stream
+            # grab the frame from the threaded video stream
+            if (source is None):
+                (self._frame, count, isNew) = self.stream.read(lastCount)
+            else:
+                (self._frame, count, isNew) = self.stream.read(lastCount, profile=source)
+
             if (isNew == True):
+                # Frames that arrived while we were busy are simply
+                # superseded; keep count so the loss is visible
+                if (lastCount != 0):
+                    self.skipped.inc(count - lastCount - 1)
+                lastCount = count
+
+                if ((requiredProfile is not None) and (self._frame.profile != requiredProfile)):
+                    self.mismatched.inc()
+                    self._frame.release()
+                    self._frame = None
+                    continue
+
+                # Pipelines mark their steps on the trace of the frame
+                # being processed through frametrace.mark()
+                trace = self._frame.trace
+                frametrace.setCurrent(trace)
+                if (trace is not None):
+                    trace.mark('process_start')
+
                 # TODO: Insert processing code then forward display changes
-                self.ip.process(self._frame)
+                start = frametrace.now()
+                self.ip.process(self._frame.image)
+                elapsed = frametrace.now() - start
+                self.duration.observe(elapsed)
+                self.busy.mark(elapsed)
+                self.fps.mark()
+
+                # The pipeline left the image alone; what it wants drawn
+                # goes along with the frame
+                self.overlay = getattr(self.ip, 'overlay', None)
+                self._frame.overlay = self.overlay
+
+                if (trace is not None):
+                    trace.mark('process_end')
+                frametrace.setCurrent(None)
                 
-                # Now that image processing is complete, place results
-                # into an outgoing buffer to be grabbed at the convenience
-                # of the reader
-                self._condition.acquire()
-                self._lock.acquire()
-                self.count = self.count + 1
-                self.isNew = isNew
-                self.frame = self._frame
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
-
-            self.duration.update()
+                # Now that image processing is complete, post results
+                # to the outgoing mailbox to be grabbed at the convenience
+                # of the reader; our reference to the frame buffer moves
+                # to the mailbox slot and the previous one is let go
+                self._mailbox.put(self._frame)
+                if (self._published is not None):
+                    self._published.release()
+                self._published = self._frame
                 
         print("BucketProcessor for " + self.name + " STOPPING")
 
     def updateSelection(self, ipselection):
         self.ipselection = ipselection
 
-    def read(self):
-        # return the frame most recently processed if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def read(self, afterCount=0, timeout=None):
+        # return the most recently processed frame if its count is newer
+        # than afterCount, otherwise wait for the next one (or the timeout)
+        # When isNew is True the caller owns a reference to the returned
+        # FrameBuffer (use .image for the pixels) and MUST release() it
+        return readRetained(self._mailbox, afterCount, timeout)
           
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self._mailbox.wake()
 
     def isStopped(self):
         return self.stopped
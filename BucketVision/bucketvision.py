@@ -40,7 +40,7 @@ SOFTWARE.
 # import the necessary packages
 
 import cv2
-from BaseHTTPServer import BaseHTTPRequestHandler,HTTPServer
+import json
 import time
 
 from subprocess import call
@@ -53,11 +53,19 @@ import logging      # Needed if we want to see debug messages from NetworkTables
 
 # import our classes
 
-from framerate import FrameRate
+import frametrace                           # Per-frame latency records
+from metrics import registry                # Counters, rates and latency histograms
 
 from bucketcapture import BucketCapture     # Camera capture threads... may rename this
 from bucketprocessor import BucketProcessor   # Image processing threads... has same basic structure (may merge classes)
 from bucketserver import BucketServer       # Run the HTTP service
+from camerageometry import CameraGeometry   # Field of view; pipelines scale to the frame size
+from camerageometry import FRONT_CAM_HFOV_DEG
+from calibration import loadCalibration    # Lens calibration as angle lookup tables
+from mjpegbroadcaster import MjpegBroadcaster  # Encode once, send to every viewer
+from streamserver import StreamServer       # ...over one select() loop
+from ratecontrol import RateController      # ...under the radio bandwidth cap
+from v4l2control import CameraProfile       # Named camera settings applied as a batch
 
 import platform
 
@@ -119,6 +127,17 @@ frontCamMode = bvTable.getAutoUpdateValue('FrontCamMode', 'gearLift') # 'gearLif
 alliance = bvTable.getAutoUpdateValue('allianceColor','red')   # default until chooser returns a value
 location = bvTable.getAutoUpdateValue('allianceLocation',1)
 
+# The driver stream is held near this bitrate (all viewers together) by
+# trading JPEG quality, then resolution, then frame rate; the field radio
+# caps the whole robot at 7 Mbit/s and NetworkTables needs its share
+STREAM_TARGET_KBPS = 3000
+streamTargetKbps = bvTable.getAutoUpdateValue('StreamTargetKbps', STREAM_TARGET_KBPS)
+
+# 'live' streams camera frames at capture rate with the latest pipeline
+# overlay drawn on each, so the driver video stays smooth however slow the
+# selected pipeline is; 'processed' streams the processed frames themselves
+streamMode = bvTable.getAutoUpdateValue('StreamMode', 'live')
+
 # NOTE: NOTE: NOTE
 #
 # For now just create one image pipeline to share with each image processor
@@ -130,10 +149,22 @@ location = bvTable.getAutoUpdateValue('allianceLocation',1)
 # are desired (e.g., look for faces AND pink elephants at the same time), and place
 # the exclusive options into a single processor (e.g., look for faces OR pink elephants)
 
-redBoiler = RedBoiler()
-blueBoiler = BlueBoiler()
+# The front camera resolution is set here only; the pipelines take it from
+# each frame and scale their pixel constants to it (tuned at 320x240), so
+# e.g., 160x120 trades range for speed and 640x480 speed for range
+FRONT_CAM_WIDTH = 320
+FRONT_CAM_HEIGHT = 240
+
+# Target angles come from the lens calibration when there is one (made with
+# calibratecamera.py), otherwise linearly from the field of view
+FRONT_CAM_CALIBRATION = 'frontCamCalibration.json'
+frontCamCalibration = loadCalibration(FRONT_CAM_CALIBRATION)
+frontCamGeometry = CameraGeometry(hfov_deg=FRONT_CAM_HFOV_DEG, width=FRONT_CAM_WIDTH, height=FRONT_CAM_HEIGHT, calibration=frontCamCalibration)
+
+redBoiler = RedBoiler(geometry=frontCamGeometry)
+blueBoiler = BlueBoiler(geometry=frontCamGeometry)
 boiler = Boiler()
-gearLift = GearLift(bvTable)
+gearLift = GearLift(bvTable, geometry=frontCamGeometry)
 
 rope = Rope()
 
@@ -143,13 +174,25 @@ nada = Nada()
 #
 # YOUR MILEAGE WILL VARY
 # The exposure values are camera/driver dependent and have no well defined standard (i.e., non-portable)
-# Our implementation is forced to use v4l2-ctl (Linux) to make the exposure control work because our OpenCV
+# Our implementation is forced to use the V4L2 controls directly (Linux, see v4l2control.py) to make the exposure control work because our OpenCV
 # port does not seem to play well with the exposure settings (produces either no answer or causes errors depending
 # on the camera used)
 FRONT_CAM_GEAR_EXPOSURE = 0
 FRONT_CAM_NORMAL_EXPOSURE = -1   # Camera default
 
-frontCam = BucketCapture(name="FrontCam",src=0,width=320,height=240,exposure=FRONT_CAM_GEAR_EXPOSURE).start()    # start low for gears
+frontCamGearProfile = CameraProfile('gearLift', exposure=FRONT_CAM_GEAR_EXPOSURE)
+frontCamNormalProfile = CameraProfile('normal', exposure=FRONT_CAM_NORMAL_EXPOSURE)
+
+# Interleaved mode alternates the gear and normal profiles frame by frame so
+# one camera serves both targeting (dark frames to the processor) and the
+# driver (normal frames to the stream) without switching modes at runtime
+# NOTE: the normal exposure should be manual (>= 0) when interleaving since
+# automatic exposure cannot settle when it is toggled every frame
+FRONT_CAM_INTERLEAVE = False
+
+frontCam = BucketCapture(name="FrontCam",src=0,width=FRONT_CAM_WIDTH,height=FRONT_CAM_HEIGHT,exposure=FRONT_CAM_GEAR_EXPOSURE,profile=frontCamGearProfile).start()    # start low for gears
+if (FRONT_CAM_INTERLEAVE == True):
+    frontCam.updateInterleave([frontCamGearProfile, frontCamNormalProfile])
 
 print("Waiting for BucketCapture to start...")
 while ((frontCam.isStopped() == True)):
@@ -170,7 +213,13 @@ frontPipes = {'redBoiler' : nada, #boiler, #redBoiler,
               'blueBoiler' : nada, #boiler, #blueBoiler,
               'gearLift' : gearLift}
 
-frontProcessor = BucketProcessor(frontCam,frontPipes,'gearLift').start()
+# Camera profile each front pipeline expects; during a mode switch frames
+# taken with the other exposure are dropped rather than processed
+frontProfiles = {'redBoiler' : frontCamNormalProfile.name,
+                 'blueBoiler' : frontCamNormalProfile.name,
+                 'gearLift' : frontCamGearProfile.name}
+
+frontProcessor = BucketProcessor(frontCam,frontPipes,'gearLift',frontProfiles).start()
 
 
 print("Waiting for BucketProcessors to start...")
@@ -180,8 +229,7 @@ while ((frontProcessor.isStopped() == True)):
 print("BucketProcessors appear online!")
 
 # Continue feeding display or streams in foreground told to stop
-#fps = FrameRate()   # Keep track of display rate  TODO: Thread that too!
-#fps.start()
+#fps = registry.meter('display_frames')   # Keep track of display rate  TODO: Thread that too!
 
 # Loop forever displaying the images for initial testing
 #
@@ -199,76 +247,113 @@ print("BucketProcessors appear online!")
 camera = {'frontCam' : frontCam}
 processor = {'frontCam' : frontProcessor}
 
-class CamHTTPHandler(BaseHTTPRequestHandler):
-    _stop = False
-    fps = FrameRate()
-
-    def stop(self):
-        self._self = True
-        
-    def do_GET(self):
-        print(self.path)
-        self.fps.start()
-        if self.path.endswith('.mjpg'):
-            self.send_response(200)
-            self.send_header('Content-type','multipart/x-mixed-replace; boundary=--jpgboundary')
-            self.end_headers()
-            
-            while (frontProcessor.isStopped() == False):
-                try:
-
-                    
-                    try:
-                        camModeValue = camMode.value
-                        cameraSelection = camera[camModeValue]
-                        processorSelection = processor[camModeValue]
-                    except:
-                        camModeValue = 'frontCam'
-                        cameraSelection = camera[camModeValue]
-                        processorSelection = processor[camModeValue]
-                        
-                    
-                    (img, count, isNew) = processorSelection.read()
-                    
-                    if (isNew == False):
-                            continue
-                    camFps = cameraSelection.fps.fps()
-                    procFps = processorSelection.fps.fps()
-                    procDuration = processorSelection.duration.duration()
-
-                    cv2.putText(img,"{:.1f}".format(camFps),(0,20),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
-                    if (procFps != 0.0):
-                        cv2.putText(img,"{:.1f}".format(procFps) + " : {:.0f}".format(100 * procDuration * procFps) + "%",(0,40),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
-                    cv2.putText(img,"{:.1f}".format(self.fps.fps()),(0,60),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
-
-                    cv2.putText(img,camModeValue,(0, 80),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
-                    cv2.putText(img,processorSelection.ipselection,(0,100),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
-
-                    r, buf = cv2.imencode(".jpg",img)
-                    self.wfile.write("--jpgboundary\r\n")
-                    self.send_header('Content-type','image/jpeg')
-                    self.send_header('Content-length',str(len(buf)))
-                    self.end_headers()
-                    self.wfile.write(bytearray(buf))
-                    self.wfile.write('\r\n')
-
-                    self.fps.update()
-                    
-                except KeyboardInterrupt:
-                    break
-            return
-
-        if self.path.endswith('.html') or self.path=="/":
-            self.send_response(200)
-            self.send_header('Content-type','text/html')
-            self.end_headers()
-            self.wfile.write('<html><head></head><body>')
-            self.wfile.write('<img src="http://127.0.0.1:8080/cam.mjpg"/>')
-            self.wfile.write('</body></html>')
-            return
+# Cameras whose stream comes straight from the frames of one profile rather
+# than from the processor (i.e., the driver view of an interleaved camera)
+streamProfile = {}
+if (FRONT_CAM_INTERLEAVE == True):
+    streamProfile['frontCam'] = frontCamNormalProfile.name
+
+def selectedCamera():
+    # The camera the driver selected, if we have it
+    camModeValue = camMode.value
+    if (camModeValue not in camera):
+        camModeValue = 'frontCam'
+    return camModeValue
+
+def cameraRead(camModeValue, profileName):
+    # Camera frames (of one profile, if given) in the read() signature
+    cameraSelection = camera[camModeValue]
+    if (profileName is None):
+        return cameraSelection.read
+    return lambda afterCount, timeout=None: cameraSelection.read(afterCount, timeout, profileName)
+
+def selectStream():
+    # The source of the driver stream follows the selected camera and the
+    # stream mode; an interleaved camera always streams its own frames
+    camModeValue = selectedCamera()
+    profileName = streamProfile.get(camModeValue)
+    live = ((streamMode.value == 'live') or (profileName is not None))
+    if (live == True):
+        read = cameraRead(camModeValue, profileName)
+    else:
+        read = processor[camModeValue].read
+    return ((camModeValue, profileName, live), read)
+
+def selectRaw():
+    # Frames of the selected camera at camera rate, before any processing
+    camModeValue = selectedCamera()
+    profileName = streamProfile.get(camModeValue)
+    return ((camModeValue, profileName), cameraRead(camModeValue, profileName))
+
+def selectProcessed():
+    # Frames of the selected camera's processor, without the stats overlay
+    camModeValue = selectedCamera()
+    return (camModeValue, processor[camModeValue].read)
+
+def annotateStream(img, key):
+    # Drawn once per frame on the broadcaster's own copy of it
+    (camModeValue, profileName, live) = key
+    cameraSelection = camera[camModeValue]
+    processorSelection = processor[camModeValue]
+
+    if (profileName is None):
+        camFps = cameraSelection.fps.rate()
+    else:
+        camFps = cameraSelection.profileFps[profileName].rate()
+    procFps = processorSelection.fps.rate()
+    procBusy = processorSelection.busy.rate()
+
+    cv2.putText(img,"{:.1f}".format(camFps),(0,20),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
+    if (procFps != 0.0):
+        cv2.putText(img,"{:.1f}".format(procFps) + " : {:.0f}".format(100 * procBusy) + "%",(0,40),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
+    cv2.putText(img,"{:.1f}".format(camStream.fps.rate()),(0,60),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
+
+    cv2.putText(img,camModeValue,(0, 80),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
+    cv2.putText(img,processorSelection.ipselection,(0,100),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
+
+def streamOverlay(key, frame):
+    # Processed frames carry their own overlay; camera frames get the
+    # latest detections drawn on them
+    (camModeValue, profileName, live) = key
+    if (live == True):
+        return processor[camModeValue].overlay
+    return frame.overlay
+
+def frameOverlay(key, frame):
+    return frame.overlay
+
+camStream = MjpegBroadcaster("CamStream", selectStream, annotateStream, overlay=streamOverlay,
+                             rateControl=RateController("CamStream", STREAM_TARGET_KBPS, bvTable)).start()
+
+# Cheaper and rawer variants for dashboards; each broadcaster only reads and
+# encodes while someone is watching it, and is shared by all who are
+streams = [('/cam_small.mjpg', MjpegBroadcaster("CamSmallStream", selectStream, scale=0.5, overlay=streamOverlay).start()),
+           ('/cam_gray.mjpg', MjpegBroadcaster("CamGrayStream", selectStream, gray=True, overlay=streamOverlay).start()),
+           ('/raw.mjpg', MjpegBroadcaster("RawStream", selectRaw).start()),
+           ('/processed.mjpg', MjpegBroadcaster("ProcessedStream", selectProcessed, overlay=frameOverlay).start())]
+
+# ...and every camera by name (e.g., /frontCam.mjpg) no matter which is selected
+for cameraName in sorted(camera.keys()):
+    streams.append(('/' + cameraName + '.mjpg',
+                    MjpegBroadcaster(cameraName + "Stream",
+                                     lambda cameraName=cameraName: (cameraName, camera[cameraName].read)).start()))
+
+# Anything else ending in .mjpg is the driver stream (i.e., /cam.mjpg)
+streams.append(('.mjpg', camStream))
+
+def indexPage():
+    links = ['<a href="' + path + '">' + path + '</a><br/>' for (path, stream) in streams if path.startswith('/')]
+    return ('<html><head></head><body>' +
+            '<img src="/cam.mjpg"/><br/>' +
+            ''.join(links) +
+            '</body></html>')
+
+def statsPage():
+    return json.dumps({'metrics' : registry.snapshot(),
+                       'stages' : frametrace.ring.summary()}, allow_nan=False)
 
 # Two steps to starting the HTTP service
-# first instantiate the sevice with a handler for the HTTP GET
+# first instantiate the sevice with the streams and pages it serves
 # then place the serve_forever call into a thread so we don't block here
 print("Waiting for CamServer to start...")
 
@@ -284,7 +369,27 @@ call(cmd,shell=True)
 cmd = ['sudo iptables -t nat -A PREROUTING -i wlan0 -p tcp --dport 80 -j REDIRECT --to-port 8080']
 call(cmd,shell=True)
 
-camHttpServer = HTTPServer(('',8080),CamHTTPHandler)
+# Per stage frame latency percentiles are computed when /metrics is scraped
+registry.addCollector(frametrace.ring.collect)
+
+# One event loop thread serves every viewer and page (see streamserver.py)
+camHttpServer = StreamServer(('',8080))
+for (path, stream) in streams:
+    camHttpServer.addStream(path, stream)
+
+# Counters, rates and latency histograms for Prometheus (or anything
+# else that reads its text format) and the same as JSON; these only
+# read the metrics so a scrape never slows down the frame path
+camHttpServer.addPage('/metrics', 'text/plain; version=0.0.4', registry.toPrometheus)
+camHttpServer.addPage('/stats.json', 'application/json', statsPage)
+
+# Latency of the most recent frames, as Chrome trace-event JSON
+# (chrome://tracing) or as per stage percentiles
+camHttpServer.addPage('/trace.json', 'application/json', lambda: json.dumps(frametrace.ring.toChromeTrace()))
+camHttpServer.addPage('/latency.json', 'application/json', lambda: json.dumps(frametrace.ring.summary(), allow_nan=False))
+
+camHttpServer.addPage(lambda path: (path.endswith('.html') or path == '/'), 'text/html', indexPage)
+
 camServer = BucketServer("CamServer", camHttpServer).start()
 
 while (camServer.isStopped() == True):
@@ -297,6 +402,13 @@ runTime = 0
 bvTable.putNumber("BucketVisionTime",runTime)
 nextTime = time.time() + 1
 
+# Camera profile of each front camera mode; exposure tuned from the keyboard
+# ('z'/'c') replaces the profile of the mode it was tuned in, so it stays in
+# effect and comes back when the mode is selected again
+frontCamModeProfiles = {'gearLift' : frontCamGearProfile,
+                        'Boiler' : frontCamNormalProfile}
+lastFrontCamMode = None
+
 while (True):
 
     if (time.time() > nextTime):
@@ -304,12 +416,22 @@ while (True):
         runTime = runTime + 1
         bvTable.putNumber("BucketVisionTime",runTime)
 
-    if (frontCamMode.value == 'gearLift'):
+    camStream.rateControl.updateTarget(streamTargetKbps.value)
+
+    # When interleaving, both profiles are always being captured so only
+    # the pipeline selection changes; otherwise the camera profile is only
+    # requested when the mode changes (each request is a new generation
+    # and costs the settle frames)
+    mode = frontCamMode.value
+    if (mode == 'gearLift'):
         frontProcessor.updateSelection('gearLift')
-        frontCam.updateExposure(FRONT_CAM_GEAR_EXPOSURE)
-    elif (frontCamMode.value == 'Boiler'):
+    elif (mode == 'Boiler'):
         frontProcessor.updateSelection(alliance.value + "Boiler")
-        frontCam.updateExposure(FRONT_CAM_NORMAL_EXPOSURE)
+    if ((FRONT_CAM_INTERLEAVE == False) and (mode != lastFrontCamMode) and (mode in frontCamModeProfiles)):
+        if (lastFrontCamMode is not None):
+            frontCamModeProfiles[lastFrontCamMode] = frontCam.profile
+        frontCam.updateProfile(frontCamModeProfiles[mode])
+        lastFrontCamMode = mode
 
     # Monitor network tables for commands to relay to processors and servers
     key = cv2.waitKey(100)
@@ -322,7 +444,16 @@ while (True):
 
 #stop the bucket server and processors
 
-frontProcessor.stop()      # stop this first to make the server exit
+for (path, stream) in streams:
+    stream.stop()           # stop these first to make the stream clients exit
+
+print("Waiting for MjpegBroadcasters to stop...")
+for (path, stream) in streams:
+    while (stream.isStopped() == False):
+        time.sleep(0.001)
+print("MjpegBroadcasters appear to have stopped.")
+
+frontProcessor.stop()
 
 
 print("Waiting for BucketProcessors to stop...")
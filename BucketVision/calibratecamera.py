@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+calibratecamera
+
+Calibrate a camera from views of a chessboard and save the calibration
+for the pipelines (see calibration.py)
+
+Frames come from any FrameSource (a live camera, a video file, or a
+directory or glob of stills); every frame in which the whole board is found
+is used, up to --views of them, so for a live camera just move the board
+around the field of view (corners and edges especially) while this runs.
+The board is given by its inner corners (--columns x --rows) and the
+reprojection error is printed; under half a pixel is good.
+
+Usage:
+    python calibratecamera.py [--source 0] [--columns 9] [--rows 6] [--views 30] [--output frontCamCalibration.json]
+
+Copyright (c) 2017 - RocketRedNeck.com RocketRedNeck.net
+
+RocketRedNeck and MIT Licenses
+
+RocketRedNeck hereby grants license for others to copy and modify this source code for
+whatever purpose other's deem worthy as long as RocketRedNeck is given credit where
+where credit is due and you leave RocketRedNeck out of it for all other nefarious purposes.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+****************************************************************************************************
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+from calibration import Calibration
+from framesource import openSource
+from framesource import PACE_FAST
+from framesource import ReplaySource
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chessboard camera calibration')
+    parser.add_argument('--source', default='0', help='camera index, directory, glob of stills or video file')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--columns', type=int, default=9, help='inner corners across the board')
+    parser.add_argument('--rows', type=int, default=6, help='inner corners down the board')
+    parser.add_argument('--views', type=int, default=30, help='board views to calibrate from')
+    parser.add_argument('--output', default='frontCamCalibration.json')
+    args = parser.parse_args()
+
+    src = args.source
+    if (src.isdigit() == True):
+        src = int(src)
+    source = openSource(src)
+    source.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+    source.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+    if (isinstance(source, ReplaySource)):
+        # Each recorded view once, as fast as it decodes
+        source.loop = False
+        source.pacing = PACE_FAST
+
+    # The board in its own plane, one unit per square; the scale does not
+    # matter for the intrinsics
+    board = np.zeros((args.rows * args.columns, 3), np.float32)
+    board[:,:2] = np.mgrid[0:args.columns, 0:args.rows].T.reshape(-1, 2)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+    objectPoints = []
+    imagePoints = []
+    size = None
+    while (len(imagePoints) < args.views):
+        (grabbed, frame) = source.read()
+        if (grabbed == False):
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        size = (gray.shape[1], gray.shape[0])
+        (found, corners) = cv2.findChessboardCorners(gray, (args.columns, args.rows), None)
+        if (found == False):
+            continue
+        corners = cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1), criteria)
+        objectPoints.append(board)
+        imagePoints.append(corners)
+        print("View " + str(len(imagePoints)) + " of " + str(args.views))
+
+    if (len(imagePoints) < 3):
+        print("Only " + str(len(imagePoints)) + " views of the board; need at least 3")
+    else:
+        (error, cameraMatrix, distCoeffs, rvecs, tvecs) = cv2.calibrateCamera(objectPoints, imagePoints, size, None, None)
+        calibration = Calibration(cameraMatrix, distCoeffs, size[0], size[1])
+        calibration.save(args.output)
+        print("Reprojection error " + "{:.3f}".format(error) + " pixels over " + str(len(imagePoints)) + " views")
+        print("Field of view " + "{:.1f}".format(calibration.hfov_deg()) + " degrees across, saved to " + args.output)
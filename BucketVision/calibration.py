@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+calibration
+
+Calibrated camera intrinsics, with the pixel to angle conversion and the
+undistortion precomputed as lookup tables
+
+Without a calibration the pipelines take the angle of a target as linear
+in its column (see camerageometry.py), which is only right near the middle
+of the frame; a wide lens bends the edges, and the error there is degrees.
+Calibration holds the camera matrix and distortion coefficients (as
+cv2.calibrateCamera() gives them, see calibratecamera.py) and when it is
+made computes, once:
+
+    * bearingTable, the angle of every column off the optical axis (positive
+      right) along the row through the principal point
+    * elevationTable, the angle of every row (positive up) along the column
+      through the principal point
+    * bearingMap and elevationMap, the same for every pixel
+    * the cv2.remap() tables that undistort a whole frame
+
+so bearing_deg(x) and elevation_deg(y) are a table read and a linear
+interpolation between neighboring entries, with no per frame undistortion
+of points or images. The per column and per row tables are exact on the
+center lines of the frame, but a lens that bends the corners bends them in
+x and y together: with k1 = -0.35 the bearing of a corner pixel is some 2
+degrees off. Given the other coordinate as well, bearing_deg(x, y) and
+elevation_deg(y, x) read the pixel maps instead (nearest row or column,
+interpolated along it), which are right everywhere.
+
+Calibrations are saved as JSON:
+
+    {"width": 320, "height": 240,
+     "cameraMatrix": [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+     "distCoeffs": [k1, k2, p1, p2, k3]}
+
+and scaled() adapts one to another resolution of the same camera.
+"""
+
+import json
+
+import cv2
+import numpy as np
+
+class Calibration:
+    def __init__(self, cameraMatrix, distCoeffs, width, height):
+        self.cameraMatrix = np.array(cameraMatrix, np.float64).reshape(3, 3)
+        self.distCoeffs = np.array(distCoeffs, np.float64).reshape(-1)
+        self.width = int(width)
+        self.height = int(height)
+
+        # Undistorted (normalized) image coordinates of every column along
+        # the principal row, every row along the principal column and then
+        # every pixel
+        cx = self.cameraMatrix[0, 2]
+        cy = self.cameraMatrix[1, 2]
+        columns = np.arange(self.width, dtype=np.float64)
+        rows = np.arange(self.height, dtype=np.float64)
+        (u, v) = np.meshgrid(columns, rows)
+        points = np.concatenate((np.column_stack((columns, np.full(self.width, cy))),
+                                 np.column_stack((np.full(self.height, cx), rows)),
+                                 np.column_stack((u.reshape(-1), v.reshape(-1)))))
+        normalized = cv2.undistortPoints(points.reshape(-1, 1, 2), self.cameraMatrix, self.distCoeffs).reshape(-1, 2)
+        (x, y) = (normalized[:,0], normalized[:,1])
+
+        # Bearing in the horizontal plane of the camera, elevation above it
+        bearing = np.degrees(np.arctan(x))
+        elevation = np.degrees(np.arctan2(-y, np.hypot(x, 1.0)))
+
+        # Lists, not arrays, since they are read a value at a time
+        self.bearingTable = bearing[:self.width].tolist()
+        self.elevationTable = elevation[self.width:self.width + self.height].tolist()
+        pixels = self.width + self.height
+        self.bearingMap = bearing[pixels:].reshape(self.height, self.width).astype(np.float32)
+        self.elevationMap = elevation[pixels:].reshape(self.height, self.width).astype(np.float32)
+
+        (self.mapX, self.mapY) = cv2.initUndistortRectifyMap(self.cameraMatrix, self.distCoeffs, None, self.cameraMatrix,
+                                                             (self.width, self.height), cv2.CV_16SC2)
+
+    def bearing_deg(self, x, y=None):
+        # Angle of column x (fractional) right of the optical axis, on row
+        # y if given
+        if (y is None):
+            return lookup(self.bearingTable, x)
+        row = min(max(int(round(y)), 0), self.height - 1)
+        return float(lookup(self.bearingMap[row], x))
+
+    def elevation_deg(self, y, x=None):
+        # Angle of row y (fractional) above the optical axis, in column x if
+        # given
+        if (x is None):
+            return lookup(self.elevationTable, y)
+        column = min(max(int(round(x)), 0), self.width - 1)
+        return float(lookup(self.elevationMap[:, column], y))
+
+    def hfov_deg(self):
+        # Across the middle row, edge to edge
+        return self.bearingTable[-1] - self.bearingTable[0]
+
+    def undistort(self, image, out=None):
+        return cv2.remap(image, self.mapX, self.mapY, cv2.INTER_LINEAR, out)
+
+    def scaled(self, width, height):
+        # The same camera at another resolution; the focal lengths and
+        # principal point scale with the image (pixel edges, not centers,
+        # stay put) and the distortion does not change
+        sx = float(width) / self.width
+        sy = float(height) / self.height
+        m = self.cameraMatrix.copy()
+        m[0, 0] *= sx
+        m[1, 1] *= sy
+        m[0, 2] = (m[0, 2] + 0.5) * sx - 0.5
+        m[1, 2] = (m[1, 2] + 0.5) * sy - 0.5
+        return Calibration(m, self.distCoeffs, width, height)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'width' : self.width,
+                       'height' : self.height,
+                       'cameraMatrix' : self.cameraMatrix.tolist(),
+                       'distCoeffs' : self.distCoeffs.tolist()}, f, indent=4)
+
+def lookup(table, position):
+    # Linear interpolation of table at a fractional index, held at the ends
+    last = len(table) - 1
+    if (position <= 0):
+        return table[0]
+    if (position >= last):
+        return table[last]
+    i = int(position)
+    return table[i] + (position - i) * (table[i + 1] - table[i])
+
+def loadCalibration(path):
+    # Calibration saved in path, or None (with a message) if there is none
+    try:
+        with open(path) as f:
+            values = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        print("No camera calibration from " + str(path) + ": " + str(e))
+        return None
+    return Calibration(values['cameraMatrix'], values['distCoeffs'], values['width'], values['height'])
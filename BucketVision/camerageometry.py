@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+camerageometry
+
+Resolution and field of view of a camera, so that pipelines tuned at one
+resolution measure the same at any other
+
+The pipelines were tuned on 320x240 frames. Their size cutoffs, contour
+areas and power law distance fits are in pixels of a 320 wide frame, and
+their angles came from x / 320 times a field of view written into each
+pipeline (31.6 for half of it in one, 63.2 for all of it in another), so
+a camera opened at any other size silently gave wrong answers.
+
+CameraGeometry keeps the field of view as a property of the camera and
+takes the resolution from the frames themselves:
+
+    geometry.fit(source0.shape)         every frame; nothing to do unless the size changed
+    geometry.fromReference(160)         a size tuned at 320 wide, in pixels of this frame
+    geometry.toReference(deltaX)        a size measured in this frame, as the fits expect it
+    geometry.fromReferenceArea(20)      a tuned area, in square pixels of this frame
+    geometry.centerFraction(x)          -1 at the left edge, 0 in the middle, 1 at the right
+    geometry.bearing_deg(x, y)          angle of column x off the middle of the frame
+    geometry.elevation_deg(y, x)        angle of row y, positive up
+
+so 160x120 can be run for speed or 640x480 for range without touching
+the pipelines. Sizes scale with the width only; the frames are assumed
+to keep the 4:3 shape of the camera (square pixels).
+
+fit() changes the geometry in place, so one CameraGeometry should only be
+shared by pipelines run from the same thread (those of one BucketProcessor).
+
+Without a calibration, angles are linear in x and y as the pipelines have
+always computed them. With one (see calibration.py) they are read from its
+per column and per row tables, which follow the lens out to the edges; the
+calibration is scaled to the frame size by fit() when that changes, and the
+field of view is then the calibrated one.
+"""
+
+# Resolution the pipeline constants were tuned at
+REFERENCE_WIDTH = 320
+
+# Horizontal field of view of the front camera, approximately and
+# empirically determined
+FRONT_CAM_HFOV_DEG = 63.2
+
+class CameraGeometry:
+    def __init__(self, hfov_deg=FRONT_CAM_HFOV_DEG, width=320, height=240, calibration=None):
+        self.hfov_deg = hfov_deg
+        self.calibration = calibration  # as calibrated, at any resolution
+        self.calibrated = None          # scaled to the current resolution
+        self.width = None
+        self.height = None
+        self.fit((height, width))
+
+    def fit(self, shape):
+        # Resolution of the frames from now on, from the shape of one
+        (height, width) = shape[:2]
+        if ((width == self.width) and (height == self.height)):
+            return self
+        self.width = width
+        self.height = height
+        self.centerX = width / 2.0
+        self.centerY = height / 2.0
+        self.scale = float(width) / REFERENCE_WIDTH     # pixels here per reference pixel
+        if (self.calibration is not None):
+            self.calibrated = self.calibration
+            if ((width != self.calibration.width) or (height != self.calibration.height)):
+                self.calibrated = self.calibration.scaled(width, height)
+            self.hfov_deg = self.calibrated.hfov_deg()
+        return self
+
+    def fromReference(self, pixels):
+        return pixels * self.scale
+
+    def toReference(self, pixels):
+        return pixels / self.scale
+
+    def fromReferenceArea(self, area):
+        return area * self.scale * self.scale
+
+    def centerFraction(self, x):
+        return ((2.0 * x) / self.width) - 1.0
+
+    def bearing_deg(self, x, y=None):
+        # y, where known, only matters to a calibrated lens
+        if (self.calibrated is not None):
+            return self.calibrated.bearing_deg(x, y)
+        return self.hfov_deg / 2 * self.centerFraction(x)
+
+    def elevation_deg(self, y, x=None):
+        # Square pixels, so the vertical field of view follows the shape
+        if (self.calibrated is not None):
+            return self.calibrated.elevation_deg(y, x)
+        return self.hfov_deg / 2 * (1.0 - (2.0 * y) / self.height) * self.height / self.width
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+contourfilter
+
+The GRIP Filter_Contours step for all pipelines, with the statistics of
+every contour computed at once instead of contour by contour
+
+The generated __filter_contours() called boundingRect(), contourArea(),
+arcLength() and convexHull() from Python for each contour in turn; on a
+noisy frame with hundreds of blobs that loop was most of the processing
+time. Here the points of all contours are stacked into one array and the
+bounding boxes, areas (shoelace formula, as contourArea()), perimeters
+(as arcLength(closed=True)), vertex counts and width/height ratios come out
+of a handful of NumPy reductions over it. The filters are applied to those
+arrays together, and only then is the (expensive) convex hull computed,
+for the contours that survived, and only if the solidity bounds can reject
+anything at all (i.e., not the [0, 100] every pipeline uses now).
+
+contourStats() returns the statistics as a structured array (one record
+per contour, see STATS); filterContours() keeps exactly the contours the
+GRIP step kept, in the same order, and returns their records with them.
+"""
+
+import cv2
+import numpy as np
+
+STATS = np.dtype([('x', np.int32),          # bounding box, as boundingRect()
+                  ('y', np.int32),
+                  ('w', np.int32),
+                  ('h', np.int32),
+                  ('area', np.float64),
+                  ('perimeter', np.float64),
+                  ('vertices', np.int32),
+                  ('ratio', np.float64),    # w / h
+                  ('solidity', np.float64)])  # percent; NaN where not computed
+
+def contourStats(contours):
+    stats = np.zeros(len(contours), STATS)
+    if (len(contours) == 0):
+        return stats
+
+    lengths = np.array([len(c) for c in contours])
+    starts = np.zeros(len(contours), np.intp)
+    starts[1:] = np.cumsum(lengths)[:-1]
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    x = points[:,0]
+    y = points[:,1]
+
+    # Each point's successor around its own contour (the last wraps to the
+    # first) for the edges of the closed polygons
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    nextX = x[following]
+    nextY = y[following]
+
+    left = np.minimum.reduceat(x, starts)
+    top = np.minimum.reduceat(y, starts)
+    stats['x'] = left
+    stats['y'] = top
+    stats['w'] = np.maximum.reduceat(x, starts) - left + 1
+    stats['h'] = np.maximum.reduceat(y, starts) - top + 1
+    stats['area'] = 0.5 * np.abs(np.add.reduceat(x * nextY - nextX * y, starts))
+    stats['perimeter'] = np.add.reduceat(np.hypot(nextX - x, nextY - y), starts)
+    stats['vertices'] = lengths
+    stats['ratio'] = stats['w'].astype(np.float64) / stats['h']
+    stats['solidity'] = float('NaN')
+    return stats
+
+def filterContours(contours, minArea, minPerimeter, minWidth, maxWidth,
+                   minHeight, maxHeight, solidity, maxVertexCount, minVertexCount,
+                   minRatio, maxRatio):
+    # Same arguments and result as the GRIP __filter_contours(), plus the
+    # statistics of the contours kept: (contours, stats)
+    stats = contourStats(contours)
+    keep = ((stats['w'] >= minWidth) & (stats['w'] <= maxWidth) &
+            (stats['h'] >= minHeight) & (stats['h'] <= maxHeight) &
+            (stats['area'] >= minArea) &
+            (stats['perimeter'] >= minPerimeter) &
+            (stats['vertices'] >= minVertexCount) & (stats['vertices'] <= maxVertexCount) &
+            (stats['ratio'] >= minRatio) & (stats['ratio'] <= maxRatio))
+    survivors = np.flatnonzero(keep)
+
+    # Solidity is 100 * area / hull area, always within [0, 100]
+    if ((solidity[0] > 0) or (solidity[1] < 100)):
+        for i in survivors:
+            hullArea = cv2.contourArea(cv2.convexHull(contours[i]))
+            solid = 100 * stats['area'][i] / hullArea
+            stats['solidity'][i] = solid
+            if (solid < solidity[0] or solid > solidity[1]):
+                keep[i] = False
+        survivors = np.flatnonzero(keep)
+
+    return ([contours[i] for i in survivors], stats[survivors])
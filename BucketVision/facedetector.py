@@ -42,7 +42,7 @@ import time
 
 # import our classes
 
-from framerate import FrameRate
+from metrics import registry
 
 from bucketcapture import BucketCapture     # Camera capture threads... may rename this
 from imageprocessor import ImageProcessor   # Image processing threads... has same basic structure (may merge classes)
@@ -113,8 +113,9 @@ while (bucketProcessor.isStopped() == True):
 print("ImageProcessors appear online!")
 
 # Continue feeding display or streams in foreground told to stop
-fps = FrameRate()   # Keep track of display rate  TODO: Thread that too!
-fps.start()
+fps = registry.meter('display_frames')   # Keep track of display rate  TODO: Thread that too!
+
+lastCount = 0
 
 # Loop forever displaying the images for initial testing
 #
@@ -130,19 +131,27 @@ fps.start()
 #
 while (True):
     # grab the frame from the image processor
-    (bucketFrame, count, isNew) = bucketProcessor.read()
+    (frame, count, isNew) = bucketProcessor.read(lastCount)
+    lastCount = count
 
     # check to see if the frame should be displayed to our screen
     # For now, just show every new frame
     if (isNew == True):
-         camFps = bucketCam.fps.fps()
-         procFps = bucketProcessor.fps.fps()
-         procDuration = bucketProcessor.duration.duration()
+         # Draw on a private copy; the pooled frame buffer is shared with
+         # the other readers and goes back to the pool right away
+         bucketFrame = frame.image.copy()
+         overlay = frame.overlay
+         frame.release()
+         if (overlay is not None):
+             overlay.draw(bucketFrame)
+         camFps = bucketCam.fps.rate()
+         procFps = bucketProcessor.fps.rate()
+         procBusy = bucketProcessor.busy.rate()
 
          cv2.putText(bucketFrame,"{:.1f}".format(camFps),(0,40),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
          if (procFps != 0.0):
-             cv2.putText(bucketFrame,"{:.1f}".format(procFps) + " : {:.0f}".format(100 * procDuration * procFps) + "%",(0,80),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
-         cv2.putText(bucketFrame,"{:.1f}".format(fps.fps()),(0,120),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
+             cv2.putText(bucketFrame,"{:.1f}".format(procFps) + " : {:.0f}".format(100 * procBusy) + "%",(0,80),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
+         cv2.putText(bucketFrame,"{:.1f}".format(fps.rate()),(0,120),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
 
          cv2.imshow("bucketCam", bucketFrame)
 
@@ -154,7 +163,7 @@ while (True):
     # update the display FPS counter (in this case it will be roughly the rate of the slowest pipeline because
     # we are displaying both pipelines in the same thread (again because I just don't feel like messing
     # with the extra steps to make X11 behave
-    fps.update()
+    fps.mark()
 
 
 # NOTE: NOTE: NOTE:
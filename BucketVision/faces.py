@@ -1,6 +1,8 @@
 import cv2
 import numpy
 
+from overlay import Overlay
+
 class Faces:
     """
     An OpenCV pipeline created to find faces
@@ -11,20 +13,23 @@ class Faces:
         """
         self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
         self.eye_cascade = cv2.CascadeClassifier('haarcascade_eye.xml')        
+        self.overlay = None
 
     def process(self, source0):
         """
         Runs the pipeline and sets all outputs to new values.
         """
         img = source0
+        overlay = Overlay(img.shape)
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
         for (x,y,w,h) in faces:
-            cv2.rectangle(img,(x,y),(x+w,y+h),(255,0,0),2)
+            overlay.rectangle((x,y),(x+w,y+h),(255,0,0),2)
             roi_gray = gray[y:y+h, x:x+w]
-            roi_color = img[y:y+h, x:x+w]
             eyes = self.eye_cascade.detectMultiScale(roi_gray)
             for (ex,ey,ew,eh) in eyes:
-                cv2.rectangle(roi_color,(ex,ey),(ex+ew,ey+eh),(0,255,0),2)
+                # Eyes are found in the face, so offset them by it
+                overlay.rectangle((x+ex,y+ey),(x+ex+ew,y+ey+eh),(0,255,0),2)
 
+        self.overlay = overlay
         return img
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+framemailbox
+
+Single slot "latest frame" mailbox with a monotonically increasing sequence
+number for handing frames from one producer thread to any number of
+consumer threads.
+
+The producer never blocks: put() swaps a single (frame, seq) tuple reference,
+which is atomic under the interpreter lock, and only touches the condition
+when somebody is actually waiting. A consumer that already knows the last
+sequence number it handled calls read(afterSeq) and gets the newest frame
+immediately if one has arrived since, otherwise it sleeps until the next put()
+(or the optional timeout). Because the sequence number is returned with the
+frame, a slow consumer can tell exactly how many frames it skipped.
+
+NOTE: On Python 2 a Condition.wait() WITH a timeout is implemented as a
+polling loop with sleeps of up to 50 ms; wait without a timeout (the default)
+blocks on the lock directly and wakes as soon as the frame is posted.
+"""
+
+import time
+
+from threading import Condition
+
+class FrameMailbox:
+    def __init__(self):
+        # The slot is replaced as a whole so readers always see a matched pair
+        self._slot = (None, 0)
+        self._condition = Condition()
+        self._waiters = 0
+        self._wakeups = 0
+
+    def put(self, frame):
+        # Only one thread may call put() for a given mailbox
+        seq = self._slot[1] + 1
+        self._slot = (frame, seq)
+
+        # Readers register as waiters under the condition and then re-check
+        # the slot, so checking the count after the swap cannot lose a wakeup
+        if (self._waiters > 0):
+            self._condition.acquire()
+            self._condition.notifyAll()
+            self._condition.release()
+
+        return seq
+
+    def peek(self):
+        # Return the current (frame, seq) without waiting
+        return self._slot
+
+    def seq(self):
+        return self._slot[1]
+
+    def read(self, afterSeq=0, timeout=None):
+        # Return (frame, seq, isNew) where isNew is True when seq > afterSeq
+        # isNew is False when the timeout expired or wake() was called
+        (frame, seq) = self._slot
+        if (seq > afterSeq):
+            return (frame, seq, True)
+
+        if (timeout is not None):
+            deadline = time.time() + timeout
+
+        self._condition.acquire()
+        self._waiters += 1
+        try:
+            wakeups = self._wakeups
+            while True:
+                (frame, seq) = self._slot
+                if (seq > afterSeq):
+                    return (frame, seq, True)
+                if (wakeups != self._wakeups):
+                    return (frame, seq, False)
+
+                if (timeout is None):
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if (remaining <= 0.0):
+                        return (frame, seq, False)
+                    self._condition.wait(remaining)
+        finally:
+            self._waiters -= 1
+            self._condition.release()
+
+    def wake(self):
+        # Release every blocked reader (e.g., when the producer is stopping)
+        self._condition.acquire()
+        self._wakeups += 1
+        self._condition.notifyAll()
+        self._condition.release()
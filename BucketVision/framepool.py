@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+framepool
+
+Fixed-size pool of preallocated, reference-counted frame buffers
+
+The capture thread decodes each frame straight into a free buffer from the
+pool (VideoCapture.read(image=...)) instead of letting OpenCV allocate a new
+array per frame. Every stage that holds on to a frame (processor, stream
+server, recorder, ...) owns one reference; the buffer goes back to the pool
+only when the last reference is released, so memory is bounded no matter
+how fast frames arrive and there is no per-frame garbage to collect.
+
+Buffers are handed between threads through a FrameMailbox. Because the
+mailbox slot itself owns a reference, a reader must take its own reference
+before the producer replaces the slot and drops the old one; readRetained()
+does that safely.
+"""
+
+import numpy as np
+
+from threading import Lock
+
+class FrameBuffer:
+    def __init__(self, pool, index, shape, dtype):
+        self.pool = pool
+        self.index = index
+        self.image = np.empty(shape, dtype)
+        self.count = 0          # capture count of the frame in this buffer
+        self.generation = 0     # camera profile generation that produced it
+        self.profile = None     # name of that camera profile
+        self.trace = None       # FrameTrace of the frame (see frametrace.py)
+        self.overlay = None     # what its pipeline found (see overlay.py)
+        self._refs = 0
+
+    def retain(self):
+        # Add a reference to a buffer the caller already holds
+        self.pool._lock.acquire()
+        self._refs += 1
+        self.pool._lock.release()
+        return self
+
+    def release(self):
+        # Drop a reference; the last one returns the buffer to the pool
+        self.pool._lock.acquire()
+        self._refs -= 1
+        if (self._refs == 0):
+            if ((self.trace is not None) and (self.pool.ring is not None)):
+                self.pool.ring.add(self.trace)
+            self.trace = None
+            self.overlay = None
+            self.pool._free.append(self)
+        self.pool._lock.release()
+
+    def retainIf(self, mailbox, seq):
+        # Add a reference only if this buffer is still posted as seq in the
+        # mailbox; the producer drops the slot reference after replacing the
+        # slot and doing so needs the pool lock, so the check is race free
+        self.pool._lock.acquire()
+        try:
+            if ((self._refs > 0) and (mailbox.seq() == seq)):
+                self._refs += 1
+                return True
+            return False
+        finally:
+            self.pool._lock.release()
+
+    def refs(self):
+        return self._refs
+
+class FramePool:
+    def __init__(self, size, shape, dtype=np.uint8, ring=None):
+        # ring, if given, collects the trace of each frame as its buffer
+        # is recycled
+        self._lock = Lock()
+        self.ring = ring
+        self.shape = shape
+        self.dtype = dtype
+        self.buffers = [FrameBuffer(self, i, shape, dtype) for i in range(size)]
+        self._free = list(self.buffers)
+
+    def acquire(self):
+        # Take a free buffer with a single reference owned by the caller
+        # Returns None when every buffer is still held by some consumer
+        self._lock.acquire()
+        try:
+            if (self._free == []):
+                return None
+            buf = self._free.pop()
+            buf._refs = 1
+            return buf
+        finally:
+            self._lock.release()
+
+    def available(self):
+        return len(self._free)
+
+    def size(self):
+        return len(self.buffers)
+
+def readRetained(mailbox, afterSeq=0, timeout=None):
+    # Read a FrameBuffer from a mailbox and take a reference to it
+    # Returns (buffer, seq, isNew); when isNew is True the caller owns a
+    # reference and MUST call buffer.release() when done with it
+    while True:
+        (buf, seq, isNew) = mailbox.read(afterSeq, timeout)
+        if ((isNew == False) or (buf is None)):
+            return (None, seq, False)
+        if (buf.retainIf(mailbox, seq) == True):
+            return (buf, seq, True)
+        # The slot moved on between the read and the retain, so there is
+        # already a newer frame waiting; go around and take that one
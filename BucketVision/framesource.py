@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+framesource
+
+Pluggable frame sources for BucketCapture
+
+Every source looks like the subset of cv2.VideoCapture that BucketCapture
+uses (read, grab, retrieve, get, set, isOpened, release) so a live camera, a video
+file or a directory of still images (e.g., the redBoiler*ft*.jpg sets) can
+be fed through the same capture -> process -> serve chain.
+
+Replay sources decode every frame into memory once when they are created,
+so a benchmark measures the pipeline rather than JPEG decoding, and they can
+be paced in one of three ways:
+
+    PACE_REALTIME   deliver frames at fps, like a camera would
+    PACE_FAST       deliver frames as fast as they are asked for
+    PACE_STEP       deliver one frame per call to step()
+"""
+
+import cv2
+import glob
+import os
+import time
+
+import numpy as np
+
+from threading import Semaphore
+
+PACE_REALTIME = 'realtime'
+PACE_FAST = 'fast'
+PACE_STEP = 'step'
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.mjpg', '.mjpeg', '.mkv', '.mov')
+
+class FrameSource:
+    """
+    Base class; sources override read() and, as needed, get()/set()
+    """
+    def read(self, image=None):
+        return (False, None)
+
+    def grab(self):
+        # Sources that only override read() decode as they grab; the frame
+        # is kept for retrieve()
+        (grabbed, self._retrieved) = self.read()
+        return grabbed
+
+    def retrieve(self, image=None):
+        frame = getattr(self, '_retrieved', None)
+        self._retrieved = None
+        if (frame is None):
+            return (False, None)
+        if ((image is None) or (image.shape != frame.shape) or (image.dtype != frame.dtype)):
+            return (True, frame)
+        np.copyto(image, frame)
+        return (True, image)
+
+    def get(self, prop):
+        # OpenCV returns -1 for properties a backend does not support
+        return -1.0
+
+    def set(self, prop, value):
+        return False
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+class LiveSource(FrameSource):
+    """
+    A live camera (V4L2 on the Pi) through cv2.VideoCapture
+    """
+    def __init__(self, src):
+        self.src = src
+        self.capture = cv2.VideoCapture(src)
+
+    def read(self, image=None):
+        if (image is None):
+            return self.capture.read()
+        return self.capture.read(image=image)
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self, image=None):
+        if (image is None):
+            return self.capture.retrieve()
+        return self.capture.retrieve(image=image)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+class ReplaySource(FrameSource):
+    """
+    Replays a list of preloaded frames with the selected pacing
+    """
+    def __init__(self, frames, fps=30.0, pacing=PACE_REALTIME, loop=True):
+        if (len(frames) == 0):
+            raise ValueError("ReplaySource needs at least one frame")
+        self.frames = frames
+        self.fps = float(fps)
+        self.pacing = pacing
+        self.loop = loop
+        self.position = 0
+        self._width = None
+        self._height = None
+        self._nextTime = None
+        self._steps = Semaphore(0)
+        self._primed = False
+
+    def step(self, count=1):
+        # Release count frames to a PACE_STEP reader
+        for i in range(count):
+            self._steps.release()
+
+    def _pace(self):
+        # The very first read (BucketCapture uses it to size its buffers)
+        # is delivered immediately, even when stepping
+        if (self._primed == False):
+            self._primed = True
+            return
+        if (self.pacing == PACE_REALTIME):
+            now = time.time()
+            if (self._nextTime is None):
+                self._nextTime = now
+            delay = self._nextTime - now
+            if (delay > 0.0):
+                time.sleep(delay)
+            else:
+                # Fell behind; don't try to catch up with a burst
+                self._nextTime = now
+            self._nextTime += 1.0 / self.fps
+        elif (self.pacing == PACE_STEP):
+            self._steps.acquire()
+
+    def read(self, image=None):
+        if (self.grab() == False):
+            return (False, None)
+        return self.retrieve(image)
+
+    def grab(self):
+        # The frame is "grabbed" when it is due; retrieve() copies it out
+        if (self.position >= len(self.frames)):
+            if (self.loop == False):
+                return False
+            self.position = 0
+
+        self._pace()
+        self._current = self.frames[self.position]
+        self.position += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame = getattr(self, '_current', None)
+        if (frame is None):
+            return (False, None)
+        if (image is None):
+            return (True, frame.copy())
+        if ((image.shape != frame.shape) or (image.dtype != frame.dtype)):
+            return (True, frame.copy())
+        np.copyto(image, frame)
+        return (True, image)
+
+    def get(self, prop):
+        if (prop == cv2.CAP_PROP_FRAME_WIDTH):
+            return float(self.frames[0].shape[1])
+        if (prop == cv2.CAP_PROP_FRAME_HEIGHT):
+            return float(self.frames[0].shape[0])
+        if (prop == cv2.CAP_PROP_FPS):
+            return self.fps
+        if (prop == cv2.CAP_PROP_FRAME_COUNT):
+            return float(len(self.frames))
+        if (prop == cv2.CAP_PROP_POS_FRAMES):
+            return float(self.position)
+        return -1.0
+
+    def set(self, prop, value):
+        # Width and height resize the preloaded frames once so that stills
+        # of any size can stand in for the configured camera geometry
+        if (prop == cv2.CAP_PROP_FRAME_WIDTH):
+            self._width = int(value)
+        elif (prop == cv2.CAP_PROP_FRAME_HEIGHT):
+            self._height = int(value)
+        elif (prop == cv2.CAP_PROP_FPS):
+            self.fps = float(value)
+            return True
+        elif (prop == cv2.CAP_PROP_POS_FRAMES):
+            self.position = int(value)
+            return True
+        else:
+            return False
+
+        if ((self._width is not None) and (self._height is not None)):
+            size = (self._width, self._height)
+            self.frames = [f if (f.shape[1], f.shape[0]) == size
+                           else cv2.resize(f, size, interpolation=cv2.INTER_AREA)
+                           for f in self.frames]
+        return True
+
+class VideoFileSource(ReplaySource):
+    """
+    Every frame of a video file, decoded once up front
+    """
+    def __init__(self, path, fps=None, pacing=PACE_REALTIME, loop=True):
+        capture = cv2.VideoCapture(path)
+        if (fps is None):
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            if (fps <= 0.0):
+                fps = 30.0
+        frames = []
+        while True:
+            (grabbed, frame) = capture.read()
+            if (grabbed == False):
+                break
+            frames.append(frame)
+        capture.release()
+
+        self.path = path
+        ReplaySource.__init__(self, frames, fps, pacing, loop)
+
+class ImageDirectorySource(ReplaySource):
+    """
+    A set of still images (a directory or a glob pattern such as
+    'redBoiler*ft*.jpg'), decoded once up front in sorted order
+    """
+    def __init__(self, pattern, fps=30.0, pacing=PACE_REALTIME, loop=True):
+        if (os.path.isdir(pattern)):
+            pattern = os.path.join(pattern, '*.jpg')
+        self.paths = sorted(glob.glob(pattern))
+        frames = []
+        for path in self.paths:
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if (frame is not None):
+                frames.append(frame)
+
+        self.pattern = pattern
+        ReplaySource.__init__(self, frames, fps, pacing, loop)
+
+def openSource(src):
+    # Choose a source from what BucketCapture was given: an existing
+    # FrameSource, a video file, a directory or glob of stills, or
+    # anything else cv2.VideoCapture accepts (e.g., a device index)
+    if (isinstance(src, FrameSource)):
+        return src
+    if (isinstance(src, str)):
+        if (os.path.isdir(src) or glob.has_magic(src)):
+            return ImageDirectorySource(src)
+        if (os.path.splitext(src)[1].lower() in VIDEO_EXTENSIONS):
+            return VideoFileSource(src)
+    return LiveSource(src)
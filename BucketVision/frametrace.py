@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+frametrace
+
+End-to-end per-frame latency tracing
+
+Every captured frame carries a FrameTrace that collects monotonic time
+stamps as it moves down the bucket brigade: capture grab and retrieve
+(decode), processor start, each pipeline step, NetworkTables publish, JPEG
+encode and socket write.
+When the frame buffer goes back to the pool its trace is placed in a fixed
+size in-memory ring, which can be exported as Chrome trace-event JSON
+(load it in chrome://tracing) or summarized as p50/p95/p99 per stage.
+
+A frame is used by several consumers at once (the processor and every
+stream), so its stages are not one sequence and the stage marked just
+before another is often some other consumer's. Each stage is instead
+measured from a fixed predecessor (see PREDECESSORS): the processor and
+the streams from 'retrieve', each pipeline step from the step before it on
+the same thread. Stages a consumer marks for itself, such as the encode
+and write of each stream, are marked with that consumer as their lane,
+e.g., mark('jpeg_encode', 'CamStream') records 'CamStream/jpeg_encode',
+and are measured from their predecessor in the same lane if it has one.
+
+Pipelines do not need to know about frames; the processor makes the trace
+of the frame being processed current for its thread and the pipeline just
+calls frametrace.mark('step name'), or frametrace.captureTime() for when
+the frame it is working on was grabbed.
+"""
+
+import json
+import os
+import threading
+import time
+
+def _monotonicClock():
+    # time.monotonic() is Python 3 only; on Python 2 (Linux) go straight
+    # to clock_gettime(CLOCK_MONOTONIC), falling back to wall clock time
+    if (hasattr(time, 'monotonic')):
+        return time.monotonic
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'libc.so.6', use_errno=True)
+        clock_gettime = librt.clock_gettime
+        CLOCK_MONOTONIC = 1
+        ts = timespec()
+        tsRef = ctypes.byref(ts)    # reused; ctypes call overhead dominates
+
+        def monotonic():
+            clock_gettime(CLOCK_MONOTONIC, tsRef)
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        monotonic()
+        return monotonic
+    except (OSError, AttributeError):
+        return time.time
+
+now = _monotonicClock()
+
+# Stage each stage is measured from; other stages (the pipeline steps)
+# are measured from the stage marked before them on the same thread
+PREDECESSORS = {'retrieve' : 'grab',
+                'process_start' : 'retrieve',
+                'jpeg_encode' : 'retrieve',
+                'socket_write' : 'jpeg_encode'}
+
+def laneStage(stage, lane=None):
+    # Name a stage is recorded under in a consumer's lane
+    if (lane is None):
+        return stage
+    return lane + '/' + stage
+
+class FrameTrace:
+    def __init__(self, count):
+        self.count = count
+        self.stages = []    # (stage, time, thread name) in the order marked
+
+    def mark(self, stage, lane=None):
+        self.stages.append((laneStage(stage, lane), now(), threading.current_thread().name))
+
+    def markOnce(self, stage, lane=None):
+        # For stages that may happen more than once per frame in a lane
+        # (e.g., each client of a stream writing it) record only the first
+        stage = laneStage(stage, lane)
+        for s in self.stages:
+            if (s[0] == stage):
+                return
+        self.stages.append((stage, now(), threading.current_thread().name))
+
+    def time(self, stage):
+        # When the stage was first marked, or None if it was not
+        for s in self.stages:
+            if (s[0] == stage):
+                return s[1]
+        return None
+
+    def steps(self):
+        # [(stage, start, end, thread)] with start the time of the stage's
+        # predecessor (see PREDECESSORS), or None if it has none
+        result = []
+        for i in range(len(self.stages)):
+            (stage, t, thread) = self.stages[i]
+            result.append((stage, self._predecessorTime(i), t, thread))
+        return result
+
+    def _predecessorTime(self, i):
+        (stage, t, thread) = self.stages[i]
+        parts = stage.rsplit('/', 1)
+        base = parts[-1]
+        if (base in PREDECESSORS):
+            # In the same lane if marked there, else the frame's own
+            predecessor = PREDECESSORS[base]
+            if (len(parts) == 2):
+                start = self.time(laneStage(predecessor, parts[0]))
+                if (start is not None):
+                    return start
+            return self.time(predecessor)
+        for j in range(i - 1, -1, -1):
+            if (self.stages[j][2] == thread):
+                return self.stages[j][1]
+        return None
+
+class TraceRing:
+    def __init__(self, size=1024):
+        self._lock = threading.Lock()
+        self._records = [None] * size
+        self._next = 0
+
+    def add(self, trace):
+        self._lock.acquire()
+        self._records[self._next % len(self._records)] = trace
+        self._next += 1
+        self._lock.release()
+
+    def records(self):
+        # Oldest first
+        self._lock.acquire()
+        size = len(self._records)
+        if (self._next <= size):
+            result = self._records[:self._next]
+        else:
+            start = self._next % size
+            result = self._records[start:] + self._records[:start]
+        self._lock.release()
+        return result
+
+    def clear(self):
+        self._lock.acquire()
+        self._records = [None] * len(self._records)
+        self._next = 0
+        self._lock.release()
+
+    def toChromeTrace(self):
+        # Each stage becomes a complete ("X") event spanning from its
+        # predecessor; times are in microseconds
+        events = []
+        tids = {}
+        for trace in self.records():
+            for (stage, start, t, thread) in trace.steps():
+                if (start is None):
+                    continue
+                tid = tids.setdefault(thread, len(tids) + 1)
+                events.append({'name' : stage,
+                               'cat' : 'frame',
+                               'ph' : 'X',
+                               'ts' : start * 1e6,
+                               'dur' : (t - start) * 1e6,
+                               'pid' : os.getpid(),
+                               'tid' : tid,
+                               'args' : {'frame' : trace.count}})
+        for (thread, tid) in tids.items():
+            events.append({'name' : 'thread_name', 'ph' : 'M', 'pid' : os.getpid(),
+                           'tid' : tid, 'args' : {'name' : thread}})
+        return {'traceEvents' : events, 'displayTimeUnit' : 'ms'}
+
+    def writeChromeTrace(self, path):
+        f = open(path, 'w')
+        try:
+            json.dump(self.toChromeTrace(), f)
+        finally:
+            f.close()
+
+    def summary(self, percentiles=(50, 95, 99)):
+        # Per stage: latency since the first stage of the frame (capture
+        # grab) and time since its predecessor, both in milliseconds; the
+        # step percentiles are left out of stages without a predecessor
+        # (the first), so the summary stays plain JSON
+        sinceStart = {}
+        sincePrevious = {}
+        order = []
+        for trace in self.records():
+            if (trace.stages == []):
+                continue
+            first = trace.stages[0][1]
+            for (stage, start, t, thread) in trace.steps():
+                if (stage not in sinceStart):
+                    order.append(stage)
+                    sinceStart[stage] = []
+                    sincePrevious[stage] = []
+                sinceStart[stage].append(1000.0 * (t - first))
+                if (start is not None):
+                    sincePrevious[stage].append(1000.0 * (t - start))
+
+        result = []
+        for stage in order:
+            entry = {'stage' : stage, 'count' : len(sinceStart[stage])}
+            for p in percentiles:
+                entry['p' + str(p)] = _percentile(sinceStart[stage], p)
+                if (sincePrevious[stage] != []):
+                    entry['step_p' + str(p)] = _percentile(sincePrevious[stage], p)
+            result.append(entry)
+        return result
+
+    def collect(self, percentiles=(50, 95, 99)):
+        # The summary as Prometheus families for Registry.addCollector(),
+        # in seconds: latency since grab and time spent in each stage
+        latency = []
+        step = []
+        for entry in self.summary(percentiles):
+            for p in percentiles:
+                labels = {'stage' : entry['stage'], 'quantile' : str(p / 100.0)}
+                latency.append(('bucketvision_frame_latency_seconds', labels, entry['p' + str(p)] / 1000.0))
+                if (('step_p' + str(p)) in entry):
+                    step.append(('bucketvision_frame_step_seconds', labels, entry['step_p' + str(p)] / 1000.0))
+        return [('bucketvision_frame_latency_seconds', 'summary', 'Time from capture grab to each stage of the recent frames', latency),
+                ('bucketvision_frame_step_seconds', 'summary', 'Time from its predecessor to each stage of the recent frames', step)]
+
+def _percentile(values, p):
+    # values is never empty
+    ordered = sorted(values)
+    return ordered[int(round((p / 100.0) * (len(ordered) - 1)))]
+
+# Traces of all frames end up here when their buffers are recycled
+ring = TraceRing()
+
+_current = threading.local()
+
+def setCurrent(trace):
+    # Make trace the one mark() adds to from this thread (None to clear)
+    _current.trace = trace
+
+def current():
+    return getattr(_current, 'trace', None)
+
+def mark(stage):
+    trace = getattr(_current, 'trace', None)
+    if (trace is not None):
+        trace.mark(stage)
+
+def captureTime():
+    # When the frame being processed on this thread was grabbed from the
+    # camera; now() if there is no trace (e.g., a pipeline run on its own)
+    trace = getattr(_current, 'trace', None)
+    if (trace is not None):
+        t = trace.time('grab')
+        if (t is not None):
+            return t
+    return now()
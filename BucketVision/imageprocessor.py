@@ -1,29 +1,26 @@
 
-from threading import Lock
 from threading import Thread
-from threading import Condition
 
-from framerate import FrameRate
-from frameduration import FrameDuration
+from framemailbox import FrameMailbox
+from framepool import readRetained
+from frametrace import now
+from metrics import registry
 
 class ImageProcessor:
     def __init__(self,stream,ip):
         print("Creating ImageProcessor for " + stream.name)
-        self._lock = Lock()
-        self._condition = Condition()
-        self.fps = FrameRate()
-        self.duration = FrameDuration()
+        self._mailbox = FrameMailbox()
         self.stream = stream
         self.ip = ip
+        labels = {'camera' : self.stream.name}
+        self.fps = registry.meter('bucketvision_processor_frames', 'Frames processed', labels)
+        self.duration = registry.histogram('bucketvision_processor_seconds', 'Time to process a frame', labels)
+        # Seconds spent processing per second, i.e., the duty cycle
+        self.busy = registry.meter('bucketvision_processor_busy_seconds', 'Time spent processing frames', labels)
 
-        (self._frame, self.count, self.isNew) = self.stream.read()
-
-        if (self.isNew == True):
-            self.count = 1
-            self.frame = self._frame
-        else:
-            self.frame = None
-            self.count = 0
+        self._frame = None
+        self._published = None
+        self.skipped = registry.counter('bucketvision_processor_skipped_frames', 'Frames superseded before they were read', labels)
         
         # initialize the variable used to indicate if the thread should
         # be stopped
@@ -43,7 +40,8 @@ class ImageProcessor:
         print("ImageProcessor for " + self.stream.name + " RUNNING")
         # keep looping infinitely until the thread is stopped
         self.stopped = False
-        self.fps.start()
+
+        lastCount = 0
         
         while True:
             # if the thread indicator variable is set, stop the thread
@@ -54,50 +52,49 @@ class ImageProcessor:
 
             # otherwise, read the next frame from the stream
             # grab the frame from the threaded video stream
-            (self._frame, count, isNew) = self.stream.read()
-            self.duration.start()
-            self.fps.update()
+            (self._frame, count, isNew) = self.stream.read(lastCount)
 
             if (isNew == True):
+                # Frames that arrived while we were busy are simply
+                # superseded; keep count so the loss is visible
+                if (lastCount != 0):
+                    self.skipped.inc(count - lastCount - 1)
+                lastCount = count
+
                 # TODO: Insert processing code then forward display changes
-                self.ip.process(self._frame)
-                
-                # Now that image processing is complete, place results
-                # into an outgoing buffer to be grabbed at the convenience
-                # of the reader
-                self._condition.acquire()
-                self._lock.acquire()
-                self.count = self.count + 1
-                self.isNew = isNew
-                self.frame = self._frame
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
+                start = now()
+                self.ip.process(self._frame.image)
+                elapsed = now() - start
+                self.duration.observe(elapsed)
+                self.busy.mark(elapsed)
+                self.fps.mark()
 
-            self.duration.update()
+                # The pipeline left the image alone; what it wants drawn
+                # goes along with the frame
+                self._frame.overlay = getattr(self.ip, 'overlay', None)
+                
+                # Now that image processing is complete, post results
+                # to the outgoing mailbox to be grabbed at the convenience
+                # of the reader; our reference to the frame buffer moves
+                # to the mailbox slot and the previous one is let go
+                self._mailbox.put(self._frame)
+                if (self._published is not None):
+                    self._published.release()
+                self._published = self._frame
                 
         print("ImageProcessor for " + self.stream.name + " STOPPING")
 
-    def read(self):
-        # return the frame most recently processed if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def read(self, afterCount=0, timeout=None):
+        # return the most recently processed frame if its count is newer
+        # than afterCount, otherwise wait for the next one (or the timeout)
+        # When isNew is True the caller owns a reference to the returned
+        # FrameBuffer (use .image for the pixels) and MUST release() it
+        return readRetained(self._mailbox, afterCount, timeout)
           
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self._mailbox.wake()
 
     def isStopped(self):
         return self.stopped
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+metrics
+
+Thread-safe counters, gauges, rate meters and fixed-bucket latency
+histograms, kept in a registry that any number of readers can snapshot
+
+Replaces FrameRate and FrameDuration, which computed their result by
+resetting their counters when read; with two readers (e.g., two stream
+clients, or the overlay and a logger) each one stole the other's samples.
+Here only writers ever change a metric, so reads have no side effects,
+and the histograms keep the shape of the distribution so tail latency
+(p95, p99) is visible rather than just the mean.
+
+Recording sits in the per-frame hot path, so it takes no lock: each thread
+that writes a metric gets its own shard of it (found through a thread
+local) that only that thread modifies, and readers add the shards up. A
+reader may catch a sample half recorded, which is fine for monitoring.
+Shards of threads that have exited (e.g., HTTP request threads) are folded
+into a single retired shard when the metric is next read.
+
+Metrics are created (or found) by name and labels, e.g.,
+
+    fps = metrics.registry.meter('bucketvision_capture_frames',
+                                 'Frames captured', {'camera' : 'FrontCam'})
+    fps.mark()
+    fps.rate()
+
+and the whole registry can be exported in the Prometheus text format with
+registry.toPrometheus() or as JSON friendly dicts with registry.snapshot().
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from threading import current_thread
+from threading import local
+import time
+
+from frametrace import now
+
+# Meters only need elapsed time over windows of about a second, so on
+# Python 2 they use the wall clock rather than frametrace.now, which costs
+# about a microsecond there (a ctypes call)
+if (hasattr(time, 'monotonic')):
+    _meterClock = time.monotonic
+else:
+    _meterClock = time.time
+
+# Upper bounds in seconds; sized around a 30 fps (33 ms) frame period
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.010, 0.020, 0.033,
+                   0.050, 0.075, 0.100, 0.200, 0.500, 1.0, float('inf'))
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help='', labels=None):
+        self.name = name
+        self.help = help
+        if (labels is None):
+            labels = {}
+        self.labels = labels
+        self._lock = Lock()         # guards the list of shards only
+        self._local = local()
+        self._shards = []           # (thread, shard) per writing thread
+        self._retired = self._newShard()
+
+    def _newShard(self):
+        return [0]
+
+    def _mergeShard(self, into, shard):
+        for i in range(len(shard)):
+            into[i] += shard[i]
+
+    def _addShard(self):
+        # First write from this thread
+        shard = self._newShard()
+        with self._lock:
+            self._shards.append((current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def families(self):
+        # Prometheus families as (name, type, help, [(sample, labels, value)])
+        return []
+
+    def _labels(self, extra=None):
+        if (extra is None):
+            return self.labels
+        labels = dict(self.labels)
+        labels.update(extra)
+        return labels
+
+    def _collect(self):
+        # The retired shard followed by the shards of live writers
+        with self._lock:
+            live = []
+            for (thread, shard) in self._shards:
+                if (thread.is_alive() == True):
+                    live.append((thread, shard))
+                else:
+                    self._mergeShard(self._retired, shard)
+            self._shards = live
+            return [self._retired] + [shard for (thread, shard) in live]
+
+class Counter(Metric):
+    """
+    A count that only goes up (frames dropped, clients served, ...)
+    """
+    kind = 'counter'
+
+    def inc(self, n=1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._addShard()
+        shard[0] += n
+
+    def value(self):
+        return sum([shard[0] for shard in self._collect()])
+
+    def snapshot(self):
+        return {'value' : self.value()}
+
+    def families(self):
+        name = self.name + '_total'
+        return [(name, 'counter', self.help, [(name, self.labels, self.value())])]
+
+class Gauge(Metric):
+    """
+    A value that is set rather than accumulated, or that is computed by a
+    function when read (e.g., free buffers in a pool)
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help='', labels=None):
+        Metric.__init__(self, name, help, labels)
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value):
+        # A single assignment; last writer wins
+        self._value = value
+
+    def setFunction(self, function):
+        self._function = function
+
+    def value(self):
+        if (self._function is not None):
+            return self._function()
+        return self._value
+
+    def snapshot(self):
+        return {'value' : self.value()}
+
+    def families(self):
+        return [(self.name, 'gauge', self.help, [(self.name, self.labels, self.value())])]
+
+# Meter shard fields
+_TOTAL = 0
+_WINDOW_START = 1
+_WINDOW_TOTAL = 2
+_RATE = 3
+
+class Meter(Metric):
+    """
+    Counts events and tracks their rate over a window (e.g., frames per
+    second); the writer closes each window as it marks, so reading the
+    rate never disturbs it
+    """
+    kind = 'meter'
+
+    def __init__(self, name, help='', labels=None, window=1.0):
+        self.window = window
+        Metric.__init__(self, name, help, labels)
+
+    def _newShard(self):
+        return [0, _meterClock(), 0, 0.0]
+
+    def _mergeShard(self, into, shard):
+        # Only the total outlives a thread; its rate is over
+        into[_TOTAL] += shard[_TOTAL]
+        into[_WINDOW_TOTAL] = into[_TOTAL]
+
+    def mark(self, n=1):
+        t = _meterClock()
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._addShard()
+        shard[_TOTAL] += n
+        elapsed = t - shard[_WINDOW_START]
+        if (elapsed >= self.window):
+            shard[_RATE] = (shard[_TOTAL] - shard[_WINDOW_TOTAL]) / elapsed
+            shard[_WINDOW_START] = t
+            shard[_WINDOW_TOTAL] = shard[_TOTAL]
+
+    def count(self):
+        return sum([shard[_TOTAL] for shard in self._collect()])
+
+    def rate(self):
+        # Events per second over the last complete window of each writer;
+        # once marks stop arriving the rate decays toward zero instead of
+        # holding forever
+        t = _meterClock()
+        rate = 0.0
+        for shard in self._collect()[1:]:
+            elapsed = t - shard[_WINDOW_START]
+            if (elapsed >= 2.0 * self.window):
+                rate += (shard[_TOTAL] - shard[_WINDOW_TOTAL]) / elapsed
+            else:
+                rate += shard[_RATE]
+        return rate
+
+    def snapshot(self):
+        return {'count' : self.count(), 'rate' : self.rate()}
+
+    def families(self):
+        total = self.name + '_total'
+        rate = self.name + '_rate'
+        return [(total, 'counter', self.help, [(total, self.labels, self.count())]),
+                (rate, 'gauge', self.help + ' per second', [(rate, self.labels, self.rate())])]
+
+class Histogram(Metric):
+    """
+    Counts observations (normally seconds) into fixed buckets; infinity is
+    added as the last bound if missing so every observation lands somewhere
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help='', labels=None, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(bounds))
+        if (self.bounds[-1] != float('inf')):
+            self.bounds += (float('inf'),)
+        Metric.__init__(self, name, help, labels)
+
+    def _newShard(self):
+        # A count per bucket followed by the sum of the observations
+        return [0] * len(self.bounds) + [0.0]
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._addShard()
+        shard[i] += 1
+        shard[-1] += value
+
+    def observeSince(self, start):
+        # For timing a section: start = frametrace.now() ... observeSince(start)
+        self.observe(now() - start)
+
+    def _totals(self):
+        totals = self._newShard()
+        for shard in self._collect():
+            self._mergeShard(totals, shard)
+        return totals
+
+    def count(self):
+        return sum(self._totals()[:-1])
+
+    def sum(self):
+        return self._totals()[-1]
+
+    def mean(self):
+        totals = self._totals()
+        count = sum(totals[:-1])
+        if (count == 0):
+            return 0.0
+        return totals[-1] / count
+
+    def buckets(self):
+        # [(upper bound, cumulative count)]
+        return self._cumulative(self._totals())
+
+    def _cumulative(self, totals):
+        result = []
+        total = 0
+        for (bound, count) in zip(self.bounds, totals):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def percentile(self, p):
+        return self._percentile(self.buckets(), p)
+
+    def _percentile(self, buckets, p):
+        # Estimated by interpolating within the bucket holding the p-th
+        # observation; values in the open-ended last bucket report its
+        # lower bound. None (null in JSON) when nothing was observed
+        total = buckets[-1][1]
+        if (total == 0):
+            return None
+        rank = (p / 100.0) * total
+        lower = 0.0
+        below = 0
+        for (bound, cumulative) in buckets:
+            if (cumulative >= rank):
+                if (bound == float('inf')):
+                    return lower
+                inBucket = cumulative - below
+                if (inBucket == 0):
+                    return bound
+                return lower + (bound - lower) * (rank - below) / inBucket
+            lower = bound
+            below = cumulative
+        return lower
+
+    def snapshot(self, percentiles=(50, 95, 99)):
+        # Everything computed from one pass over the shards
+        totals = self._totals()
+        buckets = self._cumulative(totals)
+        count = buckets[-1][1]
+        result = {'count' : count, 'sum' : totals[-1], 'mean' : 0.0}
+        if (count > 0):
+            result['mean'] = totals[-1] / count
+        for p in percentiles:
+            result['p' + str(p)] = self._percentile(buckets, p)
+        return result
+
+    def families(self):
+        totals = self._totals()
+        buckets = self._cumulative(totals)
+        samples = []
+        for (bound, cumulative) in buckets:
+            samples.append((self.name + '_bucket', self._labels({'le' : formatValue(bound)}), cumulative))
+        samples.append((self.name + '_sum', self.labels, totals[-1]))
+        samples.append((self.name + '_count', self.labels, buckets[-1][1]))
+        return [(self.name, 'histogram', self.help, samples)]
+
+class Registry:
+    """
+    Metrics by (name, labels); asking for an existing one returns it, so
+    every thread can look metrics up instead of passing them around
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        if (labels is None):
+            labels = {}
+        key = (name, tuple(sorted(labels.items())))
+        self._lock.acquire()
+        try:
+            metric = self._metrics.get(key)
+            if (metric is None):
+                metric = cls(name, help, dict(labels), **kwargs)
+                self._metrics[key] = metric
+            elif (metric.__class__ is not cls):
+                raise ValueError("Metric " + name + " is already a " + metric.kind)
+            return metric
+        finally:
+            self._lock.release()
+
+    def counter(self, name, help='', labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def meter(self, name, help='', labels=None, window=1.0):
+        return self._get(Meter, name, help, labels, window=window)
+
+    def histogram(self, name, help='', labels=None, bounds=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, bounds=bounds)
+
+    def remove(self, metric):
+        # Forget a metric that is no longer updated (e.g., of a client
+        # that has disconnected)
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        self._lock.acquire()
+        if (self._metrics.get(key) is metric):
+            del self._metrics[key]
+        self._lock.release()
+
+    def addCollector(self, collector):
+        # collector() returns extra families for toPrometheus() in the same
+        # form as Metric.families(), computed when scraped (e.g., the
+        # frame stage percentiles from frametrace)
+        self._collectors.append(collector)
+
+    def metrics(self):
+        # Sorted by name, then labels, so related series stay together
+        self._lock.acquire()
+        items = sorted(self._metrics.items())
+        self._lock.release()
+        return [metric for (key, metric) in items]
+
+    def snapshot(self):
+        result = []
+        for metric in self.metrics():
+            entry = {'name' : metric.name, 'kind' : metric.kind, 'labels' : metric.labels}
+            entry.update(metric.snapshot())
+            result.append(entry)
+        return result
+
+    def toPrometheus(self):
+        # Text exposition format (version 0.0.4); samples of a family are
+        # kept together under a single HELP and TYPE
+        order = []
+        families = {}
+        sources = [metric.families for metric in self.metrics()] + list(self._collectors)
+        for source in sources:
+            for (name, kind, help, samples) in source():
+                if (name not in families):
+                    order.append(name)
+                    families[name] = (kind, help, [])
+                lines = families[name][2]
+                for (sample, labels, value) in samples:
+                    lines.append(sample + formatLabels(labels) + ' ' + formatValue(value))
+
+        text = []
+        for name in order:
+            (kind, help, lines) = families[name]
+            if (help != ''):
+                text.append('# HELP ' + name + ' ' + help.replace('\\', '\\\\').replace('\n', '\\n'))
+            text.append('# TYPE ' + name + ' ' + kind)
+            text.extend(lines)
+        return '\n'.join(text) + '\n'
+
+def formatValue(value):
+    if (value == float('inf')):
+        return '+Inf'
+    if (value == float('-inf')):
+        return '-Inf'
+    if (value != value):
+        return 'NaN'
+    if (isinstance(value, float)):
+        return repr(value)
+    return str(value)
+
+def formatLabels(labels):
+    if (len(labels) == 0):
+        return ''
+    pairs = []
+    for (key, value) in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(key + '="' + value + '"')
+    return '{' + ','.join(pairs) + '}'
+
+# The process wide registry every thread registers into
+registry = Registry()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+mjpegbroadcaster
+
+Encode each streamed frame once and fan the bytes out to every viewer
+
+Before this, every .mjpg client ran its own read/annotate/encode loop, so
+N viewers cost N JPEG encodes per frame and drew N overlays on the shared
+frame buffer. The broadcaster thread reads the newest frame, annotates a
+private copy, encodes it and builds the complete multipart part (boundary,
+headers and JPEG) exactly once. Each client gets that part through its own
+short queue; when a client falls behind the OLDEST queued part is dropped
+so a slow driver station laptop only loses frames itself and never stalls
+the other viewers, the broadcaster or the processor.
+
+Nothing is read or encoded while there are no subscribers, so any number
+of variants of a stream (e.g., a thumbnail, a grayscale or a raw camera
+feed) can be offered as separate broadcasters and only the ones someone is
+watching cost anything. scale and gray make the private copy smaller or
+single channel before it is annotated and encoded.
+
+The stream source is chosen per frame by select(), which returns a key
+naming the source (counts restart when it changes) and a read function
+with the BucketProcessor.read() signature; annotate(image, key), if given,
+draws on the private copy before encoding. Before that, overlay(key,
+frame), if given, returns the Overlay (see overlay.py) to draw on the copy,
+usually the frame's own; so the detections are rasterized only for streams
+someone is watching, once per frame per stream, and never onto the shared
+frame buffer.
+
+With a RateController (see ratecontrol.py) the frame rate, output scale
+and JPEG quality follow its settings to hold the stream under a bitrate.
+"""
+
+import cv2
+import numpy as np
+
+from collections import deque
+from threading import Condition
+from threading import Event
+from threading import Thread
+
+import frametrace
+from metrics import registry
+
+BOUNDARY = '--jpgboundary'
+
+# Everything in a part's header but the length, formatted once
+PART_HEADER = (BOUNDARY + '\r\n' +
+               'Content-type: image/jpeg\r\n' +
+               'Content-length: ').encode('ascii')
+PART_TRAILER = b'\r\n'
+
+# Seconds to wait for a source frame before checking for stop()
+READ_TIMEOUT = 0.5
+
+class MjpegClient:
+    """
+    Bounded drop-oldest queue of encoded parts for one viewer
+
+    A thread per client can block in get(); an event loop instead passes a
+    notify function, called (from the broadcaster thread) after every put,
+    and takes parts with poll()
+    """
+    def __init__(self, name, depth=2, notify=None, stream=None):
+        self.name = name
+        self._parts = deque()
+        self._depth = depth
+        self._condition = Condition()
+        self._closed = False
+        self._notify = notify
+        self._stream = stream   # MjpegBroadcaster totals, if any
+
+        labels = {'client' : name}
+        self.fps = registry.meter('bucketvision_stream_client_frames', 'Frames sent to a stream client', labels)
+        self.bytes = registry.meter('bucketvision_stream_client_bytes', 'Bytes sent to a stream client', labels)
+        self.dropped = registry.counter('bucketvision_stream_client_dropped_frames', 'Frames dropped for a slow stream client', labels)
+
+    def put(self, part):
+        # Called by the broadcaster; never blocks
+        self._condition.acquire()
+        if (len(self._parts) >= self._depth):
+            self._parts.popleft()
+            self.dropped.inc()
+            if (self._stream is not None):
+                self._stream.clientDrops.inc()
+        self._parts.append(part)
+        self._condition.notify()
+        self._condition.release()
+        if (self._notify is not None):
+            self._notify()
+
+    def get(self):
+        # Next part for this client, waiting as needed; None once closed
+        # NOTE: wait() without a timeout so Python 2 does not poll
+        self._condition.acquire()
+        try:
+            while ((len(self._parts) == 0) and (self._closed == False)):
+                self._condition.wait()
+            if (self._closed == True):
+                return None
+            return self._parts.popleft()
+        finally:
+            self._condition.release()
+
+    def poll(self):
+        # Next part if there is one, otherwise None; never blocks
+        self._condition.acquire()
+        try:
+            if (len(self._parts) == 0):
+                return None
+            return self._parts.popleft()
+        finally:
+            self._condition.release()
+
+    def isClosed(self):
+        return self._closed
+
+    def sent(self, part):
+        self.fps.mark()
+        self.bytes.mark(part.size)
+        if (self._stream is not None):
+            self._stream.sentBytes.mark(part.size)
+
+    def close(self):
+        self._condition.acquire()
+        self._closed = True
+        self._condition.notifyAll()
+        self._condition.release()
+        if (self._notify is not None):
+            self._notify()
+        registry.remove(self.fps)
+        registry.remove(self.bytes)
+        registry.remove(self.dropped)
+
+class MjpegPart:
+    """
+    One encoded frame, ready to be written as is to any client
+
+    The part is kept as buffers (header, JPEG, trailer) that are never
+    joined: the JPEG buffer is the encoder's output array itself, so the
+    bytes are not copied between imencode() and the socket. Write them in
+    order, e.g., with one sendmsg() call.
+    """
+    def __init__(self, count, buffers, trace, lane=None):
+        self.count = count
+        self.buffers = buffers  # memoryviews, shared read only by every client
+        self.size = sum([len(b) for b in buffers])
+        self.trace = trace
+        self.lane = lane        # trace lane of the stream (see frametrace.py)
+
+class MjpegBroadcaster:
+    def __init__(self, name, select, annotate=None, depth=2, rateControl=None, scale=1.0, gray=False, overlay=None):
+        print("Creating MjpegBroadcaster for " + name)
+        self.name = name
+        self.select = select
+        self.annotate = annotate
+        self.overlay = overlay
+        self.depth = depth
+        self.rateControl = rateControl
+        self.scale = scale      # output size relative to the source frames
+        self.gray = gray        # encode a single channel (about a third the bytes)
+
+        self._clients = []
+        self._hasClients = Event()
+        self._scratch = None
+        self._grayImage = None
+
+        labels = {'stream' : name}
+        self.fps = registry.meter('bucketvision_stream_frames', 'Frames encoded for streaming', labels)
+        self.encodeTime = registry.histogram('bucketvision_stream_encode_seconds', 'Time to annotate and JPEG encode a frame', labels)
+        self.skipped = registry.counter('bucketvision_stream_skipped_frames', 'Source frames superseded before they were encoded', labels)
+        self.throttled = registry.counter('bucketvision_stream_throttled_frames', 'Source frames not sent to hold the stream frame rate', labels)
+        self.sentBytes = registry.meter('bucketvision_stream_sent_bytes', 'Bytes written to all viewers of a stream', labels)
+        self.clientDrops = registry.counter('bucketvision_stream_client_drops', 'Parts dropped for slow viewers of a stream', labels)
+        registry.gauge('bucketvision_stream_clients', 'Connected stream clients', labels).setFunction(lambda: len(self._clients))
+
+        # initialize the variable used to indicate if the thread should
+        # be stopped
+        self._stop = False
+        self.stopped = True
+
+        print("MjpegBroadcaster created for " + self.name)
+
+    def start(self):
+        print("STARTING MjpegBroadcaster for " + self.name)
+        t = Thread(target=self.update, args=(), name=self.name + "Broadcaster")
+        t.daemon = True
+        t.start()
+        return self
+
+    def update(self):
+        print("MjpegBroadcaster for " + self.name + " RUNNING")
+        self.stopped = False
+
+        lastKey = None
+        lastCount = 0
+
+        while True:
+            if (self._stop == True):
+                self._stop = False
+                self.stopped = True
+                break
+
+            # Idle (and let the source frames go) while nobody is watching
+            if (len(self._clients) == 0):
+                self._hasClients.wait(0.5)
+                lastKey = None
+                continue
+
+            # Counts are per source, so start over when the source changes
+            (key, read) = self.select()
+            if (key != lastKey):
+                lastKey = key
+                lastCount = 0
+
+            # Wait for the next frame only so long, so stop() is noticed
+            # even when the source has stopped producing frames
+            (frame, count, isNew) = read(lastCount, READ_TIMEOUT)
+            if (isNew == False):
+                continue
+            if (lastCount != 0):
+                self.skipped.inc(count - lastCount - 1)
+            lastCount = count
+
+            if (self.rateControl is not None):
+                now = frametrace.now()
+                self.rateControl.adjust(now, self.sentBytes.count())
+                if (self.rateControl.ready(now) == False):
+                    frame.release()
+                    self.throttled.inc()
+                    continue
+
+            self.broadcast(self.encode(frame, key))
+
+        # Let the clients finish
+        for client in list(self._clients):
+            client.close()
+
+        print("MjpegBroadcaster for " + self.name + " STOPPING")
+
+    def encode(self, frame, key):
+        # Annotate a private copy so the shared frame buffer is never drawn
+        # on, release the buffer, then encode and frame the part
+        trace = frame.trace
+        start = frametrace.now()
+        scale = self.scale
+        params = []
+        if (self.rateControl is not None):
+            scale = scale * self.rateControl.scale()
+            params = [int(cv2.IMWRITE_JPEG_QUALITY), self.rateControl.quality()]
+
+        image = self.copy(frame.image, scale)
+        count = frame.count
+        overlay = None
+        if (self.overlay is not None):
+            overlay = self.overlay(key, frame)
+        frame.release()
+
+        if (overlay is not None):
+            overlay.draw(image)
+        if (self.annotate is not None):
+            self.annotate(image, key)
+        (r, jpeg) = cv2.imencode(".jpg", image, params)
+        if (trace is not None):
+            trace.markOnce('jpeg_encode', self.name)
+
+        # The JPEG array is flat and contiguous, so viewing it as bytes
+        # costs nothing
+        jpeg = memoryview(jpeg.reshape(-1))
+        header = PART_HEADER + str(len(jpeg)).encode('ascii') + b'\r\n\r\n'
+        part = MjpegPart(count, [memoryview(header), jpeg, memoryview(PART_TRAILER)], trace, self.name)
+        self.encodeTime.observeSince(start)
+        self.fps.mark()
+        return part
+
+    def copy(self, source, scale):
+        # Private copy of the source image at the output size and color;
+        # the conversion or downscale IS the copy, so it is one step each
+        if ((self.gray == True) and (len(source.shape) == 3)):
+            if ((self._grayImage is None) or (self._grayImage.shape != source.shape[:2])):
+                self._grayImage = np.empty(source.shape[:2], source.dtype)
+            cv2.cvtColor(source, cv2.COLOR_BGR2GRAY, self._grayImage)
+            if (scale == 1.0):
+                return self._grayImage
+            source = self._grayImage
+
+        (height, width) = source.shape[:2]
+        shape = (int(height * scale), int(width * scale)) + source.shape[2:]
+        if ((self._scratch is None) or (self._scratch.shape != shape)):
+            self._scratch = np.empty(shape, source.dtype)
+        if (scale == 1.0):
+            np.copyto(self._scratch, source)
+        else:
+            cv2.resize(source, (shape[1], shape[0]), self._scratch, 0, 0, cv2.INTER_AREA)
+        return self._scratch
+
+    def broadcast(self, part):
+        for client in list(self._clients):
+            client.put(part)
+
+    def subscribe(self, name, notify=None):
+        # Called from the client's own (HTTP request) thread or the server
+        # event loop; see MjpegClient for notify
+        client = MjpegClient(name, self.depth, notify, self)
+        self._clients.append(client)
+        self._hasClients.set()
+        return client
+
+    def unsubscribe(self, client):
+        client.close()
+        if (client in self._clients):
+            self._clients.remove(client)
+        if (len(self._clients) == 0):
+            self._hasClients.clear()
+
+    def stop(self):
+        # indicate that the thread should be stopped
+        self._stop = True
+        self._hasClients.set()
+
+    def isStopped(self):
+        return self.stopped
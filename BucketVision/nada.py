@@ -1,5 +1,7 @@
 import cv2
 
+from overlay import Overlay
+
 class Nada:
     """
     An OpenCV pipeline generated by GRIP.
@@ -8,6 +10,7 @@ class Nada:
     def __init__(self):
         """initializes all values to presets or None if need to be set
         """
+        self.overlay = None
 
     def process(self, source0):
         """
@@ -15,4 +18,7 @@ class Nada:
         """
         
         # Draw thin line down center of screen
-        cv2.line(source0,(320/2,0),(320/2,240),(0,255,0),1)
\ No newline at end of file
+        overlay = Overlay(source0.shape)
+        (rows, cols) = source0.shape[:2]
+        overlay.line((cols/2,0),(cols/2,rows),(0,255,0),1)
+        self.overlay = overlay
\ No newline at end of file
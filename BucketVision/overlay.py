@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+overlay
+
+What a pipeline wants drawn on the image, kept as a short list of vector
+primitives (lines, rotated boxes, circles, arrows, text) instead of pixels
+
+Pipelines never draw on the frame they are given: that buffer is shared
+with the capture thread and every other reader of the camera, and drawing
+costs time whether or not anybody is watching. Instead a pipeline records
+its boxes and reticles into a new Overlay for every frame it processes and
+publishes the finished one as self.overlay, e.g.,
+
+    overlay = Overlay(source0.shape)
+    overlay.box(rect, (0,255,0), 2)
+    overlay.circle((centerX, centerY), radius, color, 2)
+    ...
+    self.overlay = overlay
+
+The processor attaches it to the processed frame (FrameBuffer.overlay) and
+keeps the latest one. A published Overlay is never changed again, so any
+thread may draw() it onto any image from the same camera; in practice only
+the stream variants someone is watching do, once per frame each, on their
+own copy of the frame. The driver stream also uses this to send camera
+frames at capture rate with the latest detections drawn on each, however
+long the pipeline takes per frame.
+
+Coordinates may be floats; they are rounded to pixels only when drawn.
+Given the shape of the image they refer to, an Overlay scales itself to
+whatever size of image it is drawn on (e.g., a downscaled stream).
+"""
+
+import cv2
+import numpy as np
+
+class Overlay:
+    def __init__(self, shape=None):
+        self.shape = shape      # of the image the coordinates refer to
+        self.items = []
+
+    def line(self, pt1, pt2, color, thickness=1, lineType=cv2.LINE_8):
+        self.items.append(('line', pt1, pt2, color, thickness, lineType))
+
+    def arrowedLine(self, pt1, pt2, color, thickness=1):
+        self.items.append(('arrow', pt1, pt2, color, thickness))
+
+    def rectangle(self, pt1, pt2, color, thickness=1):
+        self.items.append(('rectangle', pt1, pt2, color, thickness))
+
+    def box(self, rect, color, thickness=1):
+        # A rotated rectangle ((x,y),(w,h),angle) as from cv2.minAreaRect()
+        self.items.append(('box', rect, color, thickness))
+
+    def circle(self, center, radius, color, thickness=1):
+        self.items.append(('circle', center, radius, color, thickness))
+
+    def polylines(self, points, closed, color, thickness=1, lineType=cv2.LINE_8):
+        self.items.append(('polylines', points, closed, color, thickness, lineType))
+
+    def text(self, text, org, color, scale=1, thickness=1):
+        self.items.append(('text', text, org, color, scale, thickness))
+
+    def draw(self, img):
+        # Rasterize every item onto img, scaled to its size
+        sx = 1.0
+        sy = 1.0
+        if (self.shape is not None):
+            sx = float(img.shape[1]) / self.shape[1]
+            sy = float(img.shape[0]) / self.shape[0]
+
+        # On a single channel image draw each color as its brightest part
+        # so the marks still stand out
+        gray = (len(img.shape) == 2)
+
+        def paint(color):
+            if (gray == True):
+                return max(color)
+            return color
+
+        def point(pt):
+            return (int(round(pt[0] * sx)), int(round(pt[1] * sy)))
+
+        def points(pts):
+            return np.int32(np.round(np.float32(pts) * (sx, sy)))
+
+        for item in self.items:
+            kind = item[0]
+            if (kind == 'line'):
+                cv2.line(img, point(item[1]), point(item[2]), paint(item[3]), item[4], item[5])
+            elif (kind == 'arrow'):
+                cv2.arrowedLine(img, point(item[1]), point(item[2]), paint(item[3]), item[4])
+            elif (kind == 'rectangle'):
+                cv2.rectangle(img, point(item[1]), point(item[2]), paint(item[3]), item[4])
+            elif (kind == 'box'):
+                cv2.polylines(img, [points(cv2.boxPoints(item[1]))], True, paint(item[2]), item[3])
+            elif (kind == 'circle'):
+                cv2.circle(img, point(item[1]), int(round(item[2] * sx)), paint(item[3]), item[4])
+            elif (kind == 'polylines'):
+                cv2.polylines(img, [points(item[1])], item[2], paint(item[3]), item[4], item[5])
+            elif (kind == 'text'):
+                cv2.putText(img, item[1], point(item[2]), cv2.FONT_HERSHEY_PLAIN, item[4], paint(item[3]), item[5])
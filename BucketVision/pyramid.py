@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+pyramid
+
+Coarse to fine thresholding: find where the candidate blobs are on a
+downscaled frame, then threshold only those regions at full resolution
+
+Most of a frame is not the target, yet every pixel of it is color
+converted and thresholded. CoarseToFine first shrinks the frame by factor
+(2 makes 320x240 into 160x120, a quarter of the pixels) and thresholds
+that. The rows with anything in them, padded by margin coarse pixels, form
+horizontal bands (targets and their reflections tend to sit in a few bands
+across the image) and each band is cut down to the columns its blobs span.
+Those regions are thresholded again at full resolution into a mask that
+is zero everywhere else, so contours found on it have the full resolution
+geometry:
+
+    mask = self.pyramid.mask(source0, lambda image: threshold.apply(image, ...))
+
+Bands rather than a box per blob keep the number of threshold calls to a
+handful however noisy the frame is; per call overhead, not pixels, is what
+a box per blob would cost at this resolution.
+
+The threshold function is called on the coarse frame and on views of the
+full frame, and must return a mask of whatever it is given; HslThreshold
+and RgbThreshold apply() do.
+
+Blobs too thin or too faint to survive the downscale are not found at all,
+and a blob that reaches out of its padded region is cut at the edge of it;
+benchpyramid.py measures how often that matters. When the regions add up
+to more than maxCoverage of the frame (a close, large target or a noisy
+frame) the whole frame is thresholded instead, and the next recheck frames
+go straight to that without the coarse pass, so the mode costs little more
+than the plain pipeline when it cannot help.
+"""
+
+import cv2
+import numpy as np
+
+class CoarseToFine:
+    def __init__(self, factor=2, margin=2, maxCoverage=0.5, recheck=4):
+        self.factor = factor
+        self.margin = margin            # padding of each region, in coarse pixels
+        self.maxCoverage = maxCoverage  # fraction of the frame
+        self.recheck = recheck          # whole frames before trying the coarse pass again
+
+        self.regions = []               # (left, top, right, bottom) of the last mask()
+        self._wholeFrames = 0
+        self._coarse = None
+        self._mask = None
+
+    def mask(self, source, threshold):
+        # Mask of source as threshold(source) would give it, but only
+        # within the regions around the blobs found on the coarse frame
+        (rows, cols) = source.shape[:2]
+        if ((self._mask is None) or (self._mask.shape != (rows, cols))):
+            self._mask = np.empty((rows, cols), np.uint8)
+
+        if (self._wholeFrames > 0):
+            self._wholeFrames -= 1
+            return self.whole(source, threshold)
+
+        f = self.factor
+        shape = (rows // f, cols // f) + source.shape[2:]
+        if ((self._coarse is None) or (self._coarse.shape != shape)):
+            self._coarse = np.empty(shape, source.dtype)
+        cv2.resize(source, (shape[1], shape[0]), self._coarse, 0, 0, cv2.INTER_AREA)
+        coarseMask = threshold(self._coarse)
+
+        # Rows of the coarse frame with anything in them; a new band starts
+        # wherever the gap to the previous such row is more than the two
+        # margins (NOTE: summing is much faster than REDUCE_MAX here)
+        margin = self.margin
+        rowHits = np.flatnonzero(cv2.reduce(coarseMask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).reshape(-1))
+        self.regions = []
+        if (len(rowHits) > 0):
+            breaks = np.flatnonzero(np.diff(rowHits) > 2 * margin + 1)
+            firsts = np.concatenate(([rowHits[0]], rowHits[breaks + 1]))
+            lasts = np.concatenate((rowHits[breaks], [rowHits[-1]]))
+            for (first, last) in zip(firsts.tolist(), lasts.tolist()):
+                columnHits = np.flatnonzero(cv2.reduce(coarseMask[first:last + 1], 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).reshape(-1))
+                self.regions.append((max(columnHits[0] - margin, 0) * f,
+                                     max(first - margin, 0) * f,
+                                     min((columnHits[-1] + 1 + margin) * f, cols),
+                                     min((last + 1 + margin) * f, rows)))
+
+        covered = sum([(x1 - x0) * (y1 - y0) for (x0, y0, x1, y1) in self.regions])
+        if (covered > self.maxCoverage * rows * cols):
+            self._wholeFrames = self.recheck
+            return self.whole(source, threshold)
+
+        self._mask.fill(0)
+        for (x0, y0, x1, y1) in self.regions:
+            np.copyto(self._mask[y0:y1, x0:x1], threshold(source[y0:y1, x0:x1]))
+        return self._mask
+
+    def whole(self, source, threshold):
+        (rows, cols) = source.shape[:2]
+        self.regions = [(0, 0, cols, rows)]
+        np.copyto(self._mask, threshold(source))
+        return self._mask
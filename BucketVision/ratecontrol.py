@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+ratecontrol
+
+Hold an MJPEG stream under a bitrate cap (e.g., the field radio limit)
+
+cv2.imencode(".jpg", img) with default settings produces whatever it
+produces; at 30 fps and 320x240 that can be several Mbit/s per viewer and
+the stream then competes with the NetworkTables traffic the robot needs.
+A RateController watches what the stream actually costs and walks a ladder
+of (JPEG quality, scale, frame rate) settings, ordered from best to
+cheapest, to keep the bits on the wire near a target:
+
+    * every interval it compares the bitrate actually written to the
+      viewers (all of them; they share the radio) with the target
+    * over the target steps down the ladder; far over steps down two
+    * comfortably under the target for a few intervals steps back up
+
+Only the bitrate moves the ladder. A viewer that cannot keep up loses
+frames from its own queue (see mjpegbroadcaster.py) and must not make the
+stream worse for everyone else, so parts dropped for slow viewers are not
+counted here.
+
+Quality goes first since it is the cheapest to give up, then resolution,
+and frame rate last because the driver notices that most.
+
+The current settings and the achieved bitrate are published to
+NetworkTables (if a table is given) as <name>Quality, <name>Scale,
+<name>Fps, <name>Kbps and <name>TargetKbps.
+"""
+
+from metrics import registry
+
+# (JPEG quality, scale, frames per second), best first
+LADDER = ((90, 1.0, 30),
+          (80, 1.0, 30),
+          (70, 1.0, 30),
+          (60, 1.0, 30),
+          (50, 1.0, 30),
+          (50, 0.75, 30),
+          (40, 0.75, 30),
+          (40, 0.75, 20),
+          (40, 0.5, 20),
+          (30, 0.5, 15),
+          (30, 0.5, 10),
+          (30, 0.5, 5))
+
+class RateController:
+    def __init__(self, name, targetKbps, table=None, ladder=LADDER, interval=0.5):
+        self.name = name
+        self.targetKbps = float(targetKbps)
+        self.table = table
+        self.ladder = ladder
+        self.interval = interval
+        self.level = 0
+        self.kbps = 0.0
+        self._underCount = 0
+        self._lastTime = None
+        self._lastSent = 0
+        self._nextFrame = 0.0
+
+        labels = {'stream' : name}
+        registry.gauge('bucketvision_stream_quality', 'JPEG quality chosen by the rate controller', labels).setFunction(self.quality)
+        registry.gauge('bucketvision_stream_scale', 'Output scale chosen by the rate controller', labels).setFunction(self.scale)
+        registry.gauge('bucketvision_stream_fps_limit', 'Frame rate chosen by the rate controller', labels).setFunction(self.fps)
+        registry.gauge('bucketvision_stream_kbps', 'Bitrate written to all viewers', labels).setFunction(lambda: self.kbps)
+        registry.gauge('bucketvision_stream_target_kbps', 'Bitrate the rate controller aims for', labels).setFunction(lambda: self.targetKbps)
+
+    def quality(self):
+        return self.ladder[self.level][0]
+
+    def scale(self):
+        return self.ladder[self.level][1]
+
+    def fps(self):
+        return self.ladder[self.level][2]
+
+    def updateTarget(self, targetKbps):
+        # e.g., from a NetworkTables value; takes effect next interval
+        self.targetKbps = float(targetKbps)
+
+    def ready(self, now):
+        # True when it is time for another frame at the current rate
+        if (now < self._nextFrame):
+            return False
+        period = 1.0 / self.fps()
+        # Stay on the frame rate grid but never try to catch up
+        self._nextFrame = max(self._nextFrame + period, now + 0.5 * period)
+        return True
+
+    def adjust(self, now, sentBytes):
+        # Called for every frame with the running total of bytes written
+        # to viewers; acts once per interval
+        if (self._lastTime is None):
+            self._lastTime = now
+            self._lastSent = sentBytes
+            return
+        elapsed = now - self._lastTime
+        if (elapsed < self.interval):
+            return
+
+        self.kbps = 8.0 * (sentBytes - self._lastSent) / elapsed / 1000.0
+        self._lastTime = now
+        self._lastSent = sentBytes
+
+        last = len(self.ladder) - 1
+        if ((self.kbps > 1.5 * self.targetKbps) and (self.level < last)):
+            self.level = min(self.level + 2, last)
+            self._underCount = 0
+        elif ((self.kbps > self.targetKbps) and (self.level < last)):
+            self.level += 1
+            self._underCount = 0
+        elif ((self.kbps < 0.7 * self.targetKbps) and (self.level > 0)):
+            # Several quiet intervals in a row before spending more, so we
+            # do not bounce between two levels
+            self._underCount += 1
+            if (self._underCount >= 4):
+                self.level -= 1
+                self._underCount = 0
+        else:
+            self._underCount = 0
+
+        self.publish()
+
+    def publish(self):
+        if (self.table is None):
+            return
+        self.table.putNumber(self.name + "Quality", self.quality())
+        self.table.putNumber(self.name + "Scale", self.scale())
+        self.table.putNumber(self.name + "Fps", self.fps())
+        self.table.putNumber(self.name + "Kbps", self.kbps)
+        self.table.putNumber(self.name + "TargetKbps", self.targetKbps)
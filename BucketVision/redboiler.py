@@ -2,14 +2,25 @@ import cv2
 import numpy as np
 import math
 
+from camerageometry import CameraGeometry
+from contourfilter import filterContours
+from overlay import Overlay
+from pyramid import CoarseToFine
+from threshold import HslThreshold
+
 class RedBoiler:
     """
     An OpenCV pipeline generated by GRIP.
     """
     
-    def __init__(self):
+    def __init__(self, pyramid=False, geometry=None):
         """initializes all values to presets or None if need to be set
         """
+        # The resolution is taken from each frame and the pixel constants
+        # below (tuned at 320x240) are scaled to it (see camerageometry.py)
+        if (geometry is None):
+            geometry = CameraGeometry()
+        self.geometry = geometry
 
         self.__resize_image_width = 320.0
         self.__resize_image_height = 240.0
@@ -24,6 +35,9 @@ class RedBoiler:
         self.__hsl_threshold_luminance = [73.38129496402877, 174.4965870307167]
         
         self.hsl_threshold_output = None
+        # Same threshold as __hsl_threshold(), through a precomputed lookup
+        # table where that is faster (see threshold.py)
+        self.__hsl_threshold_lut = HslThreshold(self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
 
         self.__find_contours_input = self.hsl_threshold_output
         self.__find_contours_external_only = False
@@ -44,19 +58,33 @@ class RedBoiler:
         self.__filter_contours_max_ratio = 1000.0
 
         self.filter_contours_output = None
+        self.filter_contours_stats = None
+
+        # Threshold only around the blobs found on a half size frame
+        # (see pyramid.py)
+        self.pyramid = None
+        if (pyramid == True):
+            self.pyramid = CoarseToFine()
+
+        self.overlay = None
 
 
     def process(self, source0):
         """
         Runs the pipeline and sets all outputs to new values.
         """
+        geometry = self.geometry.fit(source0.shape)
+
         # Step Resize_Image0:
         #self.__resize_image_input = source0
         #(self.resize_image_output) = self.__resize_image(self.__resize_image_input, self.__resize_image_width, self.__resize_image_height, self.__resize_image_interpolation)
 
         # Step HSL_Threshold0:
         self.__hsl_threshold_input = source0
-        (self.hsl_threshold_output) = self.__hsl_threshold(self.__hsl_threshold_input, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
+        if (self.pyramid is None):
+            (self.hsl_threshold_output) = self.__hsl_threshold_lut.apply(self.__hsl_threshold_input, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance)
+        else:
+            (self.hsl_threshold_output) = self.pyramid.mask(self.__hsl_threshold_input, lambda image: self.__hsl_threshold_lut.apply(image, self.__hsl_threshold_hue, self.__hsl_threshold_saturation, self.__hsl_threshold_luminance))
 
         # Step Find_Contours0:
         self.__find_contours_input = self.hsl_threshold_output
@@ -64,7 +92,7 @@ class RedBoiler:
 
         # Step Filter_Contours0:
         self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+        (self.filter_contours_output, self.filter_contours_stats) = filterContours(self.__filter_contours_contours, geometry.fromReferenceArea(self.__filter_contours_min_area), geometry.fromReference(self.__filter_contours_min_perimeter), geometry.fromReference(self.__filter_contours_min_width), geometry.fromReference(self.__filter_contours_max_width), geometry.fromReference(self.__filter_contours_min_height), geometry.fromReference(self.__filter_contours_max_height), self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
 
         # TODO: Optionally draw the contours for debug
         # For now, just uncomment as needed
@@ -77,17 +105,18 @@ class RedBoiler:
         # at some angle (i.e, not aligned to screen)
         # In either case we can use the information to identify
         # our intended target
+        overlay = Overlay(source0.shape)
         for cnt in self.filter_contours_output:
 
             x,y,w,h = cv2.boundingRect(cnt)
 
             rect = cv2.minAreaRect(cnt)
-            box = cv2.boxPoints(rect)
-            box = np.int0(box)
 
             #if (abs(rect[2]) < 5.0):
-            cv2.rectangle(source0,(x,y),(x+w,y+h),(255,0,0),2)  # draw straight in blue
-            cv2.drawContours(source0,[box],0,(0,0,255),2)   # draw rotated in red
+            overlay.rectangle((x,y),(x+w,y+h),(255,0,0),2)  # draw straight in blue
+            overlay.box(rect,(0,0,255),2)   # draw rotated in red
+
+        self.overlay = overlay
 
 
     @staticmethod
@@ -131,53 +160,9 @@ class RedBoiler:
         else:
             mode = cv2.RETR_LIST
         method = cv2.CHAIN_APPROX_SIMPLE
-        im2, contours, hierarchy =cv2.findContours(input, mode=mode, method=method)
+        # OpenCV 3 returns (image, contours, hierarchy), 2 and 4+ (contours, hierarchy)
+        contours = cv2.findContours(input, mode=mode, method=method)[-2]
         return contours
 
-    @staticmethod
-    def __filter_contours(input_contours, min_area, min_perimeter, min_width, max_width,
-                        min_height, max_height, solidity, max_vertex_count, min_vertex_count,
-                        min_ratio, max_ratio):
-        """Filters out contours that do not meet certain criteria.
-        Args:
-            input_contours: Contours as a list of numpy.ndarray.
-            min_area: The minimum area of a contour that will be kept.
-            min_perimeter: The minimum perimeter of a contour that will be kept.
-            min_width: Minimum width of a contour.
-            max_width: MaxWidth maximum width.
-            min_height: Minimum height.
-            max_height: Maximimum height.
-            solidity: The minimum and maximum solidity of a contour.
-            min_vertex_count: Minimum vertex Count of the contours.
-            max_vertex_count: Maximum vertex Count.
-            min_ratio: Minimum ratio of width to height.
-            max_ratio: Maximum ratio of width to height.
-        Returns:
-            Contours as a list of numpy.ndarray.
-        """
-        output = []
-        for contour in input_contours:
-            x,y,w,h = cv2.boundingRect(contour)
-            if (w < min_width or w > max_width):
-                continue
-            if (h < min_height or h > max_height):
-                continue
-            area = cv2.contourArea(contour)
-            if (area < min_area):
-                continue
-            if (cv2.arcLength(contour, True) < min_perimeter):
-                continue
-            hull = cv2.convexHull(contour)
-            solid = 100 * area / cv2.contourArea(hull)
-            if (solid < solidity[0] or solid > solidity[1]):
-                continue
-            if (len(contour) < min_vertex_count or len(contour) > max_vertex_count):
-                continue
-            ratio = (float)(w) / h
-            if (ratio < min_ratio or ratio > max_ratio):
-                continue
-            output.append(contour)
-        return output
-
 
 
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+roitracker
+
+Search window for a pipeline that has found its target: process only the
+part of the frame where the target should be next, not the whole frame
+
+Once the target has been verified it moves little from frame to frame, so
+most of the pixels thresholded and contoured in a full-frame search are
+known in advance to be of no interest. RoiTracker keeps a window around the
+predicted position of the target (the last position plus the last frame to
+frame motion), sized from the height of the target so it scales with the
+distance: the closer the robot gets, the larger the target and the window,
+and the further away, the cheaper each frame.
+
+A pipeline asks for the window before thresholding, works on that view of
+the frame and tells the tracker whether it found the target:
+
+    window = self.tracker.window(source0.shape)
+    if (window is not None):
+        (left, top, right, bottom) = window
+        source = source0[top:bottom, left:right]
+    ...
+    contours found with offset=(left, top), so in frame coordinates
+    ...
+    self.tracker.found(centerX, centerY, width, height)  or  self.tracker.missed()
+
+Contours are returned in frame coordinates (cv2.findContours() offset), so
+everything after them, published angles included, is unchanged. After
+maxMisses frames in a row without the target the window is dropped and
+the next frame is searched whole again.
+"""
+
+class RoiTracker:
+    def __init__(self, maxMisses=5, margin=1.0):
+        self.maxMisses = maxMisses
+        self.margin = margin            # padding on every side, in target heights
+
+        self.misses = 0
+        self.target = None              # (centerX, centerY, width, height)
+        self.motion = (0.0, 0.0)        # last frame to frame motion of the center
+        self.consecutive = False        # target found in the previous frame
+
+    def window(self, shape):
+        # Window (left, top, right, bottom) of an image of this shape to
+        # search, or None to search all of it
+        if (self.target is None):
+            return None
+
+        (centerX, centerY, width, height) = self.target
+        centerX += self.motion[0]
+        centerY += self.motion[1]
+        padding = self.margin * height
+        halfWidth = width / 2 + padding
+        halfHeight = height / 2 + padding
+
+        (rows, cols) = shape[:2]
+        left = max(0, int(centerX - halfWidth))
+        top = max(0, int(centerY - halfHeight))
+        right = min(cols, int(centerX + halfWidth) + 1)
+        bottom = min(rows, int(centerY + halfHeight) + 1)
+        if ((right <= left) or (bottom <= top)):
+            # Predicted off the image
+            return None
+        if ((left == 0) and (top == 0) and (right == cols) and (bottom == rows)):
+            return None
+        return (left, top, right, bottom)
+
+    def found(self, centerX, centerY, width, height):
+        # The target was found at this position and size (frame coordinates)
+        if ((self.target is not None) and (self.consecutive == True)):
+            self.motion = (centerX - self.target[0], centerY - self.target[1])
+        else:
+            self.motion = (0.0, 0.0)
+        self.target = (centerX, centerY, width, height)
+        self.consecutive = True
+        self.misses = 0
+
+    def missed(self):
+        # The target was not found; back to full frames after maxMisses
+        self.consecutive = False
+        self.motion = (0.0, 0.0)
+        self.misses += 1
+        if (self.misses >= self.maxMisses):
+            self.reset()
+
+    def reset(self):
+        self.target = None
+        self.misses = 0
+        self.motion = (0.0, 0.0)
+        self.consecutive = False
+
+    def isTracking(self):
+        return (self.target is not None)
@@ -1,5 +1,7 @@
 import cv2
 
+from overlay import Overlay
+
 class Rope:
     """
     An OpenCV pipeline created to find faces
@@ -8,6 +10,7 @@ class Rope:
     def __init__(self):
         """initializes all values to presets or None if need to be set
         """
+        self.overlay = None
      
 
     def process(self, source0):
@@ -23,12 +26,20 @@ class Rope:
         hi = 0
         wi = 1
 
-        pt1 = (40,240)
-        pt2 = (150,100)
-        cv2.line(source0,pt1,pt2,color,thickness,cv2.LINE_AA)
+        # Reticle laid out on a 320x240 frame, scaled to this one
+        sx = s[wi] / 320.0
+        sy = s[hi] / 240.0
+
+        overlay = Overlay(source0.shape)
+
+        pt1 = (40*sx,240*sy)
+        pt2 = (150*sx,100*sy)
+        overlay.line(pt1,pt2,color,thickness,cv2.LINE_AA)
         
-        pt1 = (280,240)
-        pt2 = (170,100)
+        pt1 = (280*sx,240*sy)
+        pt2 = (170*sx,100*sy)
         
-        cv2.line(source0,pt1,pt2,color,thickness,cv2.LINE_AA)
+        overlay.line(pt1,pt2,color,thickness,cv2.LINE_AA)
+
+        self.overlay = overlay
         
\ No newline at end of file
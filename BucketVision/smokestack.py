@@ -1,6 +1,8 @@
 import cv2
 import numpy
 import math
+from contourfilter import filterContours
+from threshold import RgbThreshold
 
 class SmokeStack:
     """
@@ -23,6 +25,9 @@ class SmokeStack:
         self.__rgb_threshold_blue = [89.4334532374101, 170.14505119453926]
 
         self.rgb_threshold_output = None
+        # Same threshold as __rgb_threshold() on the BGR frame as it comes,
+        # without converting it to RGB first (see threshold.py)
+        self.__rgb_threshold_direct = RgbThreshold()
 
         self.__find_contours_input = self.rgb_threshold_output
         self.__find_contours_external_only = True
@@ -43,6 +48,7 @@ class SmokeStack:
         self.__filter_contours_max_ratio = 1000.0
 
         self.filter_contours_output = None
+        self.filter_contours_stats = None
 
 
     def process(self, source0):
@@ -55,7 +61,7 @@ class SmokeStack:
 
         # Step RGB_Threshold0:
         self.__rgb_threshold_input = self.resize_image_output
-        (self.rgb_threshold_output) = self.__rgb_threshold(self.__rgb_threshold_input, self.__rgb_threshold_red, self.__rgb_threshold_green, self.__rgb_threshold_blue)
+        (self.rgb_threshold_output) = self.__rgb_threshold_direct.apply(self.__rgb_threshold_input, self.__rgb_threshold_red, self.__rgb_threshold_green, self.__rgb_threshold_blue)
 
         # Step Find_Contours0:
         self.__find_contours_input = self.rgb_threshold_output
@@ -63,7 +69,7 @@ class SmokeStack:
 
         # Step Filter_Contours0:
         self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+        (self.filter_contours_output, self.filter_contours_stats) = filterContours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
 
 
     @staticmethod
@@ -107,53 +113,9 @@ class SmokeStack:
         else:
             mode = cv2.RETR_LIST
         method = cv2.CHAIN_APPROX_SIMPLE
-        im2, contours, hierarchy =cv2.findContours(input, mode=mode, method=method)
+        # OpenCV 3 returns (image, contours, hierarchy), 2 and 4+ (contours, hierarchy)
+        contours = cv2.findContours(input, mode=mode, method=method)[-2]
         return contours
 
-    @staticmethod
-    def __filter_contours(input_contours, min_area, min_perimeter, min_width, max_width,
-                        min_height, max_height, solidity, max_vertex_count, min_vertex_count,
-                        min_ratio, max_ratio):
-        """Filters out contours that do not meet certain criteria.
-        Args:
-            input_contours: Contours as a list of numpy.ndarray.
-            min_area: The minimum area of a contour that will be kept.
-            min_perimeter: The minimum perimeter of a contour that will be kept.
-            min_width: Minimum width of a contour.
-            max_width: MaxWidth maximum width.
-            min_height: Minimum height.
-            max_height: Maximimum height.
-            solidity: The minimum and maximum solidity of a contour.
-            min_vertex_count: Minimum vertex Count of the contours.
-            max_vertex_count: Maximum vertex Count.
-            min_ratio: Minimum ratio of width to height.
-            max_ratio: Maximum ratio of width to height.
-        Returns:
-            Contours as a list of numpy.ndarray.
-        """
-        output = []
-        for contour in input_contours:
-            x,y,w,h = cv2.boundingRect(contour)
-            if (w < min_width or w > max_width):
-                continue
-            if (h < min_height or h > max_height):
-                continue
-            area = cv2.contourArea(contour)
-            if (area < min_area):
-                continue
-            if (cv2.arcLength(contour, True) < min_perimeter):
-                continue
-            hull = cv2.convexHull(contour)
-            solid = 100 * area / cv2.contourArea(hull)
-            if (solid < solidity[0] or solid > solidity[1]):
-                continue
-            if (len(contour) < min_vertex_count or len(contour) > max_vertex_count):
-                continue
-            ratio = (float)(w) / h
-            if (ratio < min_ratio or ratio > max_ratio):
-                continue
-            output.append(contour)
-        return output
-
 
 
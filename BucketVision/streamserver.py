@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+streamserver
+
+Single threaded, select() based HTTP server for the MJPEG streams and the
+small control/stat pages
+
+The BaseHTTPServer.HTTPServer we used handles one request at a time, so an
+open .mjpg stream blocked every other request; a thread per request fixes
+that but costs a thread (and its stack) per viewer on the Pi. Here one
+event loop thread multiplexes every connection with non-blocking sockets:
+requests are parsed as they arrive, pages are written and closed, and
+stream connections are subscribed to an MjpegBroadcaster and fed its
+encoded parts as fast as each socket drains. A viewer that cannot keep up
+only loses the oldest parts queued for it (see mjpegbroadcaster.py).
+
+The broadcaster thread wakes the loop after each part through a UDP socket
+on the loopback interface (portable, unlike a pipe, to select() on Windows).
+
+Parts are written without copying them: the header, JPEG and trailer
+buffers of a part go out together in one sendmsg() (scatter-gather) call
+straight from the encoder's output, and what a partial write leaves is
+resent through memoryview slices, not copies. Where there is no sendmsg()
+(Python 2, Windows) the buffers are sent one send() at a time, still
+without copies.
+
+It has serve_forever() and shutdown() like the SocketServer servers so it
+runs inside a BucketServer unchanged, e.g.,
+
+    server = StreamServer(('', 8080))
+    server.addStream('/cam.mjpg', broadcaster)
+    server.addPage('/metrics', 'text/plain', registry.toPrometheus)
+    BucketServer("CamServer", server).start()
+
+NOTE: Python 2 (as on the Pi); HTTP/1.0 style, one request per connection.
+"""
+
+import errno
+import select
+import socket
+
+from threading import Event
+
+import frametrace
+from metrics import registry
+from mjpegbroadcaster import BOUNDARY
+
+MAX_REQUEST = 8192
+
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+class Connection:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.name = address[0] + ':' + str(address[1])
+        self.request = b''
+        self.out = []           # memoryviews still to be written, in order
+        self.client = None      # MjpegClient, for stream connections
+        self.broadcaster = None
+        self.part = None        # MjpegPart being written
+        self.partStart = 0.0
+        self.closeWhenSent = False
+
+    def pending(self):
+        return (len(self.out) > 0)
+
+    def consume(self, sent):
+        # Drop what a write took from the front of out
+        while (sent > 0):
+            first = self.out[0]
+            if (sent < len(first)):
+                self.out[0] = first[sent:]
+                return
+            sent -= len(first)
+            self.out.pop(0)
+
+class StreamServer:
+    def __init__(self, address, backlog=16):
+        self.address = address
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(backlog)
+        self.listener.setblocking(False)
+        self.server_address = self.listener.getsockname()
+
+        self._waker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._waker.bind(('127.0.0.1', 0))
+        self._waker.setblocking(False)
+        self._wakeAddress = self._waker.getsockname()
+        self._wakeSender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._woken = False
+
+        self._routes = []
+        self._connections = {}  # socket -> Connection
+        self._shutdownRequest = False
+        self._isShutDown = Event()
+        self._isShutDown.set()
+
+        self.requests = registry.counter('bucketvision_http_requests', 'HTTP requests received')
+        self.writeTime = registry.histogram('bucketvision_stream_write_seconds', 'Time from taking a part to having written all of it to a client')
+        registry.gauge('bucketvision_http_connections', 'Open HTTP connections').setFunction(lambda: len(self._connections))
+
+    def addStream(self, match, broadcaster):
+        # match is a path suffix (or a function of the path)
+        self._routes.append((match, broadcaster, None))
+
+    def addPage(self, match, contentType, body):
+        # body() returns the page when requested
+        self._routes.append((match, contentType, body))
+
+    def _route(self, path):
+        for (match, target, body) in self._routes:
+            if (isinstance(match, str)):
+                if (path.endswith(match) == True):
+                    return (target, body)
+            elif (match(path) == True):
+                return (target, body)
+        return (None, None)
+
+    def wake(self):
+        # From any thread: have the loop look for new parts; only the first
+        # wake before the loop gets to it sends a datagram
+        if (self._woken == False):
+            self._woken = True
+            try:
+                self._wakeSender.sendto(b'!', self._wakeAddress)
+            except socket.error:
+                pass
+
+    def serve_forever(self):
+        self._isShutDown.clear()
+        try:
+            while (self._shutdownRequest == False):
+                readers = [self.listener, self._waker] + list(self._connections.keys())
+                writers = [c.sock for c in self._connections.values() if (c.pending() == True)]
+                try:
+                    (readable, writable, broken) = select.select(readers, writers, [], 0.5)
+                except (select.error, socket.error) as e:
+                    if (e.args[0] == errno.EINTR):
+                        continue
+                    raise
+
+                for sock in readable:
+                    if (sock is self.listener):
+                        self._accept()
+                    elif (sock is self._waker):
+                        self._drainWaker()
+                    elif (sock in self._connections):
+                        self._read(self._connections[sock])
+
+                for sock in writable:
+                    if (sock in self._connections):
+                        self._write(self._connections[sock])
+
+                # Streams whose socket is idle take their next part now;
+                # those whose broadcaster has stopped are finished
+                for c in list(self._connections.values()):
+                    if ((c.client is not None) and (c.pending() == False)):
+                        if (c.client.isClosed() == True):
+                            self._close(c)
+                        else:
+                            self._nextPart(c)
+        finally:
+            for c in list(self._connections.values()):
+                self._close(c)
+            self._shutdownRequest = False
+            self._isShutDown.set()
+
+    def shutdown(self):
+        # Stop serve_forever() (from another thread) and wait for it
+        self._shutdownRequest = True
+        self.wake()
+        self._isShutDown.wait()
+
+    def server_close(self):
+        self.listener.close()
+        self._waker.close()
+        self._wakeSender.close()
+
+    def _accept(self):
+        try:
+            (sock, address) = self.listener.accept()
+        except socket.error as e:
+            if (e.args[0] in WOULD_BLOCK):
+                return
+            raise
+        sock.setblocking(False)
+        self._connections[sock] = Connection(sock, address)
+
+    def _drainWaker(self):
+        self._woken = False
+        try:
+            while True:
+                self._waker.recv(64)
+        except socket.error:
+            pass
+
+    def _read(self, c):
+        try:
+            data = c.sock.recv(4096)
+        except socket.error as e:
+            if (e.args[0] in WOULD_BLOCK):
+                return
+            self._close(c)
+            return
+        if (data == b''):
+            # Client went away
+            self._close(c)
+            return
+        if ((c.request is None) or (c.client is not None)):
+            # Already answered; ignore anything else the client sends
+            return
+
+        c.request += data
+        if (b'\r\n\r\n' not in c.request):
+            if (len(c.request) > MAX_REQUEST):
+                self._close(c)
+            return
+
+        requestLine = c.request.split(b'\r\n', 1)[0].decode('ascii', 'replace')
+        c.request = None
+        self._handle(c, requestLine)
+
+    def _handle(self, c, requestLine):
+        self.requests.inc()
+        print(c.name + ' ' + requestLine)
+        words = requestLine.split()
+        if ((len(words) < 2) or (words[0] != 'GET')):
+            self._respond(c, '405 Method Not Allowed', 'text/plain', 'GET only\n')
+            return
+
+        path = words[1]
+        (target, body) = self._route(path)
+        if (target is None):
+            self._respond(c, '404 Not Found', 'text/plain', 'Not found\n')
+        elif (body is None):
+            # A stream; parts follow the multipart header until either end
+            # goes away
+            c.out = [memoryview(('HTTP/1.0 200 OK\r\n' +
+                                 'Content-type: multipart/x-mixed-replace; boundary=' + BOUNDARY + '\r\n' +
+                                 '\r\n').encode('ascii'))]
+            c.broadcaster = target
+            c.client = target.subscribe(c.name, self.wake)
+        else:
+            try:
+                page = body()
+            except Exception as e:
+                print("Page " + path + " failed: " + str(e))
+                self._respond(c, '500 Internal Server Error', 'text/plain', str(e) + '\n')
+                return
+            self._respond(c, '200 OK', target, page)
+
+    def _respond(self, c, status, contentType, page):
+        if (not isinstance(page, bytes)):
+            page = page.encode('utf-8')
+        header = ('HTTP/1.0 ' + status + '\r\n' +
+                  'Content-type: ' + contentType + '\r\n' +
+                  'Content-length: ' + str(len(page)) + '\r\n' +
+                  'Connection: close\r\n' +
+                  '\r\n').encode('ascii')
+        c.out = [memoryview(header), memoryview(page)]
+        c.closeWhenSent = True
+
+    def _write(self, c):
+        try:
+            if (HAVE_SENDMSG == True):
+                c.consume(c.sock.sendmsg(c.out))
+            else:
+                # One buffer at a time until the socket is full
+                while (c.pending() == True):
+                    first = c.out[0]
+                    sent = c.sock.send(first)
+                    c.consume(sent)
+                    if (sent < len(first)):
+                        break
+        except socket.error as e:
+            if (e.args[0] in WOULD_BLOCK):
+                return
+            self._close(c)
+            return
+        if (c.pending() == True):
+            return
+
+        if (c.part is not None):
+            if (c.part.trace is not None):
+                c.part.trace.markOnce('socket_write', c.part.lane)
+            self.writeTime.observeSince(c.partStart)
+            c.client.sent(c.part)
+            c.part = None
+        if (c.closeWhenSent == True):
+            self._close(c)
+
+    def _nextPart(self, c):
+        part = c.client.poll()
+        if (part is None):
+            return
+        c.part = part
+        c.partStart = frametrace.now()
+        c.out = list(part.buffers)
+        # Most parts go out in one write, without waiting for select()
+        self._write(c)
+
+    def _close(self, c):
+        if (c.client is not None):
+            c.broadcaster.unsubscribe(c.client)
+            c.client = None
+        self._connections.pop(c.sock, None)
+        try:
+            c.sock.close()
+        except socket.error:
+            pass
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+targetpairs
+
+Target verification for the two-piece targets: every pair of candidate
+rectangles is scored against the target geometry at once
+
+Both targets are two strips of retro tape, so GearLift and BoilerStack
+look for the pair of candidate rectangles that sits the way the two strips
+do. They used to walk the pairs in nested loops and take the FIRST pair
+inside the tolerance windows, so a cluttered frame cost O(n^2) Python work
+and the order of the contours decided which of two plausible pairs won.
+
+Here all pairs are built with NumPy indexing (the upper triangle of the
+n x n pair matrix), the same windows are applied to all of them together
+and each pair that passes is scored by how far it is from the ideal
+geometry, every deviation scaled by its tolerance so that 1 is the edge of
+the window. The result is a structured array (see PAIR) of the passing
+pairs, best (lowest score) first; equal scores keep the detection order.
+
+Candidates are rotated rectangles ((x,y),(w,h),angle) as the pipelines
+keep them, already normalized to upright.
+
+mergeGearFragments() does the same for the pieces of a gear lift strip
+split by the peg or spring: every pair of fragments in one column whose
+combined extent has the shape of a whole strip is a candidate merge, and
+the merges are made best strip first, each fragment used once, with array
+operations on the pair matrix instead of a bookkeeping list of matches.
+"""
+
+import numpy as np
+
+PAIR = np.dtype([('first', np.intp),       # index into the candidates
+                 ('second', np.intp),
+                 ('score', np.float64)])   # sum of squared scaled deviations
+
+# Gear lift: two 2" x 5" strips, 10.25" across the outer edges
+GEAR_SPACING = 4.125            # center spacing over tape width, (10.25 - 2.0) / 2.0
+GEAR_SPACING_TOLERANCE = 0.5    # 1" over the 2" baseline
+GEAR_LEVEL_TOLERANCE = 0.2      # center height difference over tape height, 1" out of 5"
+
+# Gear lift fragments: centers in line within 1" over the 5" strip, with
+# the combined extent a whole 2" x 5" strip
+FRAGMENT_ALIGNMENT = 0.2        # center offset over the sum of the heights
+FRAGMENT_RATIO = 0.4            # width over height of the merged strip
+FRAGMENT_RATIO_LOW = 0.25
+FRAGMENT_RATIO_HIGH = 0.45
+
+# Boiler: 4" strip over a 2" strip, centers 7" apart
+BOILER_HEIGHT_RATIO = 2.0       # top strip height over bottom strip height
+BOILER_HEIGHT_TOLERANCE = 0.2   # 10% either side
+BOILER_SPACING = 7.0            # center spacing in inches (heights sum to 6")
+BOILER_SPACING_TOLERANCE = 0.5
+BOILER_OFFSET_TOLERANCE_DEG = 5.0   # horizontal offset of the centers
+
+def rectArrays(rects):
+    # Centers and sizes of the rectangles as arrays (x, y, w, h)
+    values = np.array([(r[0][0], r[0][1], r[1][0], r[1][1]) for r in rects], np.float64)
+    return values.reshape(-1, 4).T
+
+def rankPairs(first, second, score, passed):
+    pairs = np.zeros(np.count_nonzero(passed), PAIR)
+    pairs['first'] = first[passed]
+    pairs['second'] = second[passed]
+    pairs['score'] = score[passed]
+    # A stable sort, so ties go to the earlier pair
+    return pairs[np.argsort(pairs['score'], kind='mergesort')]
+
+def gearPairs(detections):
+    # Pairs of strips on the same level at the right spacing for their
+    # width; first and second in detection order
+    (x, y, w, h) = rectArrays(detections)
+    (first, second) = np.triu_indices(len(x), 1)
+
+    # Using abs() since we don't care which detection is right or left
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spacing = np.abs(x[first] - x[second]) / ((w[first] + w[second]) / 2)
+        level = np.abs(y[first] - y[second]) / ((h[first] + h[second]) / 2)
+
+    passed = ((GEAR_SPACING - GEAR_SPACING_TOLERANCE <= spacing) &
+              (spacing <= GEAR_SPACING + GEAR_SPACING_TOLERANCE) &
+              (level <= GEAR_LEVEL_TOLERANCE))
+    score = (((spacing - GEAR_SPACING) / GEAR_SPACING_TOLERANCE) ** 2 +
+             (level / GEAR_LEVEL_TOLERANCE) ** 2)
+    return rankPairs(first, second, score, passed)
+
+def boilerPairs(detections, width, fov_deg):
+    # Pairs of a top strip twice the height of the bottom one, 7" above it
+    # and within a few degrees horizontally; first is the top strip (the
+    # one higher in the image) and second the bottom
+    (x, y, w, h) = rectArrays(detections)
+    (i, j) = np.triu_indices(len(x), 1)
+    upper = (y[i] < y[j])
+    top = np.where(upper, i, j)
+    bottom = np.where(upper, j, i)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heightRatio = h[top] / h[bottom]
+        inch = (h[top] + h[bottom]) / 6.0
+        spacing = np.abs(y[top] - y[bottom]) / inch
+    offset_deg = (np.abs(x[top] - x[bottom]) / width) * fov_deg
+
+    passed = ((BOILER_HEIGHT_RATIO - BOILER_HEIGHT_TOLERANCE <= heightRatio) &
+              (heightRatio <= BOILER_HEIGHT_RATIO + BOILER_HEIGHT_TOLERANCE) &
+              (BOILER_SPACING - BOILER_SPACING_TOLERANCE <= spacing) &
+              (spacing <= BOILER_SPACING + BOILER_SPACING_TOLERANCE) &
+              (offset_deg <= BOILER_OFFSET_TOLERANCE_DEG))
+    score = (((heightRatio - BOILER_HEIGHT_RATIO) / BOILER_HEIGHT_TOLERANCE) ** 2 +
+             ((spacing - BOILER_SPACING) / BOILER_SPACING_TOLERANCE) ** 2 +
+             (offset_deg / BOILER_OFFSET_TOLERANCE_DEG) ** 2)
+    return rankPairs(top, bottom, score, passed)
+
+def mergeGearFragments(fragments):
+    # Whole strips rebuilt from pairs of fragments, as rotated rectangles;
+    # each fragment is used at most once
+    (x, y, w, h) = rectArrays(fragments)
+    count = len(x)
+    if (count < 2):
+        return []
+    a = np.abs(np.array([f[2] for f in fragments], np.float64))
+    top = y - h / 2     # 0 is top of image
+    bottom = y + h / 2
+
+    # Every pair (i, j), both ways round, as n x n matrices
+    i = np.arange(count).reshape(-1, 1)
+    j = np.arange(count).reshape(1, -1)
+
+    # Height is composed of the upper and lower extents of the two pieces:
+    # from the top of the higher one to the bottom of the other
+    mergedH = np.where(top[i] < top[j], bottom[j] - top[i], bottom[i] - top[j])
+    mergedW = (w[i] + w[j]) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alignment = np.abs(x[j] - x[i]) / (h[i] + h[j])
+        ratio = mergedW / mergedH
+    merges = ((alignment < FRAGMENT_ALIGNMENT) &
+              (FRAGMENT_RATIO_LOW <= ratio) & (ratio <= FRAGMENT_RATIO_HIGH) &
+              (i != j))
+
+    # Each fragment pairs with the partner that makes the best strip; the
+    # pairs that choose each other are merged, taken out of the running
+    # and the rest choose again (a round per merge at most, usually one)
+    score = np.where(merges, np.abs(ratio - FRAGMENT_RATIO) + alignment, np.inf)
+    index = np.arange(count)
+    first = []
+    second = []
+    while True:
+        partner = np.argmin(score, axis=1)
+        mutual = np.flatnonzero(np.isfinite(score[index, partner]) &
+                                (partner[partner] == index) &
+                                (index < partner))
+        if (len(mutual) == 0):
+            break
+        first.append(mutual)
+        second.append(partner[mutual])
+        used = np.concatenate((mutual, partner[mutual]))
+        score[used,:] = np.inf
+        score[:,used] = np.inf
+    if (len(first) == 0):
+        return []
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+
+    mergedX = (x[first] + x[second]) / 2
+    mergedY = (y[first] + y[second]) / 2
+    mergedA = (a[first] + a[second]) / 2
+    return list(zip(zip(mergedX, mergedY),
+                    zip(mergedW[first, second], mergedH[first, second]),
+                    mergedA))
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+targettracker
+
+Kalman filtered target state, predicted forward to the time it is used
+
+A pipeline measures the target in a frame that was grabbed some time ago
+(tens of milliseconds at 15 fps, more when processing is slow) and each
+measurement on its own is noisy, so a heading taken straight from the last
+frame is both stale and jumpy. TargetTracker filters the angle and the
+distance of the target over time, each as a position and rate with a
+constant velocity Kalman filter:
+
+    * update() takes a measurement with the time its frame was GRABBED
+      (frametrace.captureTime()), not the time it was processed, so the
+      rates are right however long processing took
+    * predict() moves the state forward to any later time, typically now
+      as the state is published, and grows its uncertainty accordingly
+
+publish() writes the predicted state to NetworkTables as
+<prefix>Track<name> values (see below) along with the standard deviation
+of each value, the square root of the diagonal of the covariance, so the
+robot can tell a fresh lock from one coasting on old data.
+
+A measurement more than GATE standard deviations off the prediction is
+taken to be a different target and restarts the filter; so does a gap of
+more than timeout seconds without measurements, after which the track is
+dropped (<prefix>TrackValid is 0).
+"""
+
+import math
+
+# Innovation (measurement minus prediction) beyond this many standard
+# deviations restarts the filter rather than pulling the track across
+GATE = 4.0
+
+class ConstantVelocity:
+    """
+    One dimensional position and rate, driven by white noise acceleration
+    """
+    def __init__(self, accelerationNoise, measurementNoise, initialRateNoise):
+        self.q = accelerationNoise ** 2         # acceleration spectral density
+        self.r = measurementNoise ** 2          # measurement variance
+        self.initialRateVariance = initialRateNoise ** 2
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.x = 0.0
+        self.v = 0.0
+        self.pxx = 0.0
+        self.pxv = 0.0
+        self.pvv = 0.0
+
+    def isValid(self):
+        return (self.t is not None)
+
+    def predict(self, t):
+        # (position, rate, position variance, covariance, rate variance) at
+        # time t; the filter itself is not changed
+        dt = t - self.t
+        q = self.q
+        x = self.x + dt * self.v
+        pxx = self.pxx + dt * (2.0 * self.pxv + dt * self.pvv) + q * dt ** 3 / 3.0
+        pxv = self.pxv + dt * self.pvv + q * dt ** 2 / 2.0
+        pvv = self.pvv + q * dt
+        return (x, self.v, pxx, pxv, pvv)
+
+    def update(self, t, z):
+        # Measurement z of the position at time t
+        if ((self.t is None) or (t < self.t)):
+            self.start(t, z)
+            return
+
+        (x, v, pxx, pxv, pvv) = self.predict(t)
+        s = pxx + self.r
+        innovation = z - x
+        if (innovation * innovation > GATE * GATE * s):
+            self.start(t, z)
+            return
+
+        kx = pxx / s
+        kv = pxv / s
+        self.t = t
+        self.x = x + kx * innovation
+        self.v = v + kv * innovation
+        self.pxx = (1.0 - kx) * pxx
+        self.pxv = (1.0 - kx) * pxv
+        self.pvv = pvv - kv * pxv
+
+    def start(self, t, z):
+        self.t = t
+        self.x = z
+        self.v = 0.0
+        self.pxx = self.r
+        self.pxv = 0.0
+        self.pvv = self.initialRateVariance
+
+class TargetTracker:
+    def __init__(self, timeout=0.5,
+                 angleNoise=0.5, angleAcceleration=20.0, angleRate=30.0,
+                 distanceNoise=2.0, distanceAcceleration=100.0, distanceRate=60.0):
+        # Noise figures are standard deviations: of a measurement, of the
+        # acceleration (per second squared) and of the rate when a track
+        # starts (per second); angles in degrees, distances in inches
+        self.timeout = timeout
+        self.angle = ConstantVelocity(angleAcceleration, angleNoise, angleRate)
+        self.distance = ConstantVelocity(distanceAcceleration, distanceNoise, distanceRate)
+        self.lastUpdate = None
+
+    def update(self, t, angle_deg, distance_inches=float('NaN')):
+        # Target measured in the frame grabbed at time t; NaN for anything
+        # that was not measured
+        self.expire(t)
+        if (angle_deg == angle_deg):
+            self.angle.update(t, angle_deg)
+        if (distance_inches == distance_inches):
+            self.distance.update(t, distance_inches)
+        self.lastUpdate = t
+
+    def expire(self, t):
+        # Drop the track if nothing has been measured for too long
+        if ((self.lastUpdate is not None) and (t - self.lastUpdate > self.timeout)):
+            self.reset()
+
+    def reset(self):
+        self.angle.reset()
+        self.distance.reset()
+        self.lastUpdate = None
+
+    def isValid(self):
+        return self.angle.isValid()
+
+    def predict(self, t):
+        # (angle, angle rate, angle sigma, distance, distance rate, distance
+        # sigma) at time t, NaN where there is no track
+        nan = float('NaN')
+        angle = (nan, nan, nan)
+        distance = (nan, nan, nan)
+        if (self.angle.isValid() == True):
+            (x, v, pxx, pxv, pvv) = self.angle.predict(t)
+            angle = (x, v, math.sqrt(pxx))
+        if (self.distance.isValid() == True):
+            (x, v, pxx, pxv, pvv) = self.distance.predict(t)
+            distance = (x, v, math.sqrt(pxx))
+        return angle + distance
+
+    def publish(self, networkTable, prefix, t):
+        # The state predicted to time t as
+        #   <prefix>TrackValid                  1 while there is a track, else 0
+        #   <prefix>TrackCenter_deg             angle, as <prefix>Center_deg
+        #   <prefix>TrackCenterRate_degps
+        #   <prefix>TrackCenterSigma_deg
+        #   <prefix>TrackDistance_inches        as <prefix>Distance_inches
+        #   <prefix>TrackDistanceRate_inps
+        #   <prefix>TrackDistanceSigma_inches
+        #   <prefix>TrackAge_s                  since the frame last measured
+        self.expire(t)
+        state = self.predict(t)
+        age = float('NaN')
+        if (self.lastUpdate is not None):
+            age = t - self.lastUpdate
+        networkTable.putNumber(prefix + "TrackValid", 1.0 if self.isValid() else 0.0)
+        networkTable.putNumber(prefix + "TrackCenter_deg", state[0])
+        networkTable.putNumber(prefix + "TrackCenterRate_degps", state[1])
+        networkTable.putNumber(prefix + "TrackCenterSigma_deg", state[2])
+        networkTable.putNumber(prefix + "TrackDistance_inches", state[3])
+        networkTable.putNumber(prefix + "TrackDistanceRate_inps", state[4])
+        networkTable.putNumber(prefix + "TrackDistanceSigma_inches", state[5])
+        networkTable.putNumber(prefix + "TrackAge_s", age)
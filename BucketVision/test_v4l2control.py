@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+test_v4l2control
+
+Checks the ioctls V4L2Control issues, against a fake device; no camera
+needed. Run with
+
+    python -m unittest test_v4l2control
+"""
+
+import struct
+import unittest
+
+from v4l2control import CameraProfile
+from v4l2control import V4L2Control
+from v4l2control import V4L2_CID_BRIGHTNESS
+from v4l2control import V4L2_CID_EXPOSURE_ABSOLUTE
+from v4l2control import V4L2_CID_EXPOSURE_AUTO
+from v4l2control import V4L2_CONTROL_FORMAT
+from v4l2control import V4L2_EXPOSURE_APERTURE_PRIORITY
+from v4l2control import V4L2_EXPOSURE_MANUAL
+from v4l2control import VIDIOC_S_CTRL
+
+class FakeDevice:
+    def __init__(self):
+        self.calls = []     # (fd, request, cid, value) in the order issued
+
+    def open(self, path):
+        self.path = path
+        return 42
+
+    def ioctl(self, fd, request, arg):
+        (cid, value) = struct.unpack(V4L2_CONTROL_FORMAT, arg)
+        self.calls.append((fd, request, cid, value))
+        return arg
+
+class V4L2ControlTest(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeDevice()
+        self.control = V4L2Control(0, ioctl=self.device.ioctl, opener=self.device.open)
+
+    def test_apply(self):
+        written = self.control.apply(CameraProfile('gearLift', exposure=10, brightness=50))
+        self.assertEqual(self.device.path, '/dev/video0')
+        self.assertEqual(written, 3)
+        self.assertEqual(self.device.calls,
+                         [(42, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_MANUAL),
+                          (42, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_ABSOLUTE, 10),
+                          (42, VIDIOC_S_CTRL, V4L2_CID_BRIGHTNESS, 50)])
+
+    def test_reapply(self):
+        profile = CameraProfile('gearLift', exposure=10, brightness=50)
+        self.control.apply(profile)
+        self.device.calls = []
+        written = self.control.apply(profile)
+        self.assertEqual(written, 0)
+        self.assertEqual(self.device.calls, [])
+        self.assertEqual(self.control.skips, 3)
+
+    def test_auto_to_manual(self):
+        self.control.apply(CameraProfile('normal', exposure=-1))
+        self.assertEqual(self.device.calls,
+                         [(42, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_APERTURE_PRIORITY)])
+        self.device.calls = []
+        written = self.control.apply(CameraProfile('gearLift', exposure=20))
+        self.assertEqual(written, 2)
+        self.assertEqual(self.device.calls,
+                         [(42, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_MANUAL),
+                          (42, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_ABSOLUTE, 20)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+threshold
+
+Color thresholding for the GRIP pipelines without the HLS intermediate image
+
+The GRIP generated threshold steps convert every frame with cv2.cvtColor()
+and then run cv2.inRange() on the result. An HLS box threshold is a fixed
+function of the BGR value of each pixel, so HslThreshold evaluates it once
+for every possible color, keeps the answers as a bit-packed lookup table and
+from then on produces the mask in a single lookup per pixel:
+
+    * the frame is widened to BGRA (a byte shuffle, no arithmetic) so each
+      pixel reads as one little endian 32 bit word, r<<16 | g<<8 | b
+    * the top bits select a byte of the table and the low 3 bits a bit of it
+
+With bits=8 the table is exact (2**24 colors, 2 MB packed) and takes a
+fraction of a second to build; with fewer bits per channel the colors are
+quantized and the table is 8**(8 - bits) times smaller and quicker to
+build, but pixels near the edges of the box can come out differently (see
+benchthreshold.py for how much on our images).
+
+The table is built when the threshold is created and rebuilt (lazily, on
+the next apply()) only when the bounds passed in change, e.g., when tuned
+at runtime. Pipelines with the same bounds share a table.
+
+Whether the table pays depends on the OpenCV build: the table lookup is a
+random read per pixel from 2 MB, while a vectorized cvtColor() is very
+fast. On a desktop x86 build (OpenCV 4 and later) the two step conversion
+still wins, about 0.28 vs 0.39 ms per 320x240 frame, so USE_LUT is off and
+HslThreshold then runs the GRIP steps into reused buffers. Turn it on
+where benchthreshold.py shows the table is faster (e.g., the Pi).
+
+An RGB box threshold needs no table at all: it is the same box in BGR
+order, so RgbThreshold is a single inRange() on the frame as it comes.
+
+The mask returned by apply() is 0 or 255 like inRange() and is reused by
+the next apply() on the same threshold.
+"""
+
+import cv2
+import numpy as np
+
+from threading import Lock
+
+# Use the lookup tables for HSL thresholds (see above)
+USE_LUT = False
+
+# Tables by (bits, bounds), shared by every threshold using them
+_tables = {}
+_tablesLock = Lock()
+
+def _buildHlsTable(bits, key):
+    # Evaluate the HLS box for every (quantized) BGR color with the same
+    # cvtColor and inRange as the GRIP code, then pack the answers 8 per byte
+    (lower, upper) = key
+    if (bits == 8):
+        # Every 24 bit color laid out as little endian BGRA words, i.e.,
+        # color index r<<16 | g<<8 | b (alpha is ignored by the conversion),
+        # a slab of 16 reds at a time to keep the memory needed down
+        slabs = []
+        for red in range(0, 256, 16):
+            colors = np.arange(red << 16, (red + 16) << 16, dtype='<u4').view(np.uint8).reshape(1024, 1024, 4)
+            slabs.append(_packHls(colors, lower, upper))
+        return np.concatenate(slabs)
+
+    levels = 1 << bits
+    step = 256 >> bits
+    index = np.arange(1 << (3 * bits), dtype=np.uint32)
+    colors = np.empty((len(index), 1, 3), np.uint8)
+    # Middle of each quantization step
+    colors[:,0,0] = (index & (levels - 1)) * step + step // 2
+    colors[:,0,1] = ((index >> bits) & (levels - 1)) * step + step // 2
+    colors[:,0,2] = (index >> (2 * bits)) * step + step // 2
+    return _packHls(colors, lower, upper)
+
+def _packHls(colors, lower, upper):
+    hls = cv2.cvtColor(colors, cv2.COLOR_BGR2HLS)
+    mask = cv2.inRange(hls, lower, upper)
+    # packbits puts the first of each 8 in the most significant bit
+    return np.packbits(mask.reshape(-1) > 0)
+
+def hlsTable(bits, key):
+    _tablesLock.acquire()
+    try:
+        table = _tables.get((bits, key))
+        if (table is None):
+            table = _buildHlsTable(bits, key)
+            _tables[(bits, key)] = table
+        return table
+    finally:
+        _tablesLock.release()
+
+def hlsKey(hue, sat, lum):
+    # inRange bounds in HLS channel order, as GRIP passes them
+    return ((hue[0], lum[0], sat[0]), (hue[1], lum[1], sat[1]))
+
+class HslThreshold:
+    def __init__(self, hue, sat, lum, bits=8, lut=None):
+        if (lut is None):
+            lut = USE_LUT
+        self.lut = lut
+        self.bits = bits
+        self.key = hlsKey(hue, sat, lum)
+        self.table = None
+        if (self.lut == True):
+            self.table = hlsTable(bits, self.key)
+        self.shape = None
+
+    def apply(self, input, hue, sat, lum):
+        # Mask of the BGR input with hue, sat and lum in range, as
+        # cv2.inRange(cv2.cvtColor(input, cv2.COLOR_BGR2HLS), ...)
+        key = hlsKey(hue, sat, lum)
+        if (input.shape[:2] != self.shape):
+            self._allocate(input.shape[:2])
+
+        if (self.lut == False):
+            cv2.cvtColor(input, cv2.COLOR_BGR2HLS, self._hls)
+            return cv2.inRange(self._hls, key[0], key[1], self._mask)
+
+        if (key != self.key):
+            self.key = key
+            self.table = hlsTable(self.bits, key)
+
+        cv2.cvtColor(input, cv2.COLOR_BGR2BGRA, self._bgra)
+        words = self._bgra.view('<u4')[:,:,0]
+        index = self._index
+        if (self.bits == 8):
+            np.bitwise_and(words, 0xFFFFFF, out=index)
+        else:
+            # Compact the top bits of each channel into the table index
+            shift = 8 - self.bits
+            mask = (1 << self.bits) - 1
+            np.right_shift(words, shift, out=index)
+            np.bitwise_and(index, mask, out=index)
+            np.right_shift(words, 8 + shift, out=self._part)
+            np.bitwise_and(self._part, mask, out=self._part)
+            np.left_shift(self._part, self.bits, out=self._part)
+            np.bitwise_or(index, self._part, out=index)
+            np.right_shift(words, 16 + shift, out=self._part)
+            np.bitwise_and(self._part, mask, out=self._part)
+            np.left_shift(self._part, 2 * self.bits, out=self._part)
+            np.bitwise_or(index, self._part, out=index)
+
+        # Bit (index & 7) of byte (index >> 3), most significant first;
+        # shift it up to the sign bit and spread it over the byte
+        np.bitwise_and(index, 7, out=self._part)
+        np.copyto(self._bit, self._part, casting='unsafe')
+        np.right_shift(index, 3, out=index)
+        np.take(self.table, index, out=self._mask)
+        np.left_shift(self._mask, self._bit, out=self._mask)
+        signed = self._mask.view(np.int8)
+        np.right_shift(signed, 7, out=signed)
+        return self._mask
+
+    def _allocate(self, shape):
+        self.shape = shape
+        self._hls = np.empty(shape + (3,), np.uint8)
+        self._bgra = np.empty(shape + (4,), np.uint8)
+        self._index = np.empty(shape, np.uint32)
+        self._part = np.empty(shape, np.uint32)
+        self._bit = np.empty(shape, np.uint8)
+        self._mask = np.empty(shape, np.uint8)
+
+class RgbThreshold:
+    def apply(self, input, red, green, blue):
+        # Mask of the BGR input with red, green and blue in range, as
+        # cv2.inRange(cv2.cvtColor(input, cv2.COLOR_BGR2RGB), ...)
+        return cv2.inRange(input, (blue[0], green[0], red[0]), (blue[1], green[1], red[1]))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+v4l2control
+
+In-process V4L2 camera control (Linux)
+
+Replaces shelling out to v4l2-ctl for every exposure change by issuing the
+VIDIOC_G_CTRL/VIDIOC_S_CTRL ioctls on the video device directly. The last
+value written to (or read from) each control is cached so that re-applying
+the same setting costs nothing, and a CameraProfile groups the settings for
+a mode (exposure, brightness, contrast, saturation) so they are applied
+together in a single call.
+
+The ioctl and open functions are injectable so the control logic can be
+exercised against a fake device without a camera attached, e.g.,
+
+    control = V4L2Control(0, ioctl=fake.ioctl, opener=fake.open)
+"""
+
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows; use the OpenCV properties instead
+
+# From linux/videodev2.h
+#   struct v4l2_control { __u32 id; __s32 value; };
+#   #define VIDIOC_G_CTRL _IOWR('V', 27, struct v4l2_control)
+#   #define VIDIOC_S_CTRL _IOWR('V', 28, struct v4l2_control)
+V4L2_CONTROL_FORMAT = 'Ii'
+VIDIOC_G_CTRL = 0xC008561B
+VIDIOC_S_CTRL = 0xC008561C
+
+V4L2_CID_BASE = 0x00980900
+V4L2_CID_BRIGHTNESS = V4L2_CID_BASE + 0
+V4L2_CID_CONTRAST = V4L2_CID_BASE + 1
+V4L2_CID_SATURATION = V4L2_CID_BASE + 2
+
+V4L2_CID_CAMERA_CLASS_BASE = 0x009A0900
+V4L2_CID_EXPOSURE_AUTO = V4L2_CID_CAMERA_CLASS_BASE + 1
+V4L2_CID_EXPOSURE_ABSOLUTE = V4L2_CID_CAMERA_CLASS_BASE + 2
+
+V4L2_EXPOSURE_MANUAL = 1
+V4L2_EXPOSURE_APERTURE_PRIORITY = 3
+
+# Names as used by v4l2-ctl -c name=value
+CONTROLS = {'brightness' : V4L2_CID_BRIGHTNESS,
+            'contrast' : V4L2_CID_CONTRAST,
+            'saturation' : V4L2_CID_SATURATION,
+            'exposure_auto' : V4L2_CID_EXPOSURE_AUTO,
+            'exposure_absolute' : V4L2_CID_EXPOSURE_ABSOLUTE}
+
+def devicePath(src):
+    # Map an OpenCV style camera index to its device node
+    if (isinstance(src, int)):
+        return '/dev/video' + str(src)
+    return src
+
+def defaultOpener(path):
+    return os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+class CameraProfile:
+    """
+    A named set of camera settings applied as one batch
+
+    Any setting left as None is not touched. A negative exposure selects
+    the camera's automatic exposure (the "camera default"), otherwise the
+    exposure is set manually to the given absolute value.
+    """
+    def __init__(self, name, exposure=None, brightness=None, contrast=None, saturation=None):
+        self.name = name
+        self.exposure = exposure
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+
+    def controls(self):
+        # Ordered (id, value) pairs; exposure_auto must be written before
+        # exposure_absolute or the driver will reject the absolute value
+        result = []
+        if (self.exposure is not None):
+            if (self.exposure < 0):
+                result.append((V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_APERTURE_PRIORITY))
+            else:
+                result.append((V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_MANUAL))
+                result.append((V4L2_CID_EXPOSURE_ABSOLUTE, int(self.exposure)))
+        if (self.brightness is not None):
+            result.append((V4L2_CID_BRIGHTNESS, int(self.brightness)))
+        if (self.contrast is not None):
+            result.append((V4L2_CID_CONTRAST, int(self.contrast)))
+        if (self.saturation is not None):
+            result.append((V4L2_CID_SATURATION, int(self.saturation)))
+        return result
+
+    def withExposure(self, exposure):
+        # The same profile (and name, so frames still match it) with only
+        # the exposure changed
+        return CameraProfile(self.name, exposure, self.brightness, self.contrast, self.saturation)
+
+    def __repr__(self):
+        return "CameraProfile(" + self.name + ")"
+
+class V4L2Control:
+    def __init__(self, src, ioctl=None, opener=None):
+        if (ioctl is None):
+            if (fcntl is None):
+                raise OSError("V4L2 controls are not available on this platform")
+            ioctl = fcntl.ioctl
+        # Only close descriptors we opened ourselves
+        self._owned = (opener is None)
+        if (opener is None):
+            opener = defaultOpener
+
+        self.path = devicePath(src)
+        self._ioctl = ioctl
+        self._fd = opener(self.path)
+        self._cache = {}
+        self.writes = 0
+        self.skips = 0
+
+    def get(self, cid, cached=True):
+        if ((cached == True) and (cid in self._cache)):
+            return self._cache[cid]
+        result = self._ioctl(self._fd, VIDIOC_G_CTRL, struct.pack(V4L2_CONTROL_FORMAT, cid, 0))
+        (rid, value) = struct.unpack(V4L2_CONTROL_FORMAT, result)
+        self._cache[cid] = value
+        return value
+
+    def set(self, cid, value):
+        # Returns True if the device was written, False if already set
+        value = int(value)
+        if (self._cache.get(cid) == value):
+            self.skips += 1
+            return False
+        try:
+            self._ioctl(self._fd, VIDIOC_S_CTRL, struct.pack(V4L2_CONTROL_FORMAT, cid, value))
+        except (IOError, OSError):
+            # We no longer know what the device holds
+            self._cache.pop(cid, None)
+            raise
+        self._cache[cid] = value
+        self.writes += 1
+        return True
+
+    def setNamed(self, name, value):
+        return self.set(CONTROLS[name], value)
+
+    def getNamed(self, name, cached=True):
+        return self.get(CONTROLS[name], cached)
+
+    def apply(self, profile):
+        # Apply every setting in the profile; returns the number of
+        # controls actually written to the device
+        written = 0
+        for (cid, value) in profile.controls():
+            if (self.set(cid, value) == True):
+                written += 1
+        return written
+
+    def invalidate(self):
+        # Forget cached values (e.g., after another process touched the camera)
+        self._cache = {}
+
+    def close(self):
+        if ((self._fd is not None) and (self._owned == True)):
+            os.close(self._fd)
+        self._fd = None